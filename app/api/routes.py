@@ -1,22 +1,181 @@
 # API routes for the application
-# Handles the /generate-dataset endpoint with streaming, async calls
+# Handles the /generate-dataset endpoint with streaming, async calls, and /jobs for large datasets
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import StreamingResponse
-from app.services.schema_extractor import extract_schema
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import ValidationError
+from app.services.schema_extractor import describe_profile, extract_file_schema, extract_schema, prompt_type_hints, read_sample
 from app.services.embedding_service import create_embedding
-from app.services.pinecone_service import upsert_to_pinecone, query_pinecone
-from app.services.llm_generator import hybrid_generate_synthetic_data_stream, anonymize_data
-from app.models.schemas import GenerationRequest  # For Pydantic validation
-from app.utils.logger import logger
-import bleach  # For input sanitization
+from app.services.pinecone_service import query_pinecone
+from app.services.llm_generator import hybrid_generate_synthetic_data_stream
+from app.services.validation_plan import compile_plan
+from app.services.serializer import SERIALIZERS, BatchSerializer, encode_stream, get_serializer, negotiate_encoding, stream_serialized
+from app.services.response_cache import RESPONSE_CACHE_RESULTS, read_gzip, response_key, write_through
+from app.services.admission import ADMISSION_RESULTS, estimate_llm_tokens, llm_budget
+from app.services.stat_engine import fit_sample
+from app.services.job_manager import JOB_FORMATS, Job, parse_range, read_range
+from app.models.schemas import GenerationRequest, JobStatus  # For Pydantic validation
+from app.utils.config import Config
+from app.utils.logger import log_payload, logger
+from app.utils.metrics import ROWS_TOTAL, stage, track_stream
 import hashlib  # For cache key hashing
-from typing import AsyncGenerator, Optional
-import json
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Tuple
+import asyncio
+import math
+import os
+import time
 
-from app.utils.limiter import limiter
+from app.utils.limiter import client_address, limiter
 
 router = APIRouter()
 
+def validate_inputs(prompt: Optional[str], file: Optional[UploadFile], num_rows: int, format: str, seed: Optional[int] = None) -> Optional[str]:
+    """
+    Validates form inputs and returns the sanitized prompt.
+    """
+    try:
+        # Pydantic validation (via GenerationRequest, but since Form, manual)
+        GenerationRequest(prompt=prompt, num_rows=num_rows, format=format, seed=seed)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors()[0]["msg"])
+
+    if not prompt and not file:
+        raise HTTPException(status_code=400, detail="Provide either prompt or file.")
+    if format not in SERIALIZERS:
+        raise HTTPException(status_code=400, detail=f"Format '{format}' is not available on this server (pyarrow not installed).")
+
+    # Log inputs for debugging (payloads at PAYLOAD_LOG_LEVEL)
+    log_payload("Received prompt: %s", prompt)
+    logger.info(f"Num rows: {num_rows}, Format: {format}, Seed: {seed}, File: {file.filename if file else 'None'}")
+
+    # Sanitize prompt if provided
+    if prompt:
+        import bleach  # For input sanitization (loaded on first use; preloaded by the startup warm-up)
+        prompt = bleach.clean(prompt)  # Prevent injection
+        log_payload("Sanitized prompt: %s", prompt)
+        if len(prompt) > 2000:
+            raise HTTPException(status_code=400, detail="Prompt too long (max 2000 characters).")
+    return prompt
+
+async def resolve_schema(prompt: Optional[str], file: Optional[UploadFile]) -> Tuple[str, str, dict, List[List[str]]]:
+    """
+    Extracts (schema, description, column profile, sample rows) from the uploaded file or the prompt.
+    - Uploads are read only up to UPLOAD_SAMPLE_BYTES (header + sample rows); larger files than
+      MAX_UPLOAD_BYTES are rejected.
+    - For prompts, the profile holds only the 'field: type' hints; sample rows are empty.
+    """
+    if file and file.size is not None and file.size > Config.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large (max {Config.MAX_UPLOAD_BYTES} bytes).")
+    sample = None
+    try:
+        with stage("schema_extraction"):
+            if file:
+                sample = await read_sample(file, Config.UPLOAD_SAMPLE_BYTES)
+                log_payload("File sample: %s...", sample[:500])  # Log first 500 chars for brevity
+                schema, description, profile, rows = extract_file_schema(sample, Config.UPLOAD_SAMPLE_ROWS)
+            else:
+                schema, description = extract_schema(prompt, is_file=False)
+                profile = {col: {"type": hint} for col, hint in prompt_type_hints(prompt).items()}
+                rows = []
+        log_payload("Extracted schema: %s, Description: %s", schema, description)
+        return schema, description, profile, rows
+    except Exception as schema_error:
+        logger.error(f"Schema extraction error: {str(schema_error)}")
+        log_payload("Input causing error: %s", prompt if prompt else (sample or '')[:500])
+        raise HTTPException(status_code=400, detail=f"Invalid prompt format: {str(schema_error)}")
+
+async def similar_context(request: Request, schema: str, description: str, profile: dict) -> Tuple[List[str], dict, str, str]:
+    """
+    Registers the schema in the vector index and retrieves similar dataset descriptions.
+    - Value ranges from an uploaded sample's profile are added to the LLM context.
+    - Returns (columns, metadata, context, dataset_id).
+    """
+    schema_text = f"{schema} - {description}"
+    dataset_id = f"dataset_{hashlib.sha256(schema_text.encode()).hexdigest()}"
+    writer = request.app.state.pinecone_writer
+
+    # Metadata for Pinecone (no raw data stored)
+    metadata = {
+        "domain": "general",  # Infer or from prompt (TODO: improve inference)
+        "columns": schema.split(", "),
+        "description": description,
+        "privacy": "public"
+    }
+
+    if writer.is_known(dataset_id):
+        # Already upserted: only the query embedding is needed
+        query_embedding = await create_embedding(schema_text, task_type="RETRIEVAL_QUERY")
+    else:
+        # Create document and query embeddings concurrently (cached; identical calls collapse into one)
+        embedding, query_embedding = await asyncio.gather(
+            create_embedding(schema_text, task_type="RETRIEVAL_DOCUMENT"),
+            create_embedding(schema_text, task_type="RETRIEVAL_QUERY")
+        )
+        # Write-behind upsert: batched and flushed off the request path
+        writer.add(dataset_id, embedding, metadata)
+
+    # Async query Pinecone for similar contexts
+    similar_results = await query_pinecone(request.app.state.index, query_embedding, top_k=3)
+    context = "\n".join([res['metadata'].get('description', '') for res in similar_results.get('matches', [])])
+    profile_hints = describe_profile(profile)
+    if profile_hints:
+        context = f"{context}\n{profile_hints}" if context else profile_hints
+    return schema.split(", "), metadata, context, dataset_id
+
+async def admit(request: Request, columns: List[str], num_rows: int, type_hints: dict, shed: bool = True) -> int:
+    """
+    Admission control by estimated cost; returns the request's estimated LLM tokens.
+    - Requests needing the LLM are shed (503) while the worker's LLM queue is over LLM_QUEUE_MAX_TOKENS
+      (shed=False for queued jobs, which wait instead).
+    - The client's token bucket is charged ADMISSION_BASE_COST plus the LLM estimate (at most a full bucket);
+      an empty bucket answers 429 with Retry-After.
+    """
+    tokens = estimate_llm_tokens(num_rows, columns, type_hints)
+    if shed and tokens and llm_budget.saturated:
+        ADMISSION_RESULTS.inc(result="shed")
+        logger.warning(f"Shedding request: {llm_budget.queued} LLM tokens queued")
+        raise HTTPException(status_code=503, detail="LLM capacity exhausted, retry later.", headers={"Retry-After": "5"})
+    buckets = request.app.state.admission
+    if buckets is not None:
+        cost = min(tokens + Config.ADMISSION_BASE_COST, buckets.capacity)
+        wait = await run_in_threadpool(buckets.acquire, client_address(request), cost)
+        if wait > 0:
+            ADMISSION_RESULTS.inc(result="throttled")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Request cost ({cost} estimated tokens) exceeds the remaining budget, retry later.",
+                headers={"Retry-After": str(math.ceil(wait)) if math.isfinite(wait) else "60"}
+            )
+    ADMISSION_RESULTS.inc(result="admitted")
+    return tokens
+
+def cached_response(path: str, encoding: str, serializer: BatchSerializer, accept_encoding: str, headers: dict):
+    """
+    Serves a cached response body from disk.
+    - Bodies stored as is, and gzip bodies for clients accepting gzip, are sent as files (sendfile where the server supports it).
+    - Other clients get the gzip body decompressed and re-encoded as negotiated.
+    """
+    headers["X-Cache"] = "HIT"
+    if encoding == 'identity':
+        return FileResponse(path, media_type=serializer.media_type, headers=headers)
+    if Config.STREAM_COMPRESSION in ('auto', 'gzip') and negotiate_encoding(accept_encoding, 'gzip') is not None:
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(path, media_type=serializer.media_type, headers=headers)
+    encoder = negotiate_encoding(accept_encoding, Config.STREAM_COMPRESSION)
+    if encoder is not None:
+        headers["Content-Encoding"] = encoder.name
+    return StreamingResponse(encode_stream(read_gzip(path), encoder), media_type=serializer.media_type, headers=headers)
+
+def shared_response(shared: AsyncIterator[bytes], serializer: BatchSerializer, accept_encoding: str, headers: dict, start: float) -> StreamingResponse:
+    """
+    Streams a subscription to a shared generation, compressed per request as negotiated.
+    """
+    encoder = negotiate_encoding(accept_encoding, Config.STREAM_COMPRESSION) if serializer.compressible else None
+    if encoder is not None:
+        headers["Content-Encoding"] = encoder.name
+    body = track_stream(encode_stream(shared, encoder), start, "generate_dataset")
+    return StreamingResponse(body, media_type=serializer.media_type, headers=headers)
+
 @router.post("/generate-dataset")
 @limiter.limit("20/minute;5/10second")
 async def generate_dataset(
@@ -24,97 +183,194 @@ async def generate_dataset(
     prompt: str = Form(None),
     file: Optional[UploadFile] = File(None),
     num_rows: int = Form(1000),
-    format: str = Form("csv")  # csv or json (streams as NDJSON)
+    format: str = Form("csv"),  # csv, json (streams as NDJSON), parquet or arrow (IPC stream)
+    seed: Optional[int] = Form(None)  # Reproducible local columns; identical seeded requests are shared and cached
 ) -> StreamingResponse:
     """
     Endpoint to generate synthetic dataset.
     - Validates inputs with Pydantic.
     - Sanitizes prompt.
-    - Streams data in batches without storage.
+    - Streams data in batches without storage (up to MAX_STREAM_ROWS; larger requests go through /jobs).
+    - Seeded requests: identical requests in flight share one generation, and completed responses
+      are served from the disk response cache (X-Cache: HIT).
     - Uses async for external calls.
     """
     try:
-        # Pydantic validation (via GenerationRequest, but since Form, manual)
-        GenerationRequest(prompt=prompt, num_rows=num_rows, format=format)  # Raises if invalid
+        prompt = validate_inputs(prompt, file, num_rows, format, seed)
+        if num_rows > Config.MAX_STREAM_ROWS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"num_rows above {Config.MAX_STREAM_ROWS} must be generated as a job (POST /api/jobs)."
+            )
 
-        if not prompt and not file:
-            raise HTTPException(status_code=400, detail="Provide either prompt or file.")
+        # Extract schema and description, then look up similar datasets for LLM context
+        schema, description, profile, sample_rows = await resolve_schema(prompt, file)
+        type_hints = {col: column["type"] for col, column in profile.items()}
+        serializer = get_serializer(format, schema.split(", "), type_hints)
+        accept_encoding = request.headers.get("accept-encoding", "")
+        headers = {"Content-Disposition": f"attachment; filename=dataset.{serializer.extension}", "Vary": "Accept-Encoding"}
+        start = getattr(request.state, "start", time.perf_counter())
 
-        # Log inputs for debugging
-        logger.info(f"Received prompt: {prompt}")
-        logger.info(f"Num rows: {num_rows}, Format: {format}, File: {file.filename if file else 'None'}")
+        # Seeded requests: serve a cached body, or join an identical generation already in flight
+        cache = request.app.state.response_cache
+        coalescer = request.app.state.coalescer
+        key = None
+        if seed is not None and cache is not None:
+            key = response_key(schema.split(", "), num_rows, format, seed, sample_rows, type_hints)
+            cached = await cache.get(key)
+            if cached is not None:
+                RESPONSE_CACHE_RESULTS.inc(result="hit")
+                return cached_response(*cached, serializer, accept_encoding, headers)
+            shared = coalescer.join(key)
+            if shared is not None:
+                RESPONSE_CACHE_RESULTS.inc(result="coalesced")
+                return shared_response(shared, serializer, accept_encoding, headers, start)
 
-        # Sanitize prompt if provided
-        if prompt:
-            prompt = bleach.clean(prompt)  # Prevent injection
-            logger.info(f"Sanitized prompt: {prompt}")
-            if len(prompt) > 2000:
-                raise HTTPException(status_code=400, detail="Prompt too long (max 2000 characters).")
+        await admit(request, schema.split(", "), num_rows, type_hints)
+        columns_list, metadata, context, dataset_id = await similar_context(request, schema, description, profile)
 
-        # Extract schema and description
-        try:
-            if file:
-                content = await file.read()
-                content = content.decode('utf-8')
-                logger.info(f"File content: {content[:500]}...")  # Log first 500 chars for brevity
-                schema, description = extract_schema(content, is_file=True)
-            else:
-                schema, description = extract_schema(prompt, is_file=False)
-            logger.info(f"Extracted schema: {schema}, Description: {description}")
-        except Exception as schema_error:
-            logger.error(f"Schema extraction error: {str(schema_error)}")
-            logger.error(f"Input causing error: {prompt if prompt else content}")
-            raise HTTPException(status_code=400, detail=f"Invalid prompt format: {str(schema_error)}")
-
-        # Create embedding async
-        schema_text = f"{schema} - {description}"
-        embedding = await create_embedding(schema_text, task_type="RETRIEVAL_DOCUMENT")
-
-        # Metadata for Pinecone (no raw data stored)
-        metadata = {
-            "domain": "general",  # Infer or from prompt (TODO: improve inference)
-            "columns": schema.split(", "),
-            "description": description,
-            "privacy": "public"
-        }
-        dataset_id = f"dataset_{hashlib.sha256(schema_text.encode()).hexdigest()}"
-
-        # Async upsert to Pinecone
-        await upsert_to_pinecone(request.app.state.index, dataset_id, embedding, metadata)
-
-        # Async query Pinecone for similar contexts
-        query_embedding = await create_embedding(schema_text, task_type="RETRIEVAL_QUERY")
-        similar_results = await query_pinecone(request.app.state.index, query_embedding, top_k=3)
-        context = "\n".join([res['metadata'].get('description', '') for res in similar_results.get('matches', [])])
+        # Uploaded samples: fit per-column statistical models so only free-text columns need the LLM
+        sample_model = None
+        if sample_rows and Config.STAT_ENGINE_ENABLED:
+            with stage("sample_fit"):
+                sample_model = fit_sample(columns_list, sample_rows, Config.STAT_COPULA)
 
         # Stream generator: hybrid generation with batching, validation, anonymization
-        async def data_stream() -> AsyncGenerator[str, None]:
-            columns_list = schema.split(", ")
-            if format == 'csv':
-                header = ','.join(columns_list) + '\n'  # TODO: Add quoting if needed
-                yield header
-
+        async def anonymized_batches() -> AsyncGenerator[list, None]:
             # Get stream from hybrid generator
-            async for batch in hybrid_generate_synthetic_data_stream(num_rows, columns_list, metadata['domain'], context, format):
-                # Batch is list of dicts (rows)
-                # Anonymize and validate each row
-                for i in range(len(batch)):
-                    batch[i] = anonymize_data(batch[i])  # Fix: Modify in place
-
-                # Format and yield lines
-                for row in batch:
-                    if format == 'csv':
-                        line = ','.join(str(row.get(col, '')) for col in columns_list) + '\n'  # Handle missing; TODO: quoting
-                    else:  # NDJSON for json
-                        line = json.dumps(row) + '\n'
-                    yield line
-
-        media_type = 'text/csv' if format == 'csv' else 'application/ndjson'
-        return StreamingResponse(data_stream(), media_type=media_type, headers={"Content-Disposition": f"attachment; filename=dataset.{format}"})
+            plan = compile_plan(columns_list, type_hints)
+            async for batch in hybrid_generate_synthetic_data_stream(
+                num_rows, columns_list, metadata['domain'], context, format, seed=seed, pool_key=dataset_id,
+                sample_model=sample_model, type_hints=type_hints
+            ):
+                # Batch is list of dicts (rows), already validated; anonymize column-wise in place
+                with stage("anonymization"):
+                    batch = plan.anonymize_batch(batch)
+                ROWS_TOTAL.inc(len(batch), endpoint="generate_dataset")
+                yield batch
+
+        if key is not None:
+            # Shared generation: serialized once, uncompressed, and written through to the cache; an identical
+            # request that started while the context was looked up is joined instead
+            shared = coalescer.join(key)
+            if shared is not None:
+                RESPONSE_CACHE_RESULTS.inc(result="coalesced")
+            else:
+                RESPONSE_CACHE_RESULTS.inc(result="miss")
+                shared = coalescer.start(key, lambda: write_through(
+                    stream_serialized(anonymized_batches(), serializer, Config.STREAM_CHUNK_BYTES, None, Config.STREAM_MAX_FLUSH_DELAY),
+                    cache.writer(key, serializer.compressible)
+                ))
+            return shared_response(shared, serializer, accept_encoding, headers, start)
+
+        # Serialize whole batches into chunked (optionally compressed) body parts
+        encoder = negotiate_encoding(accept_encoding, Config.STREAM_COMPRESSION)
+        if encoder is not None and serializer.compressible:
+            headers["Content-Encoding"] = encoder.name
+        body = stream_serialized(anonymized_batches(), serializer, Config.STREAM_CHUNK_BYTES, encoder, Config.STREAM_MAX_FLUSH_DELAY)
+        body = track_stream(body, start, "generate_dataset")
+        return StreamingResponse(body, media_type=serializer.media_type, headers=headers)
 
     except HTTPException as e:
         logger.error(f"HTTP error: {str(e)}")
         raise e
     except Exception as e:
         logger.error(f"Error generating dataset: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error generating dataset: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error generating dataset: {str(e)}")
+
+def job_status(request: Request, job: Job) -> JobStatus:
+    return JobStatus(**job.progress(), download_url=str(request.url_for("download_job", job_id=job.id)))
+
+def find_job(request: Request, job_id: str) -> Job:
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@router.post("/jobs", status_code=202, response_model=JobStatus)
+@limiter.limit("20/minute;5/10second")
+async def create_job(
+    request: Request,
+    prompt: str = Form(None),
+    file: Optional[UploadFile] = File(None),
+    num_rows: int = Form(1000),
+    format: str = Form("csv"),  # csv or json (NDJSON); chunks concatenate into one file
+    seed: Optional[int] = Form(None)  # Reproducible local columns (each chunk gets a seed derived from it)
+) -> JobStatus:
+    """
+    Endpoint to queue a (large) generation job.
+    - Workers generate it into chunk files on disk; poll GET /jobs/{job_id} for progress.
+    - Submitting the same schema, size and format again returns the same job and reuses finished chunks.
+    - Answers 503 when the job queue is full and 429 when the client's cost budget is spent.
+    """
+    prompt = validate_inputs(prompt, file, num_rows, format, seed)
+    if format not in JOB_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Jobs support formats: {', '.join(JOB_FORMATS)}.")
+
+    schema, description, profile, sample_rows = await resolve_schema(prompt, file)
+    type_hints = {col: column["type"] for col, column in profile.items()}
+    await admit(request, schema.split(", "), num_rows, type_hints, shed=False)
+    columns_list, metadata, context, dataset_id = await similar_context(request, schema, description, profile)
+    try:
+        job = request.app.state.jobs.submit(
+            columns_list, num_rows, format, metadata['domain'], context, seed=seed, pool_key=dataset_id,
+            sample_rows=sample_rows if Config.STAT_ENGINE_ENABLED else None,
+            type_hints=type_hints
+        )
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later.", headers={"Retry-After": "30"})
+    return job_status(request, job)
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(request: Request, job_id: str) -> JobStatus:
+    """
+    Endpoint to poll job progress.
+    """
+    return job_status(request, find_job(request, job_id))
+
+@router.get("/jobs/{job_id}/chunks/{index}")
+async def download_chunk(request: Request, job_id: str, index: int) -> FileResponse:
+    """
+    Endpoint to download one finished chunk (available while the job is still running).
+    - Chunk 0 carries the CSV header; chunks in index order concatenate into the full dataset.
+    """
+    job = find_job(request, job_id)
+    if not 0 <= index < job.chunk_count:
+        raise HTTPException(status_code=404, detail="Chunk not found.")
+    path = job.chunk_path(index)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=409, detail="Chunk not generated yet.")
+    job.touch()
+    serializer = SERIALIZERS[job.format]
+    return FileResponse(path, media_type=serializer.media_type, filename=os.path.basename(path))
+
+@router.get("/jobs/{job_id}/download", name="download_job")
+async def download_job(request: Request, job_id: str) -> StreamingResponse:
+    """
+    Endpoint to download a finished job as one file.
+    - Supports single HTTP byte ranges (Range: bytes=start-end) so interrupted downloads can resume.
+    """
+    job = find_job(request, job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}.")
+    job.touch()
+    paths = [job.chunk_path(i) for i in range(job.chunk_count)]
+    sizes = job.chunk_sizes()
+    total = sum(sizes)
+    serializer = SERIALIZERS[job.format]
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename=dataset.{serializer.extension}",
+        "ETag": f'"{job.id}"'
+    }
+    try:
+        byte_range = parse_range(request.headers.get("range"), total)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Range not satisfiable.", headers={"Content-Range": f"bytes */{total}"})
+    if byte_range is None:
+        headers["Content-Length"] = str(total)
+        return StreamingResponse(read_range(paths, sizes, 0, total - 1), media_type=serializer.media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(read_range(paths, sizes, start, end), status_code=206, media_type=serializer.media_type, headers=headers)
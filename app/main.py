@@ -1,5 +1,5 @@
 # Main entry point for the FastAPI application
-# Handles lifespan events for async resources (e.g., Pinecone)
+# Handles lifespan events for async resources (e.g., Pinecone); heavy modules and clients load in a background warm-up
 from contextlib import asynccontextmanager
 from app.utils.config import load_config, Config
 from app.utils.logger import setup_logger
@@ -10,29 +10,67 @@ load_config()
 setup_logger()
 
 # Import FastAPI and middleware
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from slowapi.middleware import SlowAPIMiddleware
 
 from app.api.routes import router
 
-# Import async clients
-from pinecone import Pinecone
-
-from app.utils.limiter import limiter
+from app.utils.limiter import SQLiteTokenBucket, create_token_bucket, limiter
+from app.services.pinecone_service import PineconeWriteBuffer, create_vector_index
+from app.services.local_vector_index import LocalVectorIndex
+from app.services.executor import shutdown_process_pool
+from app.services.job_manager import JobManager
+from app.services.response_cache import ResponseCache, ResponseCoalescer
+from app.services.llm_generator import llm_stats
+from app.services.admission import llm_budget
+from app.services.chunk_controller import chunk_controller
+from app.services.warmup import Warmup
+from app.utils.metrics import REGISTRY, new_request_id, request_id_var
+import time
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager for startup/shutdown events.
-    - Initializes async clients for Pinecone on startup.
+    - Initializes the vector index (Pinecone or local, per VECTOR_BACKEND) and its write-behind buffer on startup.
+    - Starts the generation job workers (and the expiry of finished jobs after JOB_TTL_SECONDS).
+    - Opens the response cache and coalescer for seeded requests (RESPONSE_CACHE_ENABLED) and the
+      per-client admission token buckets (ADMISSION_ENABLED; shared by workers via ADMISSION_DB_PATH).
+    - Builds the provider clients (get_model, get_embedder) and Faker, and preloads heavy modules in a
+      background warm-up, so the server accepts connections right away (STARTUP_WARMUP=false runs it before startup completes).
+    - Stops job workers (unfinished jobs resume on resubmit), flushes buffered upserts (and saves a local index)
+      and stops the CPU process pool on shutdown.
     """
-    if Config.MODEL_PROVIDER.lower() == "gemini":
-        import google.generativeai as genai
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-    app.state.pc = Pinecone(api_key=Config.PINECONE_API_KEY)
-    app.state.index = app.state.pc.Index(Config.PINECONE_INDEX_NAME)
+    app.state.warmup = Warmup()
+    app.state.index = create_vector_index()
+    app.state.pinecone_writer = PineconeWriteBuffer(
+        app.state.index,
+        batch_size=Config.PINECONE_UPSERT_BATCH_SIZE,
+        flush_interval=Config.PINECONE_FLUSH_INTERVAL
+    )
+    app.state.pinecone_writer.start()
+    app.state.jobs = JobManager(
+        Config.JOB_DIR, Config.JOB_WORKERS, Config.JOB_QUEUE_SIZE, Config.JOB_CHUNK_ROWS, Config.JOB_TTL_SECONDS
+    )
+    app.state.jobs.start()
+    app.state.response_cache = ResponseCache(Config.RESPONSE_CACHE_DIR, Config.RESPONSE_CACHE_MAX_BYTES) if Config.RESPONSE_CACHE_ENABLED else None
+    app.state.coalescer = ResponseCoalescer(Config.COALESCE_MAX_REPLAY_BYTES, Config.COALESCE_WINDOW_BYTES)
+    app.state.admission = create_token_bucket()
+    if Config.STARTUP_WARMUP:
+        app.state.warmup.start(app)
+    else:
+        await app.state.warmup.run(app)
     yield
+    await app.state.warmup.close()
+    await app.state.jobs.close()
+    await app.state.pinecone_writer.close()
+    if isinstance(app.state.index, LocalVectorIndex):
+        app.state.index.save()
+    if isinstance(app.state.admission, SQLiteTokenBucket):
+        app.state.admission.close()
+    shutdown_process_pool()
 
 app = FastAPI(title="Synthetic Dataset Generator", lifespan=lifespan)
 
@@ -40,6 +78,28 @@ app = FastAPI(title="Synthetic Dataset Generator", lifespan=lifespan)
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 
+@app.middleware("http")
+async def reject_large_uploads(request: Request, call_next):
+    # Reject oversized bodies from Content-Length, before the multipart upload is read and spooled
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > Config.MAX_UPLOAD_BYTES + 64 * 1024:  # Allow for form fields
+        return JSONResponse(status_code=413, content={"detail": f"Request too large (max {Config.MAX_UPLOAD_BYTES} bytes)."})
+    return await call_next(request)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Request ID (client-supplied X-Request-ID or a new one) for log lines and the response header;
+    # the start time is used for time-to-first-byte of streamed bodies
+    request_id = request.headers.get("x-request-id", "")[:64] or new_request_id()
+    token = request_id_var.set(request_id)
+    request.state.start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -52,6 +112,33 @@ app.add_middleware(
 # Include API routes
 app.include_router(router, prefix="/api")
 
+REGISTRY.gauge("datagen_llm_fill_rate", "Share of requested LLM rows delivered as valid CSV", lambda: llm_stats.fill_rate)
+REGISTRY.gauge("datagen_jobs_queued", "Generation jobs waiting for a worker", lambda: app.state.jobs.queued() if hasattr(app.state, "jobs") else 0)
+REGISTRY.gauge("datagen_llm_inflight_tokens", "Estimated LLM tokens in flight", lambda: llm_budget.in_flight)
+REGISTRY.gauge("datagen_llm_queued_tokens", "Estimated LLM tokens waiting for the in-flight budget", lambda: llm_budget.queued)
+REGISTRY.gauge("datagen_llm_chunk_target_values", "Adaptive LLM chunk target (rows x complex columns per call)", lambda: chunk_controller.cells or 0)
+REGISTRY.gauge("datagen_llm_output_tokens_per_value", "Measured LLM output tokens per generated value", lambda: chunk_controller.tokens_per_cell)
+REGISTRY.gauge("datagen_llm_rows_per_token", "Delivered LLM rows per prompt + output token", lambda: chunk_controller.rows_per_token or 0)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """
+    Prometheus scrape endpoint (text exposition format).
+    """
+    if not Config.METRICS_ENABLED:
+        return PlainTextResponse("Metrics disabled.", status_code=404)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready", include_in_schema=False)
+async def ready() -> JSONResponse:
+    """
+    Readiness probe: 200 once the startup warm-up has finished, 503 while it runs (or if it failed).
+    """
+    warmup = getattr(app.state, "warmup", None)
+    if warmup is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return JSONResponse(warmup.report(), status_code=200 if warmup.ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8001))  # Use Render's PORT env var
@@ -1,27 +1,38 @@
 # Pydantic models for request/response validation
 from pydantic import BaseModel, field_validator
+from app.utils.config import Config
 
 class GenerationRequest(BaseModel):
     """
     Model for validating generation requests.
-    Ensures num_rows is positive and format is valid.
+    Ensures num_rows is positive (and at most MAX_JOB_ROWS), format is valid and seed is non-negative.
     """
     prompt: str | None = None
     num_rows: int = 1000
     format: str = "csv"
+    seed: int | None = None
 
     @field_validator('num_rows')
     @classmethod
     def num_rows_positive(cls, v: int) -> int:
         if v <= 0:
             raise ValueError('num_rows must be positive')
+        if v > Config.MAX_JOB_ROWS:
+            raise ValueError(f'num_rows must be at most {Config.MAX_JOB_ROWS}')
         return v
 
     @field_validator('format')
     @classmethod
     def format_valid(cls, v: str) -> str:
-        if v not in ['csv', 'json']:
-            raise ValueError('format must be csv or json')
+        if v not in ['csv', 'json', 'parquet', 'arrow']:
+            raise ValueError('format must be csv, json, parquet or arrow')
+        return v
+
+    @field_validator('seed')
+    @classmethod
+    def seed_non_negative(cls, v: int | None) -> int | None:
+        if v is not None and v < 0:
+            raise ValueError('seed must be non-negative')
         return v
 
 class GenerationResponse(BaseModel):
@@ -29,4 +40,18 @@ class GenerationResponse(BaseModel):
     Model for response (though now streaming, kept for reference).
     """
     download_link: str
-    message: str
\ No newline at end of file
+    message: str
+
+class JobStatus(BaseModel):
+    """
+    Model for generation job progress (POST/GET /api/jobs).
+    """
+    job_id: str
+    status: str
+    format: str
+    num_rows: int
+    rows_done: int
+    chunks_done: int
+    total_chunks: int
+    error: str | None = None
+    download_url: str
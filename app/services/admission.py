@@ -0,0 +1,115 @@
+# Service for cost-based admission control
+# Estimates a request's LLM tokens and keeps a worker-wide budget of LLM tokens in flight (queue, then shed)
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+from app.services.chunk_controller import chunk_controller
+from app.services.column_classifier import classify_columns
+from app.utils.config import Config
+from app.utils.logger import logger
+from app.utils.metrics import REGISTRY, STAGE_SECONDS
+
+ADMISSION_RESULTS = REGISTRY.counter("datagen_admission_total", "Generation requests by admission result", ["result"])
+
+def complex_columns(columns: List[str], type_hints: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Columns without a local generator, i.e. the ones the LLM has to write.
+    """
+    types = classify_columns(columns, type_hints)
+    return [col for col in columns if types[col] is None]
+
+def estimate_llm_tokens(num_rows: int, columns: List[str], type_hints: Optional[Dict[str, str]] = None) -> int:
+    """
+    Upper-bound LLM output tokens for a request: num_rows x complex columns x output tokens per value
+    (measured by the chunk controller; LLM_TOKENS_PER_CELL until the first call).
+    - Value-pool reuse and fitted sample columns only make the real cost lower.
+    """
+    return int(num_rows * len(complex_columns(columns, type_hints)) * chunk_controller.tokens_per_cell)
+
+def is_rate_limited(error: BaseException) -> bool:
+    """
+    True for provider quota / rate-limit errors (HTTP 429, Gemini ResourceExhausted).
+    """
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    text = str(error).lower()
+    return code == 429 or "429" in text or "quota" in text or type(error).__name__ == "ResourceExhausted"
+
+class LLMBudget:
+    """
+    Budget of estimated LLM tokens in flight across all requests of the worker.
+    - reserve(tokens) waits, first come first served, until the call fits (a call larger than the whole
+      budget runs alone); the wait is recorded as datagen_stage_seconds{stage="llm_queue"}.
+    - pause(seconds) holds every new call after a provider 429, so one quota error backs off
+      all requests together instead of each of them hitting the limit in turn.
+    - saturated: more than max_queued tokens are waiting; new LLM-bound requests are shed.
+    """
+    def __init__(self, max_tokens: int, max_queued: int):
+        self.max_tokens = max_tokens
+        self.max_queued = max_queued
+        self.in_flight = 0
+        self.queued = 0
+        self.paused_until = 0.0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def saturated(self) -> bool:
+        return self.queued > self.max_queued
+
+    def _fits(self, tokens: int) -> bool:
+        return self.max_tokens <= 0 or self.in_flight == 0 or self.in_flight + tokens <= self.max_tokens
+
+    def _wake(self):
+        while self._waiters:
+            tokens, future = self._waiters[0]
+            if future.done():  # Cancelled waiter
+                self._waiters.popleft()
+                continue
+            if not self._fits(tokens):
+                break
+            self._waiters.popleft()
+            self.queued -= tokens
+            self.in_flight += tokens
+            future.set_result(None)
+
+    async def _acquire(self, tokens: int):
+        if not self._waiters and self._fits(tokens):
+            self.in_flight += tokens
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((tokens, future))
+        self.queued += tokens
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.in_flight -= tokens  # Granted just as it was cancelled
+            else:
+                self.queued -= tokens
+            self._wake()
+            raise
+
+    def _release(self, tokens: int):
+        self.in_flight -= tokens
+        self._wake()
+
+    @asynccontextmanager
+    async def reserve(self, tokens: int) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        while time.time() < self.paused_until:
+            await asyncio.sleep(self.paused_until - time.time())
+        await self._acquire(tokens)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_queue")
+        try:
+            yield
+        finally:
+            self._release(tokens)
+
+    def pause(self, seconds: float):
+        until = time.time() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            logger.warning(f"LLM provider rate limit hit, holding new LLM calls for {seconds:.2f}s")
+
+llm_budget = LLMBudget(Config.LLM_INFLIGHT_TOKENS, Config.LLM_QUEUE_MAX_TOKENS)
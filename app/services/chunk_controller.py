@@ -0,0 +1,141 @@
+# Service for adaptive LLM chunk sizing
+# Picks rows per LLM call from measured output tokens, fill rate and latency (AIMD on values per call)
+import threading
+from typing import Optional
+from app.utils.config import Config
+from app.utils.logger import logger
+from app.utils.metrics import REGISTRY, ROWS_BUCKETS
+
+CHUNK_ROWS = REGISTRY.histogram("datagen_llm_chunk_rows", "Rows requested per LLM chunk (controller decisions)", buckets=ROWS_BUCKETS)
+CHUNK_ADJUSTMENTS = REGISTRY.counter("datagen_llm_chunk_adjustments_total", "Adaptive LLM chunk size changes", ["direction"])
+
+OUTPUT_HEADROOM = 0.8  # Share of the model's output limit a chunk is sized to fill
+FILL_TARGET = 0.95  # Calls returning fewer of the requested rows count as truncated
+GROWTH = 1.25  # Multiplicative increase after a full call
+SHRINK = 0.5  # Multiplicative decrease after a short call
+NEAR_TARGET = 0.8  # Calls asking for less of the target (refills, tail chunks) say little about the limit
+
+class ChunkController:
+    """
+    Adaptive rows per LLM call, shared by all requests of the worker.
+    - The target is kept in values per call (rows x complex columns), so what is learned on one
+      schema carries over to schemas with a different number of LLM columns.
+    - Full calls grow the target, short (truncated) calls halve it; only calls of about the target
+      size count either way (a short answer to a small refill does not shrink it). It is capped so the expected
+      output stays within OUTPUT_HEADROOM of LLM_MAX_OUTPUT_TOKENS and the expected call time
+      within LLM_TARGET_CALL_SECONDS.
+    - Output tokens and seconds per value are exponentially weighted averages of observed calls
+      (the token estimate also drives admission cost and the in-flight budget).
+    - With LLM_ADAPTIVE_CHUNKS off, every call asks for LLM_CHUNK_ROWS rows.
+    """
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.cells: Optional[float] = None  # Target values per call (None until the first request)
+        self.output_tokens_per_cell: Optional[float] = None
+        self.seconds_per_cell: Optional[float] = None
+        self.fill_rate = 1.0
+        self.rows_per_token: Optional[float] = None  # Delivered rows per (prompt + output) token
+        self.last_rows = Config.LLM_CHUNK_ROWS
+        self._lock = threading.Lock()
+
+    @property
+    def tokens_per_cell(self) -> float:
+        return self.output_tokens_per_cell or Config.LLM_TOKENS_PER_CELL
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + self.alpha * (value - current)
+
+    def _cap(self, cells: float) -> float:
+        cap = Config.LLM_MAX_OUTPUT_TOKENS * OUTPUT_HEADROOM / self.tokens_per_cell
+        if self.seconds_per_cell:
+            cap = min(cap, Config.LLM_TARGET_CALL_SECONDS / self.seconds_per_cell)
+        return min(cells, cap)
+
+    def rows_per_call(self, num_cols: int) -> int:
+        """
+        Rows to request in the next LLM call for `num_cols` complex columns.
+        """
+        if not Config.LLM_ADAPTIVE_CHUNKS:
+            return Config.LLM_CHUNK_ROWS
+        num_cols = max(1, num_cols)
+        with self._lock:
+            if self.cells is None:
+                self.cells = float(Config.LLM_CHUNK_ROWS * num_cols)
+            cells = self._cap(self.cells)
+        rows = int(min(max(cells / num_cols, Config.LLM_MIN_CHUNK_ROWS), Config.LLM_MAX_CHUNK_ROWS))
+        self.last_rows = rows
+        CHUNK_ROWS.observe(rows)
+        return rows
+
+    def observe(
+        self,
+        requested: int,
+        delivered: int,
+        num_cols: int,
+        seconds: float,
+        prompt_tokens: Optional[int] = None,
+        output_tokens: Optional[int] = None
+    ):
+        """
+        Learns from one completed LLM call (failed calls are not observed).
+        """
+        if requested <= 0 or not Config.LLM_ADAPTIVE_CHUNKS:
+            return
+        num_cols = max(1, num_cols)
+        requested_cells = requested * num_cols
+        fill = min(1.0, delivered / requested)
+        with self._lock:
+            self.fill_rate = self._ewma(self.fill_rate, fill)
+            if output_tokens and delivered:
+                self.output_tokens_per_cell = self._ewma(self.output_tokens_per_cell, output_tokens / (delivered * num_cols))
+            if prompt_tokens is not None and output_tokens and delivered:
+                self.rows_per_token = self._ewma(self.rows_per_token, delivered / (prompt_tokens + output_tokens))
+            if seconds > 0:
+                self.seconds_per_cell = self._ewma(self.seconds_per_cell, seconds / requested_cells)
+            if self.cells is None:
+                self.cells = float(Config.LLM_CHUNK_ROWS * num_cols)
+            if requested_cells < NEAR_TARGET * self._cap(self.cells):
+                return  # Refill or tail chunk
+            if fill < FILL_TARGET:
+                # Truncated or short answer: the chunk was too large for the model
+                self.cells = max(Config.LLM_MIN_CHUNK_ROWS * num_cols, min(self.cells, requested_cells) * SHRINK)
+                direction = "down"
+            else:
+                self.cells = self._cap(max(self.cells, requested_cells) * GROWTH)
+                direction = "up"
+        CHUNK_ADJUSTMENTS.inc(direction=direction)
+        logger.debug(f"LLM chunk target {direction}: {self.cells:.0f} values per call (fill {fill:.2f}, {seconds:.2f}s)")
+
+    def report(self) -> dict:
+        return {
+            "rows": self.last_rows,
+            "cells": self.cells,
+            "output_tokens_per_cell": self.output_tokens_per_cell,
+            "seconds_per_cell": self.seconds_per_cell,
+            "fill_rate": self.fill_rate,
+            "rows_per_token": self.rows_per_token,
+        }
+
+chunk_controller = ChunkController()
+
+def compact_context(context: str, max_chars: int) -> str:
+    """
+    Shrinks the similar-dataset context sent with every LLM call (once per request).
+    - Drops blank and repeated lines (identical schemas retrieve identical descriptions).
+    - Keeps whole lines up to max_chars.
+    """
+    lines = []
+    seen = set()
+    size = 0
+    for line in context.splitlines():
+        line = line.strip()
+        if not line or line in seen:
+            continue
+        if size + len(line) > max_chars:
+            if not lines:
+                lines.append(line[:max_chars])
+            break
+        seen.add(line)
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
@@ -0,0 +1,169 @@
+# Service for semantic column classification
+# Maps column names (and prompt type hints) to local generators so fewer columns need the LLM
+import re
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.utils.config import Config
+
+class ColumnType:
+    """
+    A local generator type and the column names it serves.
+    - synonyms: normalized column names matched exactly ('first_name', 'fname').
+    - patterns: regexes searched in the normalized name ('(^|_)zip' matches 'billing_zip_code').
+    - private: identity-like values; always generated locally, never fitted from an uploaded sample.
+    - generator: ColumnarFakerEngine generator to use (defaults to name), so several rules can share one.
+    """
+    def __init__(
+        self,
+        name: str,
+        synonyms: List[str],
+        patterns: List[str] = (),
+        private: bool = False,
+        generator: Optional[str] = None
+    ):
+        self.name = name
+        self.synonyms = list(synonyms)
+        self.patterns = [re.compile(p) for p in patterns]
+        self.private = private
+        self.generator = generator or name
+
+# In priority order: the first type whose synonyms or patterns match wins
+COLUMN_TYPES: Dict[str, ColumnType] = {}
+
+def register_column_type(column_type: ColumnType):
+    """
+    Registers (or replaces) a column type; its generator must exist in the ColumnarFakerEngine's generators.
+    """
+    COLUMN_TYPES[column_type.name] = column_type
+    _classify.cache_clear()
+    _synonym_index.cache_clear()
+
+for _column_type in [
+    ColumnType('key_id', [], [r'(^|_)id$'], generator='id'),  # '*_id' wins over other tokens ('job_posting_id')
+    ColumnType('first_name', ['first_name', 'firstname', 'fname', 'given_name', 'forename'], private=True),
+    ColumnType('last_name', ['last_name', 'lastname', 'lname', 'surname', 'family_name'], private=True),
+    ColumnType('name', ['name', 'full_name', 'fullname', 'customer_name', 'employee_name', 'person', 'contact_name'],
+               [r'(^|_)(customer|employee|user|patient|student|owner|contact|client|reviewer|applicant|donor|doctor|'
+                r'athlete|manager|member|person|account_holder)_name$'], private=True),
+    ColumnType('user_name', ['username', 'user_name', 'login', 'handle', 'screen_name'], private=True),
+    ColumnType('email', ['email', 'e_mail', 'mail', 'email_address'], [r'(^|_)e_?mail(_|$)'], private=True),
+    ColumnType('phone', ['phone', 'telephone', 'mobile', 'phone_number', 'contact_number'],
+               [r'(^|_)(phone|mobile|tel|telephone|fax)(_|$)'], private=True),
+    ColumnType('ssn', ['ssn', 'social_security_number'], [r'(^|_)ssn(_|$)'], private=True),
+    ColumnType('street_address', ['address', 'street', 'street_address', 'address_line', 'address1', 'address_1'],
+               [r'(^|_)(street|address)(_|$)'], private=True),
+    ColumnType('postcode', ['zip', 'zipcode', 'zip_code', 'postcode', 'postal_code', 'postalcode'],
+               [r'(^|_)(zip|postcode|postal)(_|$)']),
+    ColumnType('city', ['city', 'town', 'municipality'], [r'(^|_)city(_|$)']),
+    ColumnType('state', ['state', 'province', 'county'], [r'(^|_)(state|province)(_|$)']),
+    ColumnType('country_code', ['country_code', 'country_iso', 'iso_country'], [r'(^|_)country_(code|iso)$']),
+    ColumnType('country', ['country', 'nation', 'nationality'], [r'(^|_)country(_|$)']),
+    ColumnType('company', ['company', 'company_name', 'employer', 'organization', 'organisation', 'vendor', 'supplier'],
+               [r'(^|_)(company|employer|vendor|supplier)(_|$)']),
+    ColumnType('job', ['job', 'occupation', 'designation'],
+               [r'(^|_)(job|occupation)(_|$)']),
+    ColumnType('url', ['url', 'website', 'homepage', 'link'], [r'(^|_)(url|website|homepage)(_|$)']),
+    ColumnType('ipv4', ['ip', 'ip_address', 'ipv4', 'ip_addr'], [r'(^|_)ip(v4)?(_|$)']),
+    ColumnType('uuid', ['uuid', 'guid'], [r'(^|_)(uuid|guid)(_|$)']),
+    ColumnType('id', ['id', 'identifier', 'record_id', 'row_id'], [r'(^|_)(id|no|num|number|key)$']),
+    ColumnType('age', ['age', 'age_years'], [r'(^|_)age(_|$)']),
+    ColumnType('gender', ['gender', 'sex'], [r'(^|_)(gender|sex)(_|$)']),
+    ColumnType('date', ['date', 'dob', 'birthday', 'birth_date', 'date_of_birth', 'hire_date', 'due_date'],
+               [r'(^|_)(date|dob|birthday)(_|$)', r'_on$']),
+    ColumnType('datetime', ['timestamp', 'datetime', 'time', 'created', 'updated', 'modified'],
+               [r'_at$', r'_time$', r'(^|_)(timestamp|datetime)(_|$)']),
+    ColumnType('year', ['year', 'yr'], [r'(^|_)year(_|$)']),
+    ColumnType('salary', ['salary', 'income', 'wage', 'annual_salary', 'compensation'],
+               [r'(^|_)(salary|income|wage|compensation)(_|$)']),
+    ColumnType('price', ['price', 'amount', 'cost', 'total', 'revenue', 'balance', 'fee', 'subtotal', 'unit_price', 'tax'],
+               [r'(^|_)(price|amount|cost|total|revenue|balance|fee|spend)(_|$)']),
+    ColumnType('quantity', ['quantity', 'qty', 'count', 'units', 'stock'], [r'(^|_)(quantity|qty|count|units|stock)(_|$)']),
+    ColumnType('rating', ['rating', 'stars'], [r'(^|_)(rating|stars)(_|$)']),
+    ColumnType('percentage', ['percentage', 'percent', 'pct', 'rate', 'ratio', 'discount'],
+               [r'(^|_)(percentage|percent|pct)(_|$)']),
+    ColumnType('boolean', ['active', 'is_active', 'enabled', 'verified', 'flag', 'subscribed'], [r'^(is|has|can)_']),
+    ColumnType('currency_code', ['currency', 'currency_code'], [r'(^|_)currency(_|$)']),
+    ColumnType('color', ['color', 'colour'], [r'(^|_)colou?r(_|$)']),
+    ColumnType('latitude', ['latitude', 'lat'], [r'(^|_)lat(itude)?(_|$)']),
+    ColumnType('longitude', ['longitude', 'lon', 'lng'], [r'(^|_)(lon|lng|longitude)(_|$)']),
+]:
+    COLUMN_TYPES[_column_type.name] = _column_type
+
+# Prompt type hints ('price: decimal') -> generator type; free-text hints (string, text) stay with the LLM
+HINT_TYPES = {
+    'int': 'integer', 'integer': 'integer', 'bigint': 'integer', 'number': 'integer', 'smallint': 'integer',
+    'float': 'float', 'double': 'float', 'decimal': 'float', 'numeric': 'float', 'real': 'float', 'money': 'price',
+    'bool': 'boolean', 'boolean': 'boolean',
+    'date': 'date', 'datetime': 'datetime', 'timestamp': 'datetime', 'time': 'datetime',
+    'uuid': 'uuid', 'guid': 'uuid', 'email': 'email', 'phone': 'phone', 'url': 'url',
+}
+
+def normalize_column(column: str) -> str:
+    """
+    'createdAt', 'Created At', 'created-at' -> 'created_at'.
+    """
+    column = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', column.strip())
+    return re.sub(r'[^a-z0-9]+', '_', column.lower()).strip('_')
+
+def ngram_embedding(text: str, dimension: int = 256) -> np.ndarray:
+    """
+    Local, dependency-free embedding: hashed character trigrams, L2-normalized.
+    """
+    padded = f"_{text}_"
+    vector = np.zeros(dimension, dtype=np.float32)
+    for i in range(len(padded) - 2):
+        vector[zlib.crc32(padded[i:i + 3].encode()) % dimension] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+@lru_cache(maxsize=1)
+def _synonym_index() -> Tuple[List[str], np.ndarray]:
+    labels, vectors = [], []
+    for column_type in COLUMN_TYPES.values():
+        for synonym in column_type.synonyms:
+            labels.append(column_type.generator)
+            vectors.append(ngram_embedding(synonym))
+    return labels, np.stack(vectors)
+
+def classify_column(column: str, hint: Optional[str] = None, fuzzy: bool = False, threshold: float = 0.7) -> Optional[str]:
+    """
+    Returns the generator for one column, or None if it needs the LLM.
+    - Order: exact synonym, name pattern, prompt type hint, then (if fuzzy) the nearest synonym
+      by trigram embedding with cosine similarity >= threshold.
+    """
+    name = normalize_column(column)
+    for column_type in COLUMN_TYPES.values():
+        if name in column_type.synonyms:
+            return column_type.generator
+    for column_type in COLUMN_TYPES.values():
+        if any(pattern.search(name) for pattern in column_type.patterns):
+            return column_type.generator
+    if hint:
+        hinted = HINT_TYPES.get(hint.strip().lower().split('(')[0].strip())
+        if hinted:
+            return hinted
+    if fuzzy:
+        labels, vectors = _synonym_index()
+        scores = vectors @ ngram_embedding(name)
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return labels[best]
+    return None
+
+@lru_cache(maxsize=1024)
+def _classify(columns: Tuple[str, ...], hints: Tuple[Tuple[str, str], ...], fuzzy: bool, threshold: float) -> Tuple[Optional[str], ...]:
+    hint_map = dict(hints)
+    return tuple(classify_column(col, hint_map.get(col), fuzzy, threshold) for col in columns)
+
+def classify_columns(columns: List[str], hints: Optional[Dict[str, str]] = None) -> Dict[str, Optional[str]]:
+    """
+    Classifies a schema's columns (memoized per schema and hints).
+    - Returns column -> generator, or None for columns left to the LLM.
+    """
+    types = _classify(tuple(columns), tuple(sorted((hints or {}).items())), Config.CLASSIFIER_FUZZY, Config.CLASSIFIER_FUZZY_THRESHOLD)
+    return dict(zip(columns, types))
+
+def is_private(generator: Optional[str]) -> bool:
+    return any(column_type.private and column_type.generator == generator for column_type in COLUMN_TYPES.values())
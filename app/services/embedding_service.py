@@ -1,41 +1,101 @@
 # Service for creating embeddings asynchronously
-# Supports OpenAI or Gemini (preferred)
+# Supports OpenAI, Gemini (preferred) or the offline stub, through the Embedder interface
+import hashlib
+from typing import Optional
+from app.services.providers import Embedder, create_embedder
+from app.utils.cache import LRUCache, SQLiteCache, SingleFlight
 from app.utils.config import Config
 from app.utils.logger import logger
+from app.utils.metrics import stage
 
-# Async clients
-if Config.MODEL_PROVIDER == "openai":
-    from openai import AsyncOpenAI
-    openai_client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
-elif Config.MODEL_PROVIDER == "gemini":
-    import google.generativeai as genai
-    genai.configure(api_key=Config.GEMINI_API_KEY)
+EMBEDDING_MODELS = {
+    "openai": "text-embedding-3-large",
+    "gemini": "models/text-embedding-004",
+    "stub": "trigram-hash",
+}
+
+# Embedder client (built from Config on first use)
+_embedder: Optional[Embedder] = None
+
+def get_embedder() -> Embedder:
+    global _embedder
+    if _embedder is None:
+        _embedder = create_embedder()
+    return _embedder
+
+# Embedding cache (built from Config on first use) and in-flight call dedup
+_memory_cache: Optional[LRUCache] = None
+_disk_cache: Optional[SQLiteCache] = None
+_single_flight = SingleFlight()
+
+def _caches() -> tuple[LRUCache, Optional[SQLiteCache]]:
+    global _memory_cache, _disk_cache
+    if _memory_cache is None:
+        _memory_cache = LRUCache(
+            Config.EMBEDDING_CACHE_MAX_BYTES,
+            ttl=Config.EMBEDDING_CACHE_TTL,
+            sizer=lambda embedding: len(embedding) * 8
+        )
+        if Config.EMBEDDING_CACHE_DB_PATH:
+            _disk_cache = SQLiteCache(
+                Config.EMBEDDING_CACHE_DB_PATH,
+                Config.EMBEDDING_CACHE_DISK_MAX_BYTES,
+                ttl=Config.EMBEDDING_CACHE_TTL
+            )
+    return _memory_cache, _disk_cache
+
+def embedding_cache_key(text: str, task_type: str) -> str:
+    """
+    Cache key over (provider, model, task_type, text hash).
+    - OpenAI ignores task_type, so both retrieval roles share one key (and one API call).
+    """
+    provider = Config.MODEL_PROVIDER
+    role = "*" if provider == "openai" else task_type
+    text_hash = hashlib.sha256(text.encode()).hexdigest()
+    return f"{provider}:{EMBEDDING_MODELS.get(provider, '')}:{role}:{text_hash}"
 
 async def create_embedding(text: str, task_type: str = "RETRIEVAL_DOCUMENT") -> list[float]:
     """
     Async function to generate embeddings.
     - Uses task_type for Gemini to optimize (e.g., RETRIEVAL_DOCUMENT for upsert, RETRIEVAL_QUERY for search).
     - Dimension set to 768 to match Pinecone (assume recreated as per previous advice).
+    - Served from the embedding cache when possible; concurrent identical calls share one request.
     """
+    key = embedding_cache_key(text, task_type)
+    if Config.EMBEDDING_CACHE_ENABLED:
+        memory, disk = _caches()
+        embedding = memory.get(key)
+        if embedding is None and disk is not None:
+            embedding = disk.get(key)
+            if embedding is not None:
+                memory.set(key, embedding)
+        if embedding is not None:
+            return embedding
+    return await _single_flight.do(key, lambda: _fetch_embedding(key, text, task_type))
+
+async def _fetch_embedding(key: str, text: str, task_type: str) -> list[float]:
+    with stage(f"embedding_{task_type.rsplit('_', 1)[-1].lower()}"):  # embedding_document / embedding_query
+        embedding = await _request_embedding(text, task_type)
+    if Config.EMBEDDING_CACHE_ENABLED:
+        memory, disk = _caches()
+        memory.set(key, embedding)
+        if disk is not None:
+            disk.set(key, embedding)
+    return embedding
+
+async def _request_embedding(text: str, task_type: str) -> list[float]:
     try:
-        if Config.MODEL_PROVIDER == "openai":
-            response = await openai_client.embeddings.create(
-                model="text-embedding-3-large",
-                input=text,
-                dimensions=768  # Match Pinecone index dimension
-            )
-            embedding = response.data[0].embedding
-        elif Config.MODEL_PROVIDER == "gemini":
-            # Async embed for Gemini
-            result = await genai.embed_content_async(
-                model="models/text-embedding-004",
-                content=text,
-                task_type=task_type,
-                output_dimensionality=768  # Match Pinecone
-            )
-            embedding = result['embedding']
+        embedding = await get_embedder().embed(text, task_type)
         logger.info("Embedding created successfully.")
-        return embedding
     except Exception as e:
         logger.error(f"Embedding creation error: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+    return embedding
+
+def embedding_cache_stats() -> dict:
+    memory, disk = _caches()
+    return {
+        "memory": memory.stats(),
+        "disk": disk.stats() if disk else None,
+        "inflight": len(_single_flight),
+    }
@@ -0,0 +1,167 @@
+# Service for offloading CPU-bound batch work from the event loop
+# Runs batch synthesis + validation in a process pool (or inline) with bounded buffering
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+import numpy as np
+from app.services.faker_engine import ColumnarFakerEngine, get_engine
+from app.services.stat_engine import SampleModel
+from app.services.validation_plan import compile_plan
+from app.utils.config import Config
+from app.utils.logger import logger
+from app.utils.metrics import STAGE_SECONDS
+
+# Per-process state (each pool worker has its own copy)
+_worker_seed: Optional[int] = None
+_worker_engine: Optional[ColumnarFakerEngine] = None
+_seeded_engines: "OrderedDict[int, ColumnarFakerEngine]" = OrderedDict()
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def derive_seed(seed: int, index: int) -> int:
+    """
+    Deterministic per-batch seed, independent of which worker runs the batch.
+    """
+    return (seed * 1_000_003 + index) % (2 ** 63)
+
+def _init_worker(counter, base_seed: int):
+    # Each worker gets a distinct, deterministic Faker/NumPy seed (base_seed + worker number)
+    global _worker_seed
+    with counter.get_lock():
+        _worker_seed = base_seed + counter.value
+        counter.value += 1
+
+def _engine_for(seed: Optional[int]) -> ColumnarFakerEngine:
+    global _worker_engine
+    if seed is None:
+        if _worker_seed is None:
+            return get_engine()  # Inline: shared unseeded engine
+        if _worker_engine is None:
+            _worker_engine = ColumnarFakerEngine(seed=_worker_seed)
+        return _worker_engine
+    # Seeded requests: keep a few engines so value pools are built once per seed
+    engine = _seeded_engines.get(seed)
+    if engine is None:
+        engine = ColumnarFakerEngine(seed=seed)
+        _seeded_engines[seed] = engine
+        while len(_seeded_engines) > 8:
+            _seeded_engines.popitem(last=False)
+    _seeded_engines.move_to_end(seed)
+    return engine
+
+def build_batch(
+    simple_cols: List[str],
+    columns: List[str],
+    size: int,
+    complex_rows: List[Dict[str, str]],
+    seed: Optional[int],
+    index: int,
+    sample_model: Optional[SampleModel] = None,
+    stat_cols: Sequence[str] = (),
+    simple_types: Optional[Dict[str, str]] = None,
+    type_hints: Optional[Dict[str, str]] = None
+) -> List[Dict[str, str]]:
+    """
+    CPU-bound part of one batch: simple- and statistical-column synthesis, row assembly and validation.
+    - Pure function of its arguments when seeded, so it gives the same rows inline or in any worker.
+    """
+    engine = _engine_for(seed)
+    batch_seed = derive_seed(seed, index) if seed is not None else None
+    if batch_seed is not None:
+        engine.reseed(batch_seed)
+    generated = engine.generate(simple_cols, size, simple_types) if simple_cols else {}
+    if stat_cols:
+        generated.update(sample_model.generate(list(stat_cols), size, np.random.default_rng(batch_seed)))
+    if generated:
+        names = list(generated)
+        rows = [dict(zip(names, values)) for values in zip(*generated.values())]
+    else:
+        rows = [{} for _ in range(size)]
+    for row, complex_row in zip(rows, complex_rows):
+        row.update(complex_row)
+    return compile_plan(columns, type_hints).validate_batch(rows, engine.fake)
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Returns the shared process pool (sized to CPU_WORKERS, default: all cores).
+    - Uses the 'spawn' start method so workers never inherit the server's threads or sockets.
+    """
+    global _process_pool
+    if _process_pool is None:
+        workers = Config.CPU_WORKERS or os.cpu_count() or 1
+        context = multiprocessing.get_context("spawn")
+        _process_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(context.Value('i', 0), Config.CPU_WORKER_SEED)
+        )
+        logger.info(f"Started CPU process pool with {workers} workers")
+    return _process_pool
+
+async def warm_process_pool() -> int:
+    """
+    Starts every pool worker now (each imports the generation modules once) instead of on the first large batch.
+    """
+    pool = get_process_pool()
+    loop = asyncio.get_running_loop()
+    pids = await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(pool._max_workers)))
+    return len(set(pids))
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+class BatchExecutor:
+    """
+    Ordered, bounded queue of CPU-bound batch jobs.
+    - mode 'process' runs jobs in the shared process pool; 'inline' runs them on the caller.
+    - At most max_pending jobs are submitted or buffered at once (backpressure): callers
+      await next() while full().
+    - Results come back in submission order.
+    """
+    def __init__(self, mode: str = "process", max_pending: int = 2, inline_rows: int = 0):
+        self.mode = mode
+        self.max_pending = max(1, max_pending)
+        self.inline_rows = inline_rows
+        self._pending: Deque[asyncio.Future] = deque()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, fn: Callable[..., Any], *args, size: int = 0, stage_name: str = "batch_build"):
+        """
+        Schedules fn(*args); jobs smaller than inline_rows rows skip the pool (not worth the IPC,
+        and small interactive requests never queue behind large ones).
+        - Submit-to-done time (including pool queueing) is recorded as datagen_stage_seconds{stage=stage_name}.
+        """
+        start = time.perf_counter()
+        if self.mode == "process" and size >= self.inline_rows:
+            future = asyncio.get_running_loop().run_in_executor(get_process_pool(), fn, *args)
+            future.add_done_callback(lambda _: STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage_name))
+        else:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage_name)
+        self._pending.append(future)
+
+    def full(self) -> bool:
+        return len(self._pending) >= self.max_pending
+
+    def head_ready(self) -> bool:
+        return bool(self._pending) and self._pending[0].done()
+
+    async def next(self) -> Any:
+        return await self._pending.popleft()
+
+    def cancel(self):
+        while self._pending:
+            self._pending.popleft().cancel()
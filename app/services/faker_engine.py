@@ -0,0 +1,179 @@
+# Service for columnar (vectorized) Faker generation
+# Produces whole columns per batch instead of one Faker call per cell
+import numpy as np
+from faker import Faker
+from typing import Callable, Dict, List, Optional
+
+POOL_SIZE = 2000  # Distinct values pre-sampled from Faker per pool
+
+class ColumnarFakerEngine:
+    """
+    Generates simple columns as whole arrays per batch.
+    - Pre-samples value pools from Faker once (first/last names, cities, user names, domains),
+      named after the Faker provider that fills them.
+    - Draws pool indices and integers with NumPy instead of calling Faker per cell.
+    - Composes emails, phone numbers, UUIDs, IPs and dates from vectorized arrays.
+    - Pass a seed for reproducible output (seeds both Faker and the NumPy generator).
+    """
+    def __init__(self, seed: Optional[int] = None, pool_size: int = POOL_SIZE):
+        self.seed = seed
+        self.pool_size = pool_size
+        self.rng = np.random.default_rng(seed)
+        self.fake = Faker()
+        if seed is not None:
+            self.fake.seed_instance(seed)
+        self._pools: Dict[str, np.ndarray] = {}
+        # Generator per column type (see column_classifier for the names that map to each type)
+        self.generators: Dict[str, Callable[[int], np.ndarray]] = {
+            'name': self.names,
+            'first_name': lambda n: self._sample('first_name', n),
+            'last_name': lambda n: self._sample('last_name', n),
+            'user_name': lambda n: self._sample('user_name', n),
+            'age': self.ages,
+            'city': self.cities,
+            'state': lambda n: self._sample('state', n),
+            'country': lambda n: self._sample('country', n),
+            'country_code': lambda n: self._sample('country_code', n),
+            'street_address': lambda n: self._sample('street_address', n),
+            'postcode': lambda n: self._digits(501, 100000, n, width=5),
+            'company': lambda n: self._sample('company', n),
+            'job': lambda n: self._sample('job', n),
+            'email': self.emails,
+            'phone': self.phones,
+            'url': self.urls,
+            'ipv4': self.ipv4,
+            'uuid': self.uuids,
+            'id': lambda n: self._digits(1, 10 ** 9, n),
+            'integer': lambda n: self._digits(0, 1000, n),
+            'float': lambda n: np.char.mod('%.2f', self.rng.uniform(0, 1000, n)),
+            'salary': lambda n: np.char.add(self._digits(30, 250, n), '000'),
+            'price': lambda n: np.char.mod('%.2f', self.rng.lognormal(3.5, 1.0, n)),
+            'quantity': lambda n: self._digits(1, 100, n),
+            'rating': lambda n: self._digits(1, 6, n),
+            'percentage': lambda n: np.char.mod('%.1f', self.rng.uniform(0, 100, n)),
+            'boolean': lambda n: np.where(self.rng.random(n) < 0.5, 'true', 'false'),
+            'date': self.dates,
+            'datetime': self.datetimes,
+            'year': lambda n: self._digits(1990, 2026, n),
+            'gender': lambda n: np.array(['female', 'male', 'non-binary'])[self.rng.choice(3, n, p=[0.49, 0.49, 0.02])],
+            'ssn': self.ssns,
+            'currency_code': lambda n: self._sample('currency_code', n),
+            'color': lambda n: self._sample('color_name', n),
+            'latitude': lambda n: np.char.mod('%.6f', self.rng.uniform(-90, 90, n)),
+            'longitude': lambda n: np.char.mod('%.6f', self.rng.uniform(-180, 180, n)),
+        }
+
+    def supports(self, column: str) -> bool:
+        return column.lower() in self.generators
+
+    def generate(self, columns: List[str], n: int, types: Optional[Dict[str, str]] = None) -> Dict[str, List[str]]:
+        """
+        Generates n values for each supported column.
+        - types maps column -> generator type (from column_classifier); defaults to the lowercased column name.
+        - Returns a dict of column -> list of str (rows are assembled by the caller).
+        """
+        types = types or {}
+        return {col: self.generators[types.get(col, col.lower())](n).tolist() for col in columns}
+
+    def reseed(self, seed: int):
+        """
+        Re-seeds the draws (and row-level Faker) without rebuilding value pools.
+        - Lets one engine produce reproducible, independent batches (e.g., seed per batch index).
+        """
+        self.rng = np.random.default_rng(seed)
+        self.fake.seed_instance(seed)
+
+    def _pool(self, key: str) -> np.ndarray:
+        # Built lazily so unused pools cost nothing; seeded per pool so the
+        # content does not depend on which pool happened to be built first
+        pool = self._pools.get(key)
+        if pool is None:
+            faker = self.fake
+            if self.seed is not None:
+                faker = Faker()
+                faker.seed_instance(f"{self.seed}:{key}")
+            factory = getattr(faker, key)
+            pool = np.array([factory() for _ in range(self.pool_size)], dtype=str)
+            self._pools[key] = pool
+        return pool
+
+    def _sample(self, key: str, n: int) -> np.ndarray:
+        pool = self._pool(key)
+        return pool[self.rng.integers(0, len(pool), size=n)]
+
+    def _digits(self, low: int, high: int, n: int, width: int = 0) -> np.ndarray:
+        values = self.rng.integers(low, high, size=n).astype(str)
+        return np.char.zfill(values, width) if width else values
+
+    def names(self, n: int) -> np.ndarray:
+        first = self._sample('first_name', n)
+        last = self._sample('last_name', n)
+        return np.char.add(np.char.add(first, ' '), last)
+
+    def ages(self, n: int) -> np.ndarray:
+        return self._digits(18, 91, n)
+
+    def cities(self, n: int) -> np.ndarray:
+        return self._sample('city', n)
+
+    def emails(self, n: int) -> np.ndarray:
+        user = self._sample('user_name', n)
+        domain = self._sample('free_email_domain', n)
+        return np.char.add(np.char.add(user, '@'), domain)
+
+    def urls(self, n: int) -> np.ndarray:
+        return np.char.add('https://www.', self._sample('domain_name', n))
+
+    def ipv4(self, n: int) -> np.ndarray:
+        octets = [self._digits(1 if i == 0 else 0, 255, n) for i in range(4)]
+        address = octets[0]
+        for octet in octets[1:]:
+            address = np.char.add(np.char.add(address, '.'), octet)
+        return address
+
+    def uuids(self, n: int) -> np.ndarray:
+        # Random (version 4) UUIDs: hex-encode random bytes, then insert the dashes column-wise
+        raw = self.rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+        hex_chars = np.frombuffer(raw.tobytes().hex().encode(), dtype='S1').reshape(n, 32)
+        dash = np.full((n, 1), b'-', dtype='S1')
+        parts = [hex_chars[:, :8], dash, hex_chars[:, 8:12], dash, hex_chars[:, 12:16], dash,
+                 hex_chars[:, 16:20], dash, hex_chars[:, 20:]]
+        return np.ascontiguousarray(np.concatenate(parts, axis=1)).view('S36').ravel().astype(str)
+
+    def dates(self, n: int) -> np.ndarray:
+        days = self.rng.integers(np.datetime64('2015-01-01').astype(int), np.datetime64('2026-01-01').astype(int), n)
+        return np.datetime_as_string(days.astype('datetime64[D]'), unit='D')
+
+    def datetimes(self, n: int) -> np.ndarray:
+        start = np.datetime64('2015-01-01T00:00:00').astype(int)
+        seconds = self.rng.integers(start, np.datetime64('2026-01-01T00:00:00').astype(int), n)
+        return np.datetime_as_string(seconds.astype('datetime64[s]'), unit='s')
+
+    def ssns(self, n: int) -> np.ndarray:
+        area = self._digits(1, 900, n, width=3)
+        group = self._digits(1, 100, n, width=2)
+        serial = self._digits(1, 10000, n, width=4)
+        return np.char.add(np.char.add(np.char.add(np.char.add(area, '-'), group), '-'), serial)
+
+    def phones(self, n: int) -> np.ndarray:
+        area = self._digits(200, 1000, n)
+        exchange = self._digits(200, 1000, n)
+        line = self._digits(0, 10000, n, width=4)
+        return np.char.add(np.char.add(np.char.add(np.char.add(area, '-'), exchange), '-'), line)
+
+_default_engine: Optional[ColumnarFakerEngine] = None
+
+def get_engine(seed: Optional[int] = None) -> ColumnarFakerEngine:
+    """
+    Returns a columnar engine.
+    - Unseeded calls share one engine so value pools are built once per process.
+    - Seeded calls get a fresh engine so output is reproducible for that seed.
+    """
+    global _default_engine
+    if seed is not None:
+        return ColumnarFakerEngine(seed=seed)
+    if _default_engine is None:
+        _default_engine = ColumnarFakerEngine()
+    return _default_engine
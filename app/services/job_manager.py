@@ -0,0 +1,383 @@
+# Service for asynchronous generation jobs
+# Workers generate large datasets into chunked spill files on disk; downloads are resumable (HTTP Range / chunk index)
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from app.services.executor import derive_seed
+from app.services.llm_generator import hybrid_generate_synthetic_data_stream
+from app.services.serializer import SERIALIZERS, get_serializer
+from app.services.stat_engine import SampleModel, fit_sample
+from app.services.validation_plan import compile_plan
+from app.utils.config import Config
+from app.utils.logger import logger
+
+JOB_FORMATS = ('csv', 'json')  # Formats whose chunks concatenate into one valid file
+JOB_ID_RE = re.compile(r'^job_[0-9a-f]{64}$')
+READ_SIZE = 64 * 1024
+
+def job_id_for(
+    columns: List[str],
+    num_rows: int,
+    format: str,
+    seed: Optional[int],
+    chunk_rows: int,
+    sample_rows: Optional[List[List[str]]] = None,
+    type_hints: Optional[Dict[str, str]] = None
+) -> str:
+    """
+    Deterministic job id, so an identical request (uploaded sample, type hints) maps to the same spill directory.
+    """
+    spec = [columns, num_rows, format, seed, chunk_rows]
+    if sample_rows or type_hints:
+        spec += [sample_rows, type_hints]
+    spec = json.dumps(spec, sort_keys=True)
+    return f"job_{hashlib.sha256(spec.encode()).hexdigest()}"
+
+class Job:
+    """
+    One generation job and its spill directory.
+    - Chunk i holds rows [i * chunk_rows, (i + 1) * chunk_rows); a chunk is finished once its
+      file exists (written to .tmp, then renamed).
+    - Only chunk 0 carries the CSV header, so the chunks concatenate into the full file.
+    - manifest.json keeps the spec (including uploaded sample rows) and status so jobs survive a restart.
+    """
+    def __init__(
+        self,
+        job_id: str,
+        directory: str,
+        columns: List[str],
+        num_rows: int,
+        format: str,
+        chunk_rows: int,
+        domain: str = "general",
+        context: str = "",
+        seed: Optional[int] = None,
+        pool_key: Optional[str] = None,
+        sample_rows: Optional[List[List[str]]] = None,
+        type_hints: Optional[Dict[str, str]] = None
+    ):
+        self.id = job_id
+        self.directory = directory
+        self.columns = columns
+        self.num_rows = num_rows
+        self.format = format
+        self.chunk_rows = chunk_rows
+        self.domain = domain
+        self.context = context
+        self.seed = seed
+        self.pool_key = pool_key
+        self.sample_rows = sample_rows
+        self.type_hints = type_hints
+        self._sample_model: Optional[SampleModel] = None
+        self.extension = SERIALIZERS[format].extension
+        self.status = "queued"  # queued, running, done, failed, interrupted
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.rows_done = sum(self.chunk_size(i) for i in self.finished_chunks())
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.num_rows // self.chunk_rows)
+
+    @property
+    def sample_model(self) -> Optional[SampleModel]:
+        # Refitted from the stored sample rows (fitting is deterministic), so resumed jobs match
+        if self._sample_model is None and self.sample_rows:
+            self._sample_model = fit_sample(self.columns, self.sample_rows, Config.STAT_COPULA)
+        return self._sample_model
+
+    def chunk_size(self, index: int) -> int:
+        return min(self.chunk_rows, self.num_rows - index * self.chunk_rows)
+
+    def chunk_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"chunk_{index:05d}.{self.extension}")
+
+    def finished_chunks(self) -> List[int]:
+        return [i for i in range(self.chunk_count) if os.path.exists(self.chunk_path(i))]
+
+    def chunk_sizes(self) -> List[int]:
+        """
+        Byte size of each chunk file (requires a finished job).
+        """
+        return [os.path.getsize(self.chunk_path(i)) for i in range(self.chunk_count)]
+
+    def progress(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "format": self.format,
+            "num_rows": self.num_rows,
+            "rows_done": self.rows_done,
+            "chunks_done": len(self.finished_chunks()),
+            "total_chunks": self.chunk_count,
+            "error": self.error,
+        }
+
+    def save(self):
+        manifest = {
+            "columns": self.columns,
+            "num_rows": self.num_rows,
+            "format": self.format,
+            "chunk_rows": self.chunk_rows,
+            "domain": self.domain,
+            "context": self.context,
+            "seed": self.seed,
+            "pool_key": self.pool_key,
+            "sample_rows": self.sample_rows,
+            "type_hints": self.type_hints,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+        }
+        path = os.path.join(self.directory, "manifest.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def touch(self):
+        # Downloads count as use: the expiry clock restarts from the manifest's mtime
+        path = os.path.join(self.directory, "manifest.json")
+        if os.path.exists(path):
+            os.utime(path)
+
+    @classmethod
+    def load(cls, job_id: str, directory: str) -> "Job":
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+        job = cls(
+            job_id, directory, manifest["columns"], manifest["num_rows"], manifest["format"],
+            manifest["chunk_rows"], manifest["domain"], manifest["context"], manifest["seed"], manifest["pool_key"],
+            manifest.get("sample_rows"), manifest.get("type_hints")
+        )
+        job.created = manifest["created"]
+        job.error = manifest["error"]
+        if len(job.finished_chunks()) == job.chunk_count:
+            job.status = "done"
+        elif manifest["status"] == "failed":
+            job.status = "failed"
+        else:
+            job.status = "interrupted"  # Worker stopped mid-job (e.g., restart); resubmit to resume
+        return job
+
+class JobManager:
+    """
+    Bounded queue of generation jobs served by a fixed number of worker tasks.
+    - submit() raises asyncio.QueueFull when the queue is full (callers answer 503).
+    - Re-submitting a job reuses its finished chunks and only generates the missing ones.
+    - Each chunk is generated, anonymized and serialized like a streamed request, then renamed
+      into place, so an interrupted chunk is simply regenerated; file writes run in a thread.
+    - With a ttl, spill directories of jobs that are not queued or running are deleted once their
+      manifest is older than ttl seconds (downloads refresh it).
+    """
+    def __init__(self, root: str, workers: int = 2, queue_size: int = 16, chunk_rows: int = 100000, ttl: float = 0):
+        self.root = root
+        self.workers = max(1, workers)
+        self.chunk_rows = chunk_rows
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.ttl > 0:
+            self._tasks.append(asyncio.create_task(self._expire_loop()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def expire(self, now: Optional[float] = None) -> List[str]:
+        """
+        Forgets expired jobs and moves their spill directories aside; returns the directories to delete.
+        - Runs on the event loop, so a job cannot be resubmitted halfway through; the (slow) deletion
+          of the returned directories happens in a thread.
+        """
+        now = now or time.time()
+        expired = []
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if name.endswith(".expired"):  # Left over from an interrupted deletion
+                expired.append(directory)
+                continue
+            job = self.jobs.get(name)
+            if not JOB_ID_RE.match(name) or (job is not None and job.status in ("queued", "running")):
+                continue
+            manifest = os.path.join(directory, "manifest.json")
+            try:
+                updated = os.path.getmtime(manifest if os.path.exists(manifest) else directory)
+            except OSError:
+                continue
+            if now - updated < self.ttl:
+                continue
+            self.jobs.pop(name, None)
+            os.rename(directory, f"{directory}.expired")
+            expired.append(f"{directory}.expired")
+        if expired:
+            logger.info(f"Expiring {len(expired)} jobs older than {self.ttl:.0f}s")
+        return expired
+
+    async def _expire_loop(self):
+        while True:
+            await asyncio.sleep(min(self.ttl, 3600))
+            try:
+                for directory in self.expire():
+                    await asyncio.to_thread(shutil.rmtree, directory, True)
+            except Exception as e:
+                logger.error(f"Job expiry failed: {str(e)}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        if not JOB_ID_RE.match(job_id):
+            return None
+        job = self.jobs.get(job_id)
+        if job is None:
+            directory = os.path.join(self.root, job_id)
+            if not os.path.exists(os.path.join(directory, "manifest.json")):
+                return None
+            job = self.jobs[job_id] = Job.load(job_id, directory)
+        return job
+
+    def submit(
+        self,
+        columns: List[str],
+        num_rows: int,
+        format: str,
+        domain: str = "general",
+        context: str = "",
+        seed: Optional[int] = None,
+        pool_key: Optional[str] = None,
+        sample_rows: Optional[List[List[str]]] = None,
+        type_hints: Optional[Dict[str, str]] = None
+    ) -> Job:
+        job_id = job_id_for(columns, num_rows, format, seed, self.chunk_rows, sample_rows, type_hints)
+        job = self.get(job_id)
+        if job is not None and job.status in ("queued", "running", "done"):
+            return job
+        if job is None:
+            directory = os.path.join(self.root, job_id)
+            os.makedirs(directory, exist_ok=True)
+            job = Job(
+                job_id, directory, columns, num_rows, format, self.chunk_rows, domain, context, seed, pool_key,
+                sample_rows, type_hints
+            )
+        job.context = context or job.context
+        if len(job.finished_chunks()) == job.chunk_count:
+            job.status = "done"
+            job.save()
+            self.jobs[job_id] = job
+            return job
+        self._queue.put_nowait(job)  # Raises QueueFull before the job is registered, so a retry can enqueue it
+        self.jobs[job_id] = job
+        job.status = "queued"
+        job.error = None
+        job.save()
+        logger.info(f"Queued job {job.id}: {num_rows} rows in {job.chunk_count} chunks ({job.rows_done} rows reused)")
+        return job
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.save()
+        try:
+            for index in range(job.chunk_count):
+                if not os.path.exists(job.chunk_path(index)):
+                    await self._write_chunk(job, index)
+            job.status = "done"
+            logger.info(f"Job {job.id} finished ({job.num_rows} rows)")
+        except asyncio.CancelledError:
+            job.status = "interrupted"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Job {job.id} failed: {str(e)}")
+        finally:
+            job.save()
+
+    async def _write_chunk(self, job: Job, index: int):
+        # Per-chunk seed keeps a seeded job reproducible no matter which chunks were reused
+        seed = derive_seed(job.seed, index) if job.seed is not None else None
+        serializer = get_serializer(job.format, job.columns, job.type_hints)
+        plan = compile_plan(job.columns, job.type_hints)
+        path = job.chunk_path(index)
+        rows = 0
+        try:
+            with open(f"{path}.tmp", "wb") as f:
+                if index == 0:
+                    await asyncio.to_thread(f.write, serializer.header())
+                batches = hybrid_generate_synthetic_data_stream(
+                    job.chunk_size(index), job.columns, job.domain, job.context, job.format,
+                    seed=seed, pool_key=job.pool_key, sample_model=job.sample_model, type_hints=job.type_hints
+                )
+                async for batch in batches:
+                    serializer.write_batch(plan.anonymize_batch(batch))
+                    await asyncio.to_thread(f.write, serializer.take())
+                    rows += len(batch)
+                    job.rows_done += len(batch)
+                await asyncio.to_thread(f.write, serializer.close())
+            await asyncio.to_thread(os.replace, f"{path}.tmp", path)
+        except BaseException:
+            job.rows_done -= rows
+            if os.path.exists(f"{path}.tmp"):
+                os.remove(f"{path}.tmp")
+            raise
+
+def parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range 'Range: bytes=...' header into an inclusive (start, end).
+    - Returns None when there is no usable header (serve the whole body).
+    - Raises ValueError when the range cannot be satisfied (answer 416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else total - 1
+        else:
+            start = max(0, total - int(last))  # Suffix range: last N bytes
+            end = total - 1
+    except ValueError:
+        return None
+    end = min(end, total - 1)
+    if start > end or start >= total:
+        raise ValueError(f"Range not satisfiable for {total} bytes")
+    return start, end
+
+async def read_range(paths: List[str], sizes: List[int], start: int, end: int) -> AsyncIterator[bytes]:
+    """
+    Streams bytes [start, end] of the concatenation of `paths` (file reads run in the threadpool).
+    """
+    offset = 0
+    for path, size in zip(paths, sizes):
+        if offset + size > start and offset <= end:
+            with open(path, "rb") as f:
+                f.seek(max(0, start - offset))
+                remaining = min(end, offset + size - 1) - max(start, offset) + 1
+                while remaining > 0:
+                    data = await run_in_threadpool(f.read, min(READ_SIZE, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+        offset += size
@@ -3,108 +3,400 @@
 from app.utils.config import Config
 from app.utils.logger import logger
 from faker import Faker
-import google.generativeai as genai
 import csv
 from io import StringIO
-from email_validator import validate_email, EmailNotValidError
-import re
-from typing import List, Dict, AsyncGenerator
+import asyncio
+import random
+from typing import List, Dict, AsyncGenerator, Optional, Tuple
+from app.services.column_classifier import classify_columns, is_private
+from app.services.llm_pipeline import adaptive_chunks, backoff_delay, ordered_pipeline
+from app.services.value_pool import get_value_pools, pool_key_for
+from app.services.validation_plan import compile_plan
+from app.services.executor import BatchExecutor, build_batch
+from app.services.stat_engine import SampleModel
+from app.services.providers import TextModel, create_text_model
+from app.services.admission import is_rate_limited, llm_budget
+from app.services.chunk_controller import chunk_controller, compact_context
+from app.utils.metrics import BATCH_ROWS, LLM_ROWS_PER_CALL, LLM_TOKENS, STAGE_SECONDS
+import time
 
-fake = Faker()
+# Faker for validate_row (building one loads every provider, so it is created on first use)
+fake: Optional[Faker] = None
 
-# Gemini model (preferred)
-if Config.MODEL_PROVIDER == "gemini":
-    model = genai.GenerativeModel("gemini-1.5-flash")
+def get_fake() -> Faker:
+    global fake
+    if fake is None:
+        fake = Faker()
+    return fake
+
+class LLMStats:
+    """
+    Running counters for LLM row delivery.
+    - fill_rate: share of requested rows the model actually returned as valid CSV.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows_requested = 0
+        self.rows_delivered = 0
+        self.rows_dropped = 0  # Malformed lines (wrong field count)
+        self.rows_padded = 0  # Empty fallback rows after refills were exhausted
+
+    @property
+    def fill_rate(self) -> float:
+        return self.rows_delivered / self.rows_requested if self.rows_requested else 1.0
+
+llm_stats = LLMStats()
+
+class IncrementalCSVParser:
+    """
+    Parses CSV text fed in arbitrary chunks (e.g., a streamed LLM response).
+    - Emits rows as soon as their line is complete.
+    - Drops rows with the wrong field count and markdown code fences.
+    - An odd number of quotes in a line that already parses as a whole row of the expected width is a
+      stray quote in a value, not an open quoted field; an open quote spans at most MAX_QUOTED_LINES lines, so a
+      stray quote cannot hold back the rest of the response.
+    """
+    MAX_QUOTED_LINES = 8
+
+    def __init__(self, num_fields: int):
+        self.num_fields = num_fields
+        self.buffer = ''
+        self.record: List[str] = []  # Lines of a row whose quoted field is still open
+        self.dropped = 0
+
+    def feed(self, text: str) -> List[List[str]]:
+        self.buffer += text
+        cut = self.buffer.rfind('\n')
+        if cut < 0:
+            return []
+        complete = self.buffer[:cut + 1]
+        self.buffer = self.buffer[cut + 1:]
+        if not self.record and complete.count('"') % 2 == 0:
+            return self._parse(complete)  # Fast path: balanced quotes
+        rows = []
+        for line in complete.splitlines(keepends=True):
+            if not self.record and line.count('"') % 2 and self._is_whole_row(line):
+                rows.extend(self._parse(line))
+                continue
+            self.record.append(line)
+            if ''.join(self.record).count('"') % 2 == 0:
+                rows.extend(self._parse(''.join(self.record)))
+                self.record = []
+            elif len(self.record) > self.MAX_QUOTED_LINES:
+                # Never closed: a stray quote at the start of a value; parse the lines on their own
+                for held in self.record:
+                    rows.extend(self._parse(held))
+                self.record = []
+        return rows
+
+    def close(self) -> List[List[str]]:
+        rest, self.buffer = ''.join(self.record) + self.buffer, ''
+        self.record = []
+        return self._parse(rest)
+
+    def _is_whole_row(self, line: str) -> bool:
+        # Expected width, and no quoted field runs on past the line end
+        row = next(csv.reader([line]), [])
+        return len(row) == self.num_fields and not any('\n' in field for field in row)
+
+    def _parse(self, text: str) -> List[List[str]]:
+        rows = []
+        for row in csv.reader(StringIO(text)):
+            if not row or not any(field.strip() for field in row) or row[0].lstrip().startswith('```'):
+                continue
+            if len(row) == self.num_fields:
+                rows.append(row)
+            else:
+                self.dropped += 1
+        return rows
+
+# Row-generation model (Gemini preferred; 'stub' for offline benchmarks), built by the app lifespan
+# or on first use so importing this module stays cheap
+model: Optional[TextModel] = None
+
+def get_model() -> TextModel:
+    global model
+    if model is None:
+        model = create_text_model()
+    return model
 
 async def hybrid_generate_synthetic_data_stream(
     num_rows: int, 
     columns: List[str], 
     domain: str, 
     context: str, 
-    format: str
+    format: str,
+    seed: Optional[int] = None,
+    pool_key: Optional[str] = None,
+    sample_model: Optional[SampleModel] = None,
+    type_hints: Optional[Dict[str, str]] = None
 ) -> AsyncGenerator[List[Dict[str, str]], None]:
     """
     Async generator for hybrid data streaming.
-    - Classifies columns: simple (Faker) vs complex (LLM).
+    - Classifies columns: simple (columnar Faker engine, by column name or prompt type hint),
+      statistical (fitted from an uploaded sample, if sample_model is given) and complex (LLM).
     - Generates in batches (10k rows) for large datasets.
-    - Validates each row after generation.
+    - Synthesizes and validates batches in the CPU executor (process pool by default).
+    - Pass seed for reproducible simple-column output.
+    - Pass pool_key (schema hash) to reuse cached LLM rows for the same schema.
+    - Rows per LLM call come from the adaptive chunk controller; the context is compacted once per request.
     - Yields batches of dict rows (for further formatting/anonymization).
     """
-    # Simple fields mapping (Faker for structured data)
-    simple_map = {
-        'name': fake.name,
-        'age': lambda: str(fake.random_int(min=18, max=90)),
-        'city': fake.city,
-        'email': fake.email,
-        'phone': fake.phone_number,
-        # Extend with more mappings as needed
-    }
-
-    # Classify columns (case-insensitive)
-    simple_cols = [col for col in columns if col.lower() in simple_map]
-    complex_cols = [col for col in columns if col not in simple_cols]
+    # Classify columns: the fitted sample wins over generic local generators, except for identity-like
+    # (private) types, which are never derived from uploaded values
+    types = classify_columns(columns, type_hints)
+    stat_cols = [
+        col for col in columns
+        if sample_model is not None and sample_model.supports(col) and not is_private(types[col])
+    ]
+    simple_types = {col: types[col] for col in columns if types[col] is not None and col not in stat_cols}
+    simple_cols = list(simple_types)
+    complex_cols = [col for col in columns if col not in simple_types and col not in stat_cols]
 
     batch_size = 10000  # Batch for large datasets to avoid memory issues
-    for start in range(0, num_rows, batch_size):
-        current_size = min(batch_size, num_rows - start)
-        
-        # Generate simple data with Faker
-        simple_data = [{col: simple_map[col.lower()]() for col in simple_cols} for _ in range(current_size)]
-
-        # Generate complex data with Gemini LLM (async)
-        complex_data = []
-        if complex_cols:
-            llm_prompt = f"Generate {current_size} rows of realistic and diverse values for columns: {', '.join(complex_cols)}\nDomain: {domain}\nSimilar contexts: {context}\nOutput as CSV without header, one row per line."
-            response = await model.generate_content_async(llm_prompt)
-            generated_text = response.text.strip()
-            reader = csv.reader(StringIO(generated_text))
-            complex_data = [dict(zip(complex_cols, row)) for row in reader if len(row) == len(complex_cols)]  # Skip invalid
-
-            # Handle if LLM returns fewer rows
-            while len(complex_data) < current_size:
-                complex_data.append({col: '' for col in complex_cols})  # Fallback, or regenerate batch
-
-        # Combine simple + complex into rows
-        batch = []
-        for i in range(current_size):
-            row = {**simple_data[i], **(complex_data[i] if i < len(complex_data) else {col: '' for col in complex_cols})}
-            validated_row = validate_row(row, columns)  # Sync validation (can make async if heavy)
-            batch.append(validated_row)
-
-        yield batch  # Yield batch for streaming
-
-def validate_row(row: Dict[str, str], columns: List[str]) -> Dict[str, str]:
+
+    # Complex columns: LLM chunks run ahead of the consumer, bounded by LLM_CONCURRENCY
+    complex_stream = None
+    pools = get_value_pools() if pool_key and Config.VALUE_POOL_ENABLED and complex_cols else None
+    if complex_cols:
+        pool_rng = random.Random(seed)
+        context = compact_context(context, Config.LLM_CONTEXT_MAX_CHARS)  # Sent with every call
+        if pools is not None:
+            pool_key = pool_key_for(pool_key, complex_cols)  # Same schema, different LLM columns: separate pools
+
+        async def from_pool(size: int) -> AsyncGenerator[List[Dict[str, str]], None]:
+            rows = pools.sample(pool_key, size, pool_rng)
+            if rows is None:  # Evicted since should_reuse(); fall through to the LLM
+                async for rows in from_llm(size):
+                    yield rows
+            else:
+                yield rows
+
+        async def from_llm(size: int) -> AsyncGenerator[List[Dict[str, str]], None]:
+            async for rows in generate_complex_chunk(size, complex_cols, domain, context, stream=Config.LLM_STREAM):
+                if pools is not None:
+                    pools.add(pool_key, rows)
+                yield rows
+
+        def fetch(size: int):
+            if pools is not None and pools.should_reuse(pool_key, pool_rng):
+                return from_pool(size)
+            return from_llm(size)
+
+        chunk_sizes = adaptive_chunks(num_rows, batch_size, lambda: chunk_controller.rows_per_call(len(complex_cols)))
+        complex_stream = ordered_pipeline(chunk_sizes, fetch, Config.LLM_CONCURRENCY)
+
+    async def pieces() -> AsyncGenerator[tuple, None]:
+        # (size, complex rows) per output batch; in streaming mode, one piece per
+        # LLM delivery so rows go out as soon as the model writes them
+        for start in range(0, num_rows, batch_size):
+            current_size = min(batch_size, num_rows - start)
+            if complex_stream is None:
+                yield current_size, []
+                continue
+            received = 0
+            complex_data = []
+            while received < current_size:
+                rows = await complex_stream.__anext__()
+                received += len(rows)
+                if Config.LLM_STREAM:
+                    yield len(rows), rows
+                else:
+                    complex_data.extend(rows)
+            if complex_data:
+                yield len(complex_data), complex_data
+
+    # CPU-bound synthesis + validation runs off the event loop; at most
+    # EXECUTOR_MAX_PENDING batches are in flight or buffered (backpressure)
+    executor = BatchExecutor(
+        Config.CPU_EXECUTOR,
+        1 if Config.LLM_STREAM else Config.EXECUTOR_MAX_PENDING,
+        Config.EXECUTOR_INLINE_ROWS
+    )
+    try:
+        index = 0
+        async for size, complex_rows in pieces():
+            executor.submit(
+                build_batch, simple_cols, columns, size, complex_rows, seed, index, sample_model, stat_cols, simple_types,
+                type_hints, size=size
+            )
+            index += 1
+            while executor.full() or executor.head_ready():
+                batch = await executor.next()
+                BATCH_ROWS.observe(len(batch))
+                yield batch  # Yield batch for streaming
+        while len(executor):
+            batch = await executor.next()
+            BATCH_ROWS.observe(len(batch))
+            yield batch
+    finally:
+        executor.cancel()
+        if complex_stream is not None:
+            await complex_stream.aclose()  # Cancel in-flight LLM chunks
+        if pools is not None:
+            await asyncio.to_thread(pools.persist, pool_key)  # SQLite write off the event loop
+
+def build_prompt(size: int, complex_cols: List[str], domain: str, context: str) -> str:
+    # Shared part first and the per-call row count last, so every call of a request starts with the
+    # same prefix (eligible for the provider's prompt prefix caching)
+    columns = ', '.join(complex_cols)
+    return (
+        f"Domain: {domain}\nSimilar contexts: {context}\n"
+        f"Output as CSV without header, one row per line, fields in this order: {columns}.\n"
+        f"Generate {size} rows of realistic and diverse values for columns: {columns}"
+    )
+
+async def request_rows(
+    size: int,
+    complex_cols: List[str],
+    domain: str,
+    context: str,
+    stream: bool
+) -> AsyncGenerator[List[Dict[str, str]], None]:
+    """
+    Makes one LLM call and yields parsed rows.
+    - stream=True parses the response incrementally and yields rows while the model is still writing.
+    - Waits for room in the worker-wide LLM token budget first (estimated output tokens).
+    - Records call latency (datagen_stage_seconds{stage="llm_call"}), token usage and rows per call,
+      and reports completed calls to the adaptive chunk controller.
+    """
+    parser = IncrementalCSVParser(len(complex_cols))
+    async with llm_budget.reserve(int(size * len(complex_cols) * chunk_controller.tokens_per_cell)):
+        start = time.perf_counter()
+        response = None
+        parsed = 0
+        failed = False
+        try:
+            if stream:
+                response = await get_model().generate_content_async(build_prompt(size, complex_cols, domain, context), stream=True)
+                async for chunk in response:
+                    rows = parser.feed(chunk.text)
+                    if rows:
+                        parsed += len(rows)
+                        yield [dict(zip(complex_cols, row)) for row in rows]
+            else:
+                response = await get_model().generate_content_async(build_prompt(size, complex_cols, domain, context))
+                rows = parser.feed(response.text)
+                if rows:
+                    parsed += len(rows)
+                    yield [dict(zip(complex_cols, row)) for row in rows]
+            rows = parser.close()
+            if rows:
+                parsed += len(rows)
+                yield [dict(zip(complex_cols, row)) for row in rows]
+        except Exception:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            llm_stats.rows_dropped += parser.dropped
+            STAGE_SECONDS.observe(seconds, stage="llm_call")
+            LLM_ROWS_PER_CALL.observe(parsed)
+            prompt_tokens, output_tokens = record_token_usage(response)
+            if response is not None and not failed:
+                chunk_controller.observe(size, parsed, len(complex_cols), seconds, prompt_tokens, output_tokens)
+
+def record_token_usage(response) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Adds a response's usage metadata (prompt and output tokens) to datagen_llm_tokens_total
+    and returns (prompt tokens, output tokens).
+    - Streamed responses carry the totals once fully consumed; missing metadata is skipped (None).
+    """
+    try:
+        usage = response.usage_metadata
+    except Exception:  # No response (failed call) or an unfinished stream
+        return None, None
+    if usage is None:
+        return None, None
+    counts = []
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage, field, None)
+        if isinstance(count, (int, float)) and count:
+            LLM_TOKENS.inc(count, kind=kind)
+            counts.append(int(count))
+        else:
+            counts.append(None)
+    return counts[0], counts[1]
+
+async def generate_complex_chunk(
+    size: int,
+    complex_cols: List[str],
+    domain: str,
+    context: str,
+    stream: bool = False
+) -> AsyncGenerator[List[Dict[str, str]], None]:
+    """
+    Async generator producing exactly `size` complex-column rows for one chunk.
+    - Short responses re-request only the missing row count (up to LLM_MAX_REFILLS times).
+    - Failed calls are retried with exponential backoff (up to LLM_MAX_RETRIES times).
+    - Rows are padded with empty values only once refills are exhausted.
+    """
+    delivered = 0
+    refills = 0
+    failures = 0
+    while delivered < size:
+        missing = size - delivered
+        llm_stats.calls += 1
+        llm_stats.rows_requested += missing
+        rows_iter = request_rows(missing, complex_cols, domain, context, stream)
+        try:
+            async for rows in rows_iter:
+                rows = rows[:size - delivered]
+                delivered += len(rows)
+                llm_stats.rows_delivered += len(rows)
+                yield rows
+                if delivered >= size:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            llm_stats.errors += 1
+            failures += 1
+            if failures > Config.LLM_MAX_RETRIES:
+                logger.error(f"LLM chunk failed after {failures} attempts: {str(e)}")
+                raise
+            delay = backoff_delay(failures - 1, Config.LLM_RETRY_BACKOFF)
+            if is_rate_limited(e):
+                llm_budget.pause(delay)  # Back off every request, not just this chunk
+            logger.warning(f"LLM call failed ({str(e)}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        finally:
+            await rows_iter.aclose()
+        if delivered < size:
+            refills += 1
+            if refills > Config.LLM_MAX_REFILLS:
+                break
+            logger.info(f"LLM returned {missing - (size - delivered)}/{missing} rows, re-requesting {size - delivered}")
+
+    if delivered < size:
+        llm_stats.rows_padded += size - delivered
+        logger.warning(f"LLM fill rate {llm_stats.fill_rate:.2%}; padding {size - delivered} empty rows")
+        yield [{col: '' for col in complex_cols} for _ in range(size - delivered)]
+
+def validate_row(
+    row: Dict[str, str],
+    columns: List[str],
+    faker: Optional[Faker] = None,
+    type_hints: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
     """
     Validates a single row.
-    - Checks data types, realism (e.g., age range, valid email).
-    - Regenerates invalid fields with Faker.
-    """
-    for col in columns:
-        value = row.get(col, '')
-        col_lower = col.lower()
-        if 'age' in col_lower:
-            try:
-                age = int(value)
-                if not 0 < age < 120:
-                    raise ValueError("Invalid age")
-            except ValueError:
-                row[col] = str(fake.random_int(18, 90))  # Regenerate
-        elif 'email' in col_lower:
-            try:
-                validate_email(value)
-            except EmailNotValidError:
-                row[col] = fake.email()  # Regenerate
-        # Add more validation rules (e.g., phone regex, no PII unless allowed)
-    return row
+    - Checks data types, realism (e.g., age range, valid email, phone, SSN format).
+    - Regenerates invalid fields with Faker (pass a seeded instance for reproducible output).
+    - Columns are typed by name and by the schema's type hints ('contact: email').
+    - Batch callers should use compile_plan(columns, type_hints).validate_batch instead.
+    """
+    return compile_plan(columns, type_hints).validate_batch([row], faker or get_fake())[0]
 
 def anonymize_data(row: Dict[str, str]) -> Dict[str, str]:
     """
-    Anonymizes PII in a row (e.g., emails, names).
+    Anonymizes PII in a row (emails, SSNs, phone numbers).
     - Assumes synthetic data, but applies basic rules.
+    - Batch callers should use compile_plan(columns).anonymize_batch instead.
     """
-    for key, value in row.items():
-        # Replace emails
-        if re.match(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', str(value)):
-            row[key] = 'anonymous@email.com'
-        # Add more rules (e.g., SSN, phones)
-    return row
\ No newline at end of file
+    return compile_plan(list(row)).anonymize_batch([row])[0]
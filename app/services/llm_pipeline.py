@@ -0,0 +1,91 @@
+# Service for pipelined LLM chunk generation
+# Keeps a bounded number of LLM calls in flight and yields their results in order
+import asyncio
+import random
+from collections import deque
+from itertools import islice
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+def plan_chunks(num_rows: int, batch_size: int, chunk_rows: int) -> List[int]:
+    """
+    Splits num_rows into LLM chunk sizes.
+    - Chunks never straddle a batch boundary, so each batch is an exact run of chunks.
+    """
+    return list(adaptive_chunks(num_rows, batch_size, lambda: chunk_rows))
+
+def adaptive_chunks(num_rows: int, batch_size: int, next_rows: Callable[[], int]) -> Iterator[int]:
+    """
+    Lazily splits num_rows into LLM chunk sizes, asking next_rows() for each chunk as it is
+    scheduled (so sizes follow an adaptive controller during the request).
+    - Chunks never straddle a batch boundary.
+    """
+    for start in range(0, num_rows, batch_size):
+        remaining = min(batch_size, num_rows - start)
+        while remaining > 0:
+            size = min(max(1, next_rows()), remaining)
+            yield size
+            remaining -= size
+
+def backoff_delay(attempt: int, base: float) -> float:
+    """
+    Exponential backoff with jitter for the given (zero-based) retry attempt.
+    """
+    return base * (2 ** attempt) * (0.5 + random.random())
+
+_DONE = object()  # Queue sentinel: chunk finished
+
+async def ordered_pipeline(
+    sizes: Iterable[int],
+    fetch: Callable[[int], Union[Awaitable[List[Dict[str, str]]], AsyncIterator[List[Dict[str, str]]]]],
+    concurrency: int,
+    prefetch: Optional[int] = None
+) -> AsyncGenerator[List[Dict[str, str]], None]:
+    """
+    Async generator running fetch(size) for every chunk size with bounded concurrency.
+    - sizes may be a lazy iterator; it is advanced only as chunks are scheduled.
+    - fetch may return an awaitable (whole chunk) or an async iterator (partial row lists).
+    - At most `concurrency` fetches run at once (asyncio semaphore).
+    - Up to `prefetch` chunks (default 2x concurrency) are scheduled ahead of the consumer.
+    - Chunks complete in any order but are yielded in submission order; rows of the
+      head chunk are yielded as soon as they arrive.
+    - Pending chunks are cancelled if the consumer stops early (e.g., client disconnect).
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    window = prefetch or max(1, concurrency) * 2
+
+    async def run(size: int, queue: asyncio.Queue):
+        async with semaphore:
+            try:
+                produced = fetch(size)
+                if hasattr(produced, '__aiter__'):
+                    async for rows in produced:
+                        queue.put_nowait(rows)
+                else:
+                    queue.put_nowait(await produced)
+                queue.put_nowait(_DONE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                queue.put_nowait(e)  # Surfaced to the consumer in order
+
+    def schedule(size: int):
+        queue = asyncio.Queue()
+        return asyncio.create_task(run(size, queue)), queue
+
+    remaining = iter(sizes)
+    pending = deque(schedule(size) for size in islice(remaining, window))
+    try:
+        while pending:
+            item = await pending[0][1].get()
+            if item is _DONE:
+                pending.popleft()
+                next_size = next(remaining, None)
+                if next_size is not None:
+                    pending.append(schedule(next_size))
+                continue
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for task, _ in pending:
+            task.cancel()
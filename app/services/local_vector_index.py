@@ -0,0 +1,127 @@
+# Service for an in-process vector index (drop-in for a Pinecone Index)
+# NumPy matrix of normalized embeddings, persisted as a memory-mapped .npy plus a JSON metadata sidecar
+import json
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from app.utils.logger import logger
+
+class LocalVectorIndex:
+    """
+    Embedded vector index with the subset of the Pinecone Index API the app uses.
+    - upsert(vectors=[(id, embedding, metadata), ...]) and query(vector=..., top_k=..., include_metadata=...).
+    - Embeddings are L2-normalized, so a dot product gives cosine similarity.
+    - query_batch() scores many query vectors with one matrix product.
+    - Loads the saved matrix memory-mapped (read-only) and copies it only on the first write.
+    """
+    def __init__(self, path: Optional[str] = None, dimension: int = 768):
+        self.path = path
+        self.dimension = dimension
+        self.ids: List[str] = []
+        self.metadata: List[dict] = []
+        self.rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        self._size = 0
+        self._lock = threading.Lock()  # Calls arrive through run_in_threadpool
+        if path and os.path.exists(self._matrix_path):
+            self.load()
+
+    @property
+    def _matrix_path(self) -> str:
+        return f"{self.path}.npy"
+
+    @property
+    def _meta_path(self) -> str:
+        return f"{self.path}.meta.json"
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _reserve(self, extra: int):
+        # Grow by doubling; also turns a read-only memmap into a writable array
+        needed = self._size + extra
+        if needed <= self._matrix.shape[0] and self._matrix.flags.writeable:
+            return
+        capacity = max(needed, self._matrix.shape[0] * 2, 1024)
+        grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+    def upsert(self, vectors: List[tuple], **kwargs) -> dict:
+        with self._lock:
+            new = [v for v in vectors if v[0] not in self.rows]
+            self._reserve(len(new))
+            for id, embedding, metadata in vectors:
+                row = self.rows.get(id)
+                if row is None:
+                    row = self._size
+                    self.rows[id] = row
+                    self.ids.append(id)
+                    self.metadata.append(metadata)
+                    self._size += 1
+                else:
+                    self.metadata[row] = metadata
+                self._matrix[row] = self._normalize(np.asarray(embedding, dtype=np.float32))
+        return {"upserted_count": len(vectors)}
+
+    def query_batch(self, vectors, top_k: int = 5, include_metadata: bool = True) -> List[List[dict]]:
+        """
+        Top-k matches for each row of `vectors` (one matrix product for the whole batch).
+        """
+        queries = self._normalize(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        with self._lock:
+            matrix = self._matrix[:self._size]
+            if self._size == 0:
+                return [[] for _ in range(len(queries))]
+            scores = queries @ matrix.T
+            k = min(top_k, self._size)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            results = []
+            for q, candidates in enumerate(top):
+                ordered = candidates[np.argsort(-scores[q, candidates])]
+                results.append([
+                    {
+                        "id": self.ids[row],
+                        "score": float(scores[q, row]),
+                        **({"metadata": self.metadata[row]} if include_metadata else {}),
+                    }
+                    for row in ordered
+                ])
+        return results
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True, **kwargs) -> dict:
+        return {"matches": self.query_batch([vector], top_k, include_metadata)[0]}
+
+    def save(self):
+        """
+        Writes the matrix and metadata sidecar atomically (tmp file + rename).
+        """
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            with open(f"{self._matrix_path}.tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(self._matrix[:self._size]))
+            with open(f"{self._meta_path}.tmp", "w") as f:
+                json.dump({"dimension": self.dimension, "ids": self.ids, "metadata": self.metadata}, f)
+        os.replace(f"{self._matrix_path}.tmp", self._matrix_path)
+        os.replace(f"{self._meta_path}.tmp", self._meta_path)
+        logger.info(f"Saved local vector index ({self._size} vectors) to {self.path}")
+
+    def load(self):
+        with open(self._meta_path) as f:
+            sidecar = json.load(f)
+        with self._lock:
+            self._matrix = np.load(self._matrix_path, mmap_mode="r")
+            self.dimension = sidecar["dimension"]
+            self.ids = sidecar["ids"]
+            self.metadata = sidecar["metadata"]
+            self.rows = {id: row for row, id in enumerate(self.ids)}
+            self._size = len(self.ids)
+        logger.info(f"Loaded local vector index ({self._size} vectors) from {self.path}")
@@ -1,29 +1,155 @@
 # app/services/pinecone_service.py
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Protocol
+from app.utils.config import Config
 from app.utils.logger import logger
-from pinecone import Pinecone
+from app.utils.metrics import stage
+from app.services.local_vector_index import LocalVectorIndex
 from fastapi.concurrency import run_in_threadpool
 
-async def upsert_to_pinecone(index, id: str, embedding: list[float], metadata: dict):
+class VectorIndex(Protocol):
+    """
+    Index interface shared by the Pinecone Index and LocalVectorIndex.
+    """
+    def upsert(self, vectors: List[tuple], **kwargs): ...
+
+    def query(self, vector: list[float], top_k: int, include_metadata: bool, **kwargs): ...
+
+def create_vector_index() -> VectorIndex:
+    """
+    Builds the vector index backend selected by VECTOR_BACKEND.
+    - 'pinecone': pooled Pinecone REST client (default).
+    - 'local': in-process NumPy index persisted at LOCAL_INDEX_PATH (no network).
+    - 'memory': in-process NumPy index that is never persisted (tests and benchmarks).
+    """
+    if Config.VECTOR_BACKEND == "local":
+        return LocalVectorIndex(Config.LOCAL_INDEX_PATH)
+    if Config.VECTOR_BACKEND == "memory":
+        return LocalVectorIndex()
+    from pinecone import Pinecone  # Imported only when the Pinecone backend is used
+    pc = Pinecone(api_key=Config.PINECONE_API_KEY, pool_threads=Config.PINECONE_POOL_THREADS)
+    return pc.Index(Config.PINECONE_INDEX_NAME, pool_threads=Config.PINECONE_POOL_THREADS)
+
+async def upsert_to_pinecone(index: VectorIndex, id: str, embedding: list[float], metadata: dict):
     """
     Async wrapper around synchronous Pinecone upsert using run_in_threadpool.
     """
+    return await upsert_batch_to_pinecone(index, [(id, embedding, metadata)])
+
+async def upsert_batch_to_pinecone(index: VectorIndex, vectors: List[tuple]):
+    """
+    Upserts several (id, embedding, metadata) vectors in one Pinecone request.
+    """
     try:
-        response = await run_in_threadpool(index.upsert, vectors=[(id, embedding, metadata)])
-        logger.info(f"Upserted to Pinecone: {id}")
+        with stage("vector_upsert"):
+            response = await run_in_threadpool(index.upsert, vectors=vectors)
+        logger.info(f"Upserted {len(vectors)} vector(s) to Pinecone")
         return response
     except Exception as e:
         logger.error(f"Pinecone upsert error: {str(e)}")
         raise
 
 
-async def query_pinecone(index, embedding: list[float], top_k: int = 5) -> dict:
+async def query_pinecone(index: VectorIndex, embedding: list[float], top_k: int = 5) -> dict:
     """
     Async wrapper around synchronous Pinecone query using run_in_threadpool.
     """
     try:
-        results = await run_in_threadpool(index.query, vector=embedding, top_k=top_k, include_metadata=True)
+        with stage("vector_query"):
+            results = await run_in_threadpool(index.query, vector=embedding, top_k=top_k, include_metadata=True)
         logger.info("Pinecone query successful.")
         return results
     except Exception as e:
         logger.error(f"Pinecone query error: {str(e)}")
         raise
+
+class PineconeWriteBuffer:
+    """
+    Write-behind buffer that keeps Pinecone upserts off the request path.
+    - Skips IDs already upserted (bounded LRU seen-set; dataset IDs are deterministic schema hashes).
+    - Coalesces pending vectors and upserts them in batches every flush_interval seconds,
+      or as soon as batch_size vectors are waiting.
+    - close() stops the background task and flushes whatever is left (called on shutdown).
+    """
+    def __init__(self, index: VectorIndex, batch_size: int = 100, flush_interval: float = 1.0, max_seen: int = 100000):
+        self.index = index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_seen = max_seen
+        self.pending: Dict[str, tuple] = {}
+        self.seen: "OrderedDict[str, None]" = OrderedDict()
+        self.skipped = 0
+        self.upserted = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def is_known(self, id: str) -> bool:
+        """
+        True if the ID was already upserted or is waiting in the buffer.
+        """
+        if id in self.seen:
+            self.seen.move_to_end(id)
+            return True
+        return id in self.pending
+
+    def add(self, id: str, embedding: list[float], metadata: dict) -> bool:
+        """
+        Queues a vector for upsert; returns False if the ID is already known.
+        """
+        if self.is_known(id):
+            self.skipped += 1
+            return False
+        self.pending[id] = (id, embedding, metadata)
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """
+        Upserts all pending vectors in batches.
+        - A failed batch goes back into the buffer and is retried on the next flush.
+        """
+        while self.pending:
+            ids = list(self.pending)[:self.batch_size]
+            vectors = [self.pending.pop(id) for id in ids]
+            try:
+                await upsert_batch_to_pinecone(self.index, vectors)
+            except asyncio.CancelledError:
+                self._requeue(vectors)  # Upserts are idempotent, so a repeat is harmless
+                raise
+            except Exception:
+                self._requeue(vectors)
+                return
+            self.upserted += len(vectors)
+            for id in ids:
+                self.seen[id] = None
+            while len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+
+    def _requeue(self, vectors: List[tuple]):
+        for vector in vectors:
+            self.pending.setdefault(vector[0], vector)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,156 @@
+# Service for model provider backends
+# TextModel / Embedder interfaces, the Gemini and OpenAI clients, and deterministic offline stubs (MODEL_PROVIDER=stub)
+import asyncio
+import random
+import re
+from typing import AsyncIterator, List, Optional, Protocol
+from app.utils.config import Config
+
+EMBEDDING_DIMENSION = 768  # Matches the Pinecone index
+
+class TextModel(Protocol):
+    """
+    Subset of the Gemini GenerativeModel API the generator uses.
+    - The response has .text (non-streamed) or yields pieces with .text (stream=True);
+      .usage_metadata carries prompt_token_count / candidates_token_count.
+    """
+    async def generate_content_async(self, prompt: str, stream: bool = False): ...
+
+class Embedder(Protocol):
+    """
+    Creates one embedding of EMBEDDING_DIMENSION floats.
+    """
+    async def embed(self, text: str, task_type: str) -> List[float]: ...
+
+class GeminiEmbedder:
+    model = "models/text-embedding-004"
+
+    def __init__(self):
+        import google.generativeai as genai
+        genai.configure(api_key=Config.GEMINI_API_KEY)
+        self.genai = genai
+
+    async def embed(self, text: str, task_type: str) -> List[float]:
+        result = await self.genai.embed_content_async(
+            model=self.model,
+            content=text,
+            task_type=task_type,
+            output_dimensionality=EMBEDDING_DIMENSION  # Match Pinecone
+        )
+        return result['embedding']
+
+class OpenAIEmbedder:
+    model = "text-embedding-3-large"
+
+    def __init__(self):
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+
+    async def embed(self, text: str, task_type: str) -> List[float]:
+        response = await self.client.embeddings.create(
+            model=self.model,
+            input=text,
+            dimensions=EMBEDDING_DIMENSION  # Match Pinecone index dimension
+        )
+        return response.data[0].embedding
+
+class StubUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+class StubResponse:
+    def __init__(self, text: str, usage_metadata: StubUsage):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class StubStream:
+    """
+    Streamed stub response: one piece per CSV line, row_latency seconds apart.
+    """
+    def __init__(self, lines: List[str], usage_metadata: StubUsage, row_latency: float):
+        self.lines = lines
+        self.usage_metadata = usage_metadata
+        self.row_latency = row_latency
+
+    async def __aiter__(self) -> AsyncIterator[StubResponse]:
+        for line in self.lines:
+            if self.row_latency:
+                await asyncio.sleep(self.row_latency)
+            yield StubResponse(line + "\n", self.usage_metadata)
+
+class StubTextModel:
+    """
+    Offline stand-in for the Gemini model: answers the generator's prompts with CSV rows.
+    - latency: seconds before the response (time to first token); row_latency: extra seconds per row.
+    - error_rate: share of calls that raise (exercises retries and backoff).
+    - fill: share of the requested rows returned (exercises refills).
+    - Deterministic for a given seed and call order.
+    """
+    PROMPT_RE = re.compile(r'^Generate (\d+) rows .*?for columns: (.*)$', re.M)
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, seed: int = 0, row_latency: float = 0.0, fill: float = 1.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.row_latency = row_latency
+        self.fill = fill
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        match = self.PROMPT_RE.search(prompt)
+        if match is None:
+            raise ValueError("Stub model only answers row generation prompts")
+        size, columns = int(match.group(1)), match.group(2).split(', ')
+        fail = self.rng.random() < self.error_rate
+        await asyncio.sleep(self.latency)
+        if fail:
+            raise RuntimeError("429 quota (stub)")
+        rows = max(1, int(size * self.fill))
+        lines = [",".join(f'"{col} {self.rng.randrange(10 ** 6)}"' for col in columns) for _ in range(rows)]
+        usage = StubUsage(len(prompt) // 4, sum(len(line) + 1 for line in lines) // 4)  # ~4 chars per token
+        if stream:
+            return StubStream(lines, usage, self.row_latency)
+        if self.row_latency:
+            await asyncio.sleep(self.row_latency * rows)
+        return StubResponse("\n".join(lines), usage)
+
+class StubEmbedder:
+    """
+    Offline embedder: hashed character trigrams (deterministic; similar texts get similar vectors).
+    """
+    model = "trigram-hash"
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.calls = 0
+
+    async def embed(self, text: str, task_type: str) -> List[float]:
+        from app.services.column_classifier import ngram_embedding
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ngram_embedding(text, EMBEDDING_DIMENSION).tolist()
+
+def create_text_model() -> Optional[TextModel]:
+    """
+    Builds the row-generation model selected by MODEL_PROVIDER ('gemini' or 'stub').
+    """
+    if Config.MODEL_PROVIDER == "gemini":
+        import google.generativeai as genai  # Heavy import, deferred until the client is built
+        genai.configure(api_key=Config.GEMINI_API_KEY)
+        return genai.GenerativeModel("gemini-1.5-flash")
+    if Config.MODEL_PROVIDER == "stub":
+        return StubTextModel(Config.STUB_LLM_LATENCY, Config.STUB_LLM_ERROR_RATE, Config.STUB_SEED, Config.STUB_LLM_ROW_LATENCY)
+    return None
+
+def create_embedder() -> Embedder:
+    """
+    Builds the embedder selected by MODEL_PROVIDER ('gemini', 'openai' or 'stub').
+    """
+    if Config.MODEL_PROVIDER == "openai":
+        return OpenAIEmbedder()
+    if Config.MODEL_PROVIDER == "stub":
+        return StubEmbedder(Config.STUB_EMBEDDING_LATENCY)
+    return GeminiEmbedder()
@@ -0,0 +1,385 @@
+# Service for caching and coalescing seeded generation responses
+# Identical in-flight requests share one generation; completed bodies are kept on disk (gzip, LRU) and served as files
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+from fastapi.concurrency import run_in_threadpool
+from app.services.serializer import StreamEncoder, gzip_encoder
+from app.utils.logger import logger
+from app.utils.metrics import REGISTRY
+
+READ_SIZE = 64 * 1024
+ENCODINGS = ('gzip', 'identity')  # Stored encodings (file suffixes)
+
+RESPONSE_CACHE_RESULTS = REGISTRY.counter("datagen_response_cache_total", "Seeded generation requests by cache result", ["result"])
+
+def response_key(
+    columns: List[str],
+    num_rows: int,
+    format: str,
+    seed: int,
+    sample_rows: Optional[List[List[str]]] = None,
+    type_hints: Optional[Dict[str, str]] = None
+) -> str:
+    """
+    Cache key of a seeded request: schema, size, format and seed (plus uploaded sample rows and type hints).
+    """
+    spec = json.dumps([columns, num_rows, format, seed, sample_rows or None, type_hints or None], sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()
+
+def _touch(path: str) -> bool:
+    # Marks a cached body as recently used (mtime keeps the LRU order); False if it is gone
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _remove(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+class ResponseCache:
+    """
+    Size-bounded disk cache of complete response bodies.
+    - Compressible formats are stored gzip-compressed; binary formats (parquet, arrow) as is.
+    - Least recently used entries are evicted first; file mtimes keep the LRU order across restarts.
+    - Bodies are written to a temporary file and renamed in on completion, so only whole bodies are served.
+    - File I/O runs in the threadpool; the entry index is only touched on the event loop.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()  # key -> (encoding, size)
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            key, _, encoding = name.partition('.')
+            path = os.path.join(directory, name)
+            if encoding in ENCODINGS:
+                files.append((os.path.getmtime(path), key, encoding, os.path.getsize(path)))
+            elif '.tmp-' in name:
+                os.remove(path)  # Interrupted write
+        for _, key, encoding, size in sorted(files):
+            self._entries[key] = (encoding, size)
+            self.nbytes += size
+
+    def path(self, key: str, encoding: str) -> str:
+        return os.path.join(self.directory, f"{key}.{encoding}")
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """
+        Returns (path, encoding) of a cached body, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None or not await run_in_threadpool(_touch, self.path(key, entry[0])):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self.path(key, entry[0]), entry[0]
+
+    def writer(self, key: str, compress: bool) -> "CacheWriter":
+        return CacheWriter(self, key, 'gzip' if compress else 'identity')
+
+    async def _commit(self, key: str, encoding: str, tmp_path: str, size: int):
+        if size > self.max_bytes:
+            await run_in_threadpool(_remove, [tmp_path])
+            return
+        await run_in_threadpool(os.replace, tmp_path, self.path(key, encoding))
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous[1]
+        self._entries[key] = (encoding, size)
+        self.nbytes += size
+        evicted_paths = []
+        while self.nbytes > self.max_bytes:
+            evicted, (evicted_encoding, evicted_size) = self._entries.popitem(last=False)
+            evicted_paths.append(self.path(evicted, evicted_encoding))
+            self.nbytes -= evicted_size
+            self.evictions += 1
+        if evicted_paths:
+            await run_in_threadpool(_remove, evicted_paths)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class CacheWriter:
+    """
+    Writes one response body into the cache; commit() publishes it, abort() discards it.
+    - Compression and file writes run in the threadpool, one chunk at a time.
+    """
+    def __init__(self, cache: ResponseCache, key: str, encoding: str):
+        self.cache = cache
+        self.key = key
+        self.encoding = encoding
+        self.tmp_path = f"{cache.path(key, encoding)}.tmp-{uuid.uuid4().hex[:8]}"
+        self.encoder: Optional[StreamEncoder] = gzip_encoder(6) if encoding == 'gzip' else None
+        self.nbytes = 0
+        self._file = None  # Opened by the first write
+
+    def _write(self, data: bytes):
+        if self._file is None:
+            self._file = open(self.tmp_path, "wb")
+        if self.encoder is not None:
+            data = self.encoder.compress(data)
+        self.nbytes += len(data)
+        self._file.write(data)
+
+    def _finish(self):
+        self._write(b'')
+        if self.encoder is not None:
+            tail = self.encoder.finish()
+            self.nbytes += len(tail)
+            self._file.write(tail)
+        self._file.close()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+        _remove([self.tmp_path])
+
+    async def write(self, data: bytes):
+        await run_in_threadpool(self._write, data)
+        if self.nbytes > self.cache.max_bytes:
+            raise OverflowError("Response larger than the cache")
+
+    async def commit(self):
+        await run_in_threadpool(self._finish)
+        await self.cache._commit(self.key, self.encoding, self.tmp_path, self.nbytes)
+
+    async def abort(self):
+        await run_in_threadpool(self._discard)
+
+async def write_through(chunks: AsyncIterator[bytes], writer: CacheWriter) -> AsyncIterator[bytes]:
+    """
+    Passes raw body chunks through while writing them to the cache; the entry is published only
+    if the stream completes (a failed, cancelled or oversized body is discarded).
+    """
+    caching = True
+    try:
+        async for chunk in chunks:
+            if caching:
+                try:
+                    await writer.write(chunk)
+                except (OverflowError, OSError) as e:
+                    logger.warning(f"Not caching response {writer.key[:12]}: {str(e)}")
+                    caching = False
+                    await writer.abort()
+            yield chunk
+    except BaseException:
+        if caching:
+            await asyncio.shield(writer.abort())  # Still removes the temporary file when cancelled
+        raise
+    if caching:
+        await writer.commit()
+
+async def read_gzip(path: str) -> AsyncIterator[bytes]:
+    """
+    Streams a cached gzip body decompressed (for clients that do not accept gzip).
+    """
+    decompressor = zlib.decompressobj(31)
+    with open(path, "rb") as f:
+        while True:
+            data = await run_in_threadpool(f.read, READ_SIZE)
+            if not data:
+                break
+            out = decompressor.decompress(data)
+            if out:
+                yield out
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+class Subscription:
+    """
+    One subscriber's async iterator over a Broadcast.
+    - Registered on creation (not on first read), so chunks cannot be trimmed away before it starts.
+    - Deregistered when exhausted, failed, closed (aclose) or garbage collected, so a subscription
+      that is never iterated (e.g., the client left before the response started) does not pin the
+      broadcast.
+    """
+    def __init__(self, broadcast: "Broadcast"):
+        self.broadcast = broadcast
+        self.token = broadcast._join()
+        self._leave = weakref.finalize(self, broadcast._leave, self.token)
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self.broadcast._next(self.token)
+        except BaseException:  # End of stream, generation error or cancellation
+            self._leave()
+            raise
+
+    async def aclose(self):
+        self._leave()
+
+class Broadcast:
+    """
+    One generation streamed to every identical request that joins while it runs.
+    - The producer task reads the source once; each subscriber starts from the first chunk,
+      so late joiners still receive the whole body.
+    - The producer stops reading the source while the slowest subscriber is more than window_bytes
+      behind, so the generation runs at the pace of its clients.
+    - Once more than max_replay_bytes are buffered, no one else may join and chunks every
+      subscriber has read are dropped; a subscriber more than max_replay_bytes behind is dropped
+      (its next read raises ConnectionAbortedError).
+    - The generation is cancelled when its last subscriber leaves.
+    """
+    def __init__(self, source: AsyncIterator[bytes], max_replay_bytes: int, window_bytes: int = 4 * 1024 * 1024):
+        self.max_replay_bytes = max_replay_bytes
+        self.window_bytes = window_bytes
+        self.chunks: List[bytes] = []
+        self.offset = 0  # Stream index of chunks[0]
+        self.buffered = 0
+        self.produced = 0  # Bytes read from the source so far
+        self.joinable = True
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.positions: Dict[int, Tuple[int, int]] = {}  # Subscriber -> (next chunk index, bytes read)
+        self.dropped: Set[int] = set()
+        self._tokens = itertools.count()
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._produce(source))
+
+    async def _produce(self, source: AsyncIterator[bytes]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self.buffered += len(chunk)
+                self.produced += len(chunk)
+                if self.buffered > self.max_replay_bytes:
+                    self.joinable = False
+                self._drop_lagging()
+                self._trim()
+                self._notify()
+                while self.positions and self._slowest_lag() > self.window_bytes:
+                    await self._changed.wait()  # Set again by every read and every leaving subscriber
+        except asyncio.CancelledError:
+            self.error = ConnectionAbortedError("Shared generation cancelled")
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()  # Cancels in-flight LLM chunks and the executor
+            self.done = True
+            self.joinable = False
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _slowest_lag(self) -> int:
+        return self.produced - min(read for _, read in self.positions.values())
+
+    def _drop_lagging(self):
+        for token, (_, read) in list(self.positions.items()):
+            if self.produced - read > self.max_replay_bytes:
+                del self.positions[token]
+                self.dropped.add(token)
+                logger.warning(f"Dropped a subscriber more than {self.max_replay_bytes} bytes behind a shared generation")
+        if not self.positions and self.dropped:
+            raise ConnectionAbortedError("Every subscriber fell behind the shared generation")
+
+    def _trim(self):
+        if self.joinable or not self.positions:
+            return
+        drop = min(index for index, _ in self.positions.values()) - self.offset
+        if drop > 0:
+            self.buffered -= sum(len(chunk) for chunk in self.chunks[:drop])
+            del self.chunks[:drop]
+            self.offset += drop
+
+    def subscribe(self) -> Subscription:
+        return Subscription(self)
+
+    def _join(self) -> int:
+        token = next(self._tokens)
+        self.positions[token] = (self.offset, self.produced - self.buffered)
+        return token
+
+    def _leave(self, token: int):
+        self.dropped.discard(token)
+        if self.positions.pop(token, None) is None:
+            return
+        if not self.positions and not self.done:
+            self._task.cancel()  # Nobody is listening any more
+        else:
+            self._trim()
+            self._notify()  # The slowest subscriber may have changed
+
+    async def _next(self, token: int) -> bytes:
+        while True:
+            if token in self.dropped:
+                raise ConnectionAbortedError(f"Fell more than {self.max_replay_bytes} bytes behind the shared generation")
+            index, read = self.positions[token]
+            if index < self.offset + len(self.chunks):
+                chunk = self.chunks[index - self.offset]
+                self.positions[token] = (index + 1, read + len(chunk))
+                self._trim()
+                self._notify()
+                return chunk
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                raise StopAsyncIteration
+            await self._changed.wait()
+
+class ResponseCoalescer:
+    """
+    Registry of in-flight shared generations by request key.
+    """
+    def __init__(self, max_replay_bytes: int, window_bytes: int = 4 * 1024 * 1024):
+        self.max_replay_bytes = max_replay_bytes
+        self.window_bytes = window_bytes
+        self._inflight: Dict[str, Broadcast] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def join(self, key: str) -> Optional[Subscription]:
+        """
+        Subscribes to an in-flight generation for `key`, or returns None if there is none to join.
+        """
+        broadcast = self._inflight.get(key)
+        if broadcast is None or not broadcast.joinable:
+            return None
+        return broadcast.subscribe()
+
+    def start(self, key: str, source: Callable[[], AsyncIterator[bytes]]) -> Subscription:
+        """
+        Starts a shared generation from source() and returns the first subscription.
+        """
+        broadcast = Broadcast(source(), self.max_replay_bytes, self.window_bytes)
+        subscription = broadcast.subscribe()
+        self._inflight[key] = broadcast
+        broadcast._task.add_done_callback(lambda _: self._release(key, broadcast))
+        logger.info(f"Started shared generation {key[:12]}")
+        return subscription
+
+    def _release(self, key: str, broadcast: Broadcast):
+        if self._inflight.get(key) is broadcast:
+            del self._inflight[key]
@@ -1,20 +1,139 @@
 # Service to extract schema from file or prompt
-import pandas as pd
+# Uploaded files are read only up to a bounded sample (header + first rows), never in full
+import csv
+import math
 from io import StringIO
+from typing import Dict, List, Optional, Tuple
+from fastapi import UploadFile
 from app.utils.logger import logger
 
+SNIFF_DELIMITERS = ",;\t|"
+MAX_CATEGORIES = 20  # Distinct values up to which a string column is profiled as categorical
+
+async def read_sample(file: UploadFile, max_bytes: int = 256 * 1024) -> str:
+    """
+    Reads at most max_bytes from the start of an upload and decodes them.
+    - Cuts at the last newline (unless the whole file fit) so no partial row is returned.
+    - Memory use is constant regardless of file size.
+    """
+    data = await file.read(max_bytes + 1)
+    truncated = len(data) > max_bytes
+    if truncated:
+        data = data[:max_bytes]
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            raise ValueError(f"Header row longer than {max_bytes} bytes")
+        data = data[:cut + 1]
+    return data.decode("utf-8-sig")
+
+def sniff_dialect(sample: str):
+    """
+    Detects the delimiter/quoting of a CSV sample; falls back to plain comma-separated.
+    """
+    try:
+        return csv.Sniffer().sniff(sample[:64 * 1024], delimiters=SNIFF_DELIMITERS)
+    except csv.Error:
+        return csv.excel
+
+def _parse_number(value: str) -> Optional[float]:
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+def profile_columns(columns: List[str], rows: List[List[str]]) -> Dict[str, dict]:
+    """
+    Per-column statistics from sample rows.
+    - type: 'integer', 'float' or 'string' (empty cells are nulls and ignored).
+    - null_rate and distinct (cardinality) for every column.
+    - min/max/mean for numeric columns; top values with counts for low-cardinality string columns.
+    """
+    profile = {}
+    for i, col in enumerate(columns):
+        values = [row[i].strip() for row in rows]
+        present = [v for v in values if v]
+        column = {
+            "type": "string",
+            "null_rate": round(1 - len(present) / len(values), 4) if values else 0.0,
+            "distinct": len(set(present)),
+        }
+        numbers = [_parse_number(v) for v in present]
+        if present and all(n is not None for n in numbers):
+            is_int = all(n.is_integer() and "." not in v for n, v in zip(numbers, present))
+            column.update({
+                "type": "integer" if is_int else "float",
+                "min": min(numbers),
+                "max": max(numbers),
+                "mean": round(sum(numbers) / len(numbers), 4),
+            })
+        elif present and column["distinct"] <= MAX_CATEGORIES and column["distinct"] < len(present):
+            counts: Dict[str, int] = {}
+            for value in present:
+                counts[value] = counts.get(value, 0) + 1
+            column["categories"] = dict(sorted(counts.items(), key=lambda item: -item[1]))
+        profile[col] = column
+    return profile
+
+def describe_profile(profile: Dict[str, dict]) -> str:
+    """
+    Short text form of a profile for the LLM prompt (value ranges, allowed categories).
+    """
+    hints = []
+    for col, column in profile.items():
+        if "min" in column:
+            hints.append(f"{col}: {column['type']} between {column['min']:g} and {column['max']:g}")
+        elif "categories" in column:
+            hints.append(f"{col}: one of {', '.join(column['categories'])}")
+    return "Observed value ranges: " + "; ".join(hints) if hints else ""
+
+def extract_file_schema(sample: str, max_rows: int = 1000) -> Tuple[str, str, Dict[str, dict], List[List[str]]]:
+    """
+    Extracts schema, description, column profile and sample rows from the start of a CSV file.
+    - Sniffs the dialect, takes the header plus up to max_rows sample rows.
+    - Rows with the wrong field count (e.g., cut by the sample boundary) are skipped.
+    """
+    reader = csv.reader(StringIO(sample), sniff_dialect(sample))
+    header = next(reader, None)
+    columns = [col.strip() for col in header or [] if col.strip()]
+    if not columns or len(columns) != len(header):
+        raise ValueError("File has no usable header row")
+    rows = []
+    for row in reader:
+        if len(row) == len(columns):
+            rows.append(row)
+            if len(rows) >= max_rows:
+                break
+    schema = ", ".join(columns)
+    description = "Sample dataset with columns: " + schema
+    profile = profile_columns(columns, rows)
+    logger.info(f"Extracted schema from file: {schema} ({len(rows)} sample rows profiled)")
+    return schema, description, profile, rows
+
+def clean_prompt(input_data: str) -> str:
+    return input_data.lower().replace(" and ", ", ").replace("for ", "").replace("with ", "").strip(".")
+
+def prompt_type_hints(input_data: str) -> Dict[str, str]:
+    """
+    Type hints from structured prompts ('id: integer, price: decimal'), keyed by extracted column name.
+    """
+    hints = {}
+    for part in clean_prompt(input_data).split(","):
+        field, separator, hint = part.partition(":")
+        field, hint = field.strip(), hint.strip()
+        if separator and field and hint and field != "format":
+            hints[field] = hint
+    return hints
+
 def extract_schema(input_data: str, is_file: bool = True) -> tuple[str, str]:
     """
     Extracts schema (columns) and description from CSV file content or prompt string.
     Handles structured prompts (e.g., 'field: type') and simple lists (e.g., 'Name, Age, City').
+    - For uploads, prefer read_sample + extract_file_schema (bounded memory, column profile).
     """
     try:
         if is_file:
-            df = pd.read_csv(StringIO(input_data))
-            columns = df.columns.tolist()
-            schema = ", ".join(columns)
-            description = "Sample dataset with columns: " + schema
-            logger.info(f"Extracted schema from file: {schema}")
+            schema, description, _, _ = extract_file_schema(input_data)
             return schema, description
 
         # Handle prompt-based input
@@ -23,14 +142,14 @@ def extract_schema(input_data: str, is_file: bool = True) -> tuple[str, str]:
         columns = []
 
         # Clean and normalize prompt
-        cleaned_input = input_data.lower().replace(" and ", ", ").replace("for ", "").replace("with ", "").strip(".")
+        cleaned_input = clean_prompt(input_data)
         
         # Extract columns from prompt (e.g., "Name, Age, City" or "id: integer, name: string")
         if "," in cleaned_input:
-            # Handle simple comma-separated fields
-            columns = [col.strip() for col in cleaned_input.split(",") if col.strip()]
+            # Handle comma-separated fields (type hints are read by prompt_type_hints)
+            parts = [col.strip() for col in cleaned_input.split(",") if col.strip()]
             # Remove any trailing format specification
-            columns = [col for col in columns if not col.startswith("format:")]
+            columns = [part.split(":")[0].strip() for part in parts if not part.startswith("format:")]
         elif ":" in cleaned_input:
             # Handle structured format (e.g., "id: integer, name: string")
             for part in cleaned_input.split(","):
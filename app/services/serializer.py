@@ -0,0 +1,386 @@
+# Service for serializing generated batches into the streamed response body
+# Writes whole batches into a reusable buffer and flushes it in large chunks (optionally compressed)
+import csv
+import importlib.util
+import json
+import time
+import zlib
+from io import StringIO
+from operator import itemgetter
+from typing import AsyncIterator, Callable, Dict, List, Optional, Type
+from app.services.column_classifier import classify_columns
+from app.utils.logger import logger
+from app.utils.metrics import stage
+
+try:
+    import orjson  # Optional fast JSON encoder
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard  # Optional zstd Content-Encoding
+except ImportError:
+    zstandard = None
+
+# Optional columnar formats (parquet, arrow); pyarrow is slow to import, so it is loaded on first use
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+pa = None
+pq = None
+
+def load_pyarrow():
+    global pa, pq
+    if pa is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+    return pa
+
+class BatchSerializer:
+    """
+    Base class for output formats.
+    - header() returns bytes written once before the first batch.
+    - write_batch() appends a batch of dict rows to the internal buffer.
+    - take() returns the buffered bytes and resets the buffer.
+    - close() returns trailing bytes (e.g., a file footer).
+    - compressible: whether a Content-Encoding is worth applying on top.
+    - type_hints: the request's column type hints (only typed formats use them).
+    """
+    media_type = 'application/octet-stream'
+    extension = 'bin'
+    compressible = True
+
+    def __init__(self, columns: List[str], type_hints: Optional[Dict[str, str]] = None):
+        self.columns = columns
+        self.type_hints = type_hints
+
+    def header(self) -> bytes:
+        return b''
+
+    def write_batch(self, batch: List[Dict[str, str]]):
+        raise NotImplementedError
+
+    def buffered(self) -> int:
+        raise NotImplementedError
+
+    def take(self) -> bytes:
+        raise NotImplementedError
+
+    def close(self) -> bytes:
+        return self.take()
+
+class CSVSerializer(BatchSerializer):
+    """
+    CSV with proper quoting (csv.writer); missing values are written as empty fields.
+    """
+    media_type = 'text/csv'
+    extension = 'csv'
+
+    def __init__(self, columns: List[str], type_hints: Optional[Dict[str, str]] = None):
+        super().__init__(columns, type_hints)
+        self._buffer = StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        if len(columns) > 1:
+            self._getter = itemgetter(*columns)
+        else:
+            self._getter = lambda row, col=columns[0]: (row[col],)
+
+    def header(self) -> bytes:
+        self._writer.writerow(self.columns)
+        return self.take()
+
+    def write_batch(self, batch: List[Dict[str, str]]):
+        try:
+            values = list(map(self._getter, batch))  # Fast path: every row has every column
+        except KeyError:
+            values = [[row.get(col, '') for col in self.columns] for row in batch]
+        self._writer.writerows(values)
+
+    def buffered(self) -> int:
+        return self._buffer.tell()
+
+    def take(self) -> bytes:
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+class NDJSONSerializer(BatchSerializer):
+    """
+    Newline-delimited JSON, one object per row; uses orjson when installed.
+    """
+    media_type = 'application/ndjson'
+    extension = 'json'
+
+    def __init__(self, columns: List[str], type_hints: Optional[Dict[str, str]] = None):
+        super().__init__(columns, type_hints)
+        self._parts: List[bytes] = []
+        self._size = 0
+
+    def write_batch(self, batch: List[Dict[str, str]]):
+        if orjson is not None:
+            data = b''.join([orjson.dumps(row) + b'\n' for row in batch])
+        else:
+            data = ''.join([json.dumps(row) + '\n' for row in batch]).encode('utf-8')
+        self._parts.append(data)
+        self._size += len(data)
+
+    def buffered(self) -> int:
+        return self._size
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        return data
+
+class _ByteSink:
+    """
+    Write-only file object that pyarrow writers stream into; drained after each batch.
+    - tell() reports the total bytes written so file offsets (e.g., the Parquet footer) stay correct.
+    """
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._size = 0
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._size += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def buffered(self) -> int:
+        return self._size
+
+    def take(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        return data
+
+# Column type (as classified by classify_columns) -> Arrow type; every other column is a string, including
+# digit-only codes (postcode, phone, id) whose leading zeros must survive
+ARROW_TYPES = {
+    'age': 'int64', 'integer': 'int64', 'quantity': 'int64', 'rating': 'int64', 'year': 'int64', 'salary': 'int64',
+    'float': 'float64', 'price': 'float64', 'percentage': 'float64', 'latitude': 'float64', 'longitude': 'float64',
+}
+
+def to_arrow_array(values: List[str], arrow_type, column: str = ''):
+    """
+    Builds an Arrow array of the given type; empty values become nulls.
+    - A value that does not parse as the column's numeric type is written as null (and logged),
+      since the response is already streaming and its schema cannot change.
+    """
+    if arrow_type == pa.string():
+        return pa.array([None if v is None else str(v) for v in values], type=arrow_type)
+    parse = int if arrow_type == pa.int64() else float
+    parsed = []
+    invalid = 0
+    for value in values:
+        try:
+            parsed.append(parse(value) if value not in ('', None) else None)
+        except (TypeError, ValueError):
+            parsed.append(None)
+            invalid += 1
+    if invalid:
+        logger.warning(f"Wrote {invalid} values of column {column!r} that are not {arrow_type} as null")
+    return pa.array(parsed, type=arrow_type)
+
+class ArrowBatchSerializer(BatchSerializer):
+    """
+    Base for columnar binary formats built on pyarrow.
+    - Column types come from the classifier's type for each column (ARROW_TYPES: int64 for age,
+      float64 for price); everything else, LLM columns included, is a string.
+    - Each batch becomes one Arrow record batch; only one batch is held in memory at a time.
+    """
+    compressible = False  # Already compressed / binary
+
+    def __init__(self, columns: List[str], type_hints: Optional[Dict[str, str]] = None):
+        if not HAS_PYARROW:
+            raise RuntimeError("pyarrow is required for columnar formats (pip install pyarrow)")
+        load_pyarrow()
+        super().__init__(columns, type_hints)
+        types = classify_columns(columns, type_hints)
+        self.arrow_types = {col: getattr(pa, ARROW_TYPES.get(types[col], 'string'))() for col in columns}
+        self.schema = None
+        self._sink = _ByteSink()
+
+    def record_batch(self, batch: List[Dict[str, str]]):
+        values = {col: [row.get(col) for row in batch] for col in self.columns}
+        if self.schema is None:
+            self.schema = pa.schema([(col, self.arrow_types[col]) for col in self.columns])
+            self.open_writer()
+        arrays = [to_arrow_array(values[field.name], field.type, field.name) for field in self.schema]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def open_writer(self):
+        raise NotImplementedError
+
+    def buffered(self) -> int:
+        return self._sink.buffered()
+
+    def take(self) -> bytes:
+        return self._sink.take()
+
+class ParquetSerializer(ArrowBatchSerializer):
+    """
+    Parquet file streamed one row group per batch (zstd-compressed pages).
+    """
+    media_type = 'application/vnd.apache.parquet'
+    extension = 'parquet'
+
+    def open_writer(self):
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression='zstd')
+
+    def write_batch(self, batch: List[Dict[str, str]]):
+        record_batch = self.record_batch(batch)  # Opens the writer on the first batch
+        self._writer.write_batch(record_batch, row_group_size=max(1, len(batch)))
+
+    def close(self) -> bytes:
+        if self.schema is not None:
+            self._writer.close()  # Writes the footer
+        return self.take()
+
+class ArrowStreamSerializer(ArrowBatchSerializer):
+    """
+    Arrow IPC stream, one record batch per generated batch.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    extension = 'arrow'
+
+    def open_writer(self):
+        self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def write_batch(self, batch: List[Dict[str, str]]):
+        record_batch = self.record_batch(batch)  # Opens the writer on the first batch
+        self._writer.write_batch(record_batch)
+
+    def close(self) -> bytes:
+        if self.schema is not None:
+            self._writer.close()  # Writes the end-of-stream marker
+        return self.take()
+
+SERIALIZERS: Dict[str, Type[BatchSerializer]] = {
+    'csv': CSVSerializer,
+    'json': NDJSONSerializer,
+}
+if HAS_PYARROW:
+    SERIALIZERS['parquet'] = ParquetSerializer
+    SERIALIZERS['arrow'] = ArrowStreamSerializer
+
+def register_serializer(format: str, serializer: Type[BatchSerializer]):
+    """
+    Registers an output format (e.g., columnar formats with optional dependencies).
+    """
+    SERIALIZERS[format] = serializer
+
+def get_serializer(format: str, columns: List[str], type_hints: Optional[Dict[str, str]] = None) -> BatchSerializer:
+    return SERIALIZERS[format](columns, type_hints)
+
+class StreamEncoder:
+    """
+    Incremental Content-Encoding compressor.
+    - Each chunk is flushed so the client can decode it as it arrives.
+    """
+    def __init__(self, name: str, compress: Callable[[bytes], bytes], finish: Callable[[], bytes]):
+        self.name = name
+        self.compress = compress
+        self.finish = finish
+
+def gzip_encoder(level: int = 1) -> StreamEncoder:
+    # Low levels by default: streaming favours throughput over ratio
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    return StreamEncoder(
+        'gzip',
+        lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH),
+        compressor.flush
+    )
+
+def zstd_encoder(level: int = 1) -> StreamEncoder:
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return StreamEncoder(
+        'zstd',
+        lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        compressor.flush
+    )
+
+def negotiate_encoding(accept_encoding: str, mode: str = 'auto') -> Optional[StreamEncoder]:
+    """
+    Picks a Content-Encoding from the request's Accept-Encoding header.
+    - mode 'none' disables compression; 'auto' prefers zstd (if installed) over gzip;
+      'gzip'/'zstd' force that encoding when the client accepts it.
+    """
+    if mode == 'none':
+        return None
+    accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+    if mode in ('auto', 'zstd') and 'zstd' in accepted and zstandard is not None:
+        return zstd_encoder()
+    if mode in ('auto', 'gzip') and 'gzip' in accepted:
+        return gzip_encoder()
+    return None
+
+async def stream_serialized(
+    batches: AsyncIterator[List[Dict[str, str]]],
+    serializer: BatchSerializer,
+    chunk_size: int = 64 * 1024,
+    encoder: Optional[StreamEncoder] = None,
+    max_delay: float = 0.25
+) -> AsyncIterator[bytes]:
+    """
+    Async generator turning row batches into response body chunks.
+    - Yields once at least chunk_size bytes are buffered, or max_delay seconds have passed
+      since the last yield (so slow, streamed LLM rows still reach the client promptly).
+    - Applies the Content-Encoding compressor, if any (skipped for binary formats).
+    """
+    if not serializer.compressible:
+        encoder = None
+
+    def encode(data: bytes) -> bytes:
+        return encoder.compress(data) if encoder is not None and data else data
+
+    head = serializer.header()
+    if head:
+        yield encode(head)
+    last_flush = time.monotonic()
+    async for batch in batches:
+        data = b''
+        with stage("serialization"):
+            serializer.write_batch(batch)
+            if serializer.buffered() >= chunk_size or time.monotonic() - last_flush >= max_delay:
+                data = encode(serializer.take())
+                last_flush = time.monotonic()
+        if data:
+            yield data
+    tail = encode(serializer.close())
+    if encoder is not None:
+        tail += encoder.finish()
+    if tail:
+        yield tail
+
+async def encode_stream(chunks: AsyncIterator[bytes], encoder: Optional[StreamEncoder]) -> AsyncIterator[bytes]:
+    """
+    Applies a Content-Encoding compressor to an already serialized body (e.g., one shared by several requests).
+    """
+    async for data in chunks:
+        if encoder is not None:
+            data = encoder.compress(data)
+        if data:
+            yield data
+    if encoder is not None:
+        tail = encoder.finish()
+        if tail:
+            yield tail
@@ -0,0 +1,263 @@
+# Service for statistical generation fitted from an uploaded sample
+# Per-column models (categories, histograms, date ranges, string patterns) sampled with NumPy instead of the LLM
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+
+MAX_CATEGORIES = 50  # Distinct values up to which a column is modeled as categorical
+MIN_CATEGORY_COUNT = 2  # Categories must repeat in the sample (single values are never replayed)
+MAX_HISTOGRAM_BINS = 20
+MAX_TEMPLATES = 20  # Distinct char-class templates a pattern column may have
+MIN_TEMPLATE_COVERAGE = 0.9  # Share of values the kept templates must cover
+MIN_FIXED_SUPPORT = 10  # Values a template needs before its constant characters (e.g., 'CU-') are kept
+CODE_SEPARATORS = set('-_./:#@')  # Literal characters that mark a value as a code ('CU-1234', 'v1.2')
+MAX_LETTER_TEMPLATE_BITS = 1.0  # Letter-only columns are codes only with this little template entropy...
+MIN_LETTER_TEMPLATE_SHARE = 0.8  # ...and this share of values on the most common template ('ABCD')
+DATETIME_FORMATS = ['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%m/%d/%Y', '%d/%m/%Y']
+CHAR_CLASSES = {'A': (ord('A'), 26), 'a': (ord('a'), 26), '9': (ord('0'), 10)}
+EPOCH = datetime(1970, 1, 1)
+
+def _template(value: str) -> str:
+    # 'AB-12x' -> 'AA-99a': letters and digits become their class, everything else is literal
+    return re.sub(r'[a-z]', 'a', re.sub(r'[A-Z]', 'A', re.sub(r'[0-9]', '9', value)))
+
+def _code_like(counts: Dict[str, int]) -> bool:
+    # Codes have digits or separators in every template, or (letters only) one dominant shape;
+    # free text such as names spreads over many word-shaped templates ('Aaaa', 'Aaaaaaa', ...)
+    if all('9' in t or CODE_SEPARATORS & set(t) for t in counts):
+        return True
+    shares = np.array(list(counts.values())) / sum(counts.values())
+    entropy = -float(np.sum(shares * np.log2(shares)))
+    return entropy <= MAX_LETTER_TEMPLATE_BITS and shares.max() >= MIN_LETTER_TEMPLATE_SHARE
+
+def _uniform(n: int, rng: np.random.Generator, u: Optional[np.ndarray]) -> np.ndarray:
+    return rng.random(n) if u is None else u
+
+class ColumnModel:
+    """
+    Base for fitted column models.
+    - sample(n, rng, u) returns n string values; u (uniforms in [0, 1)) drives the draw when given,
+      which is how the copula couples columns.
+    - Empty values are emitted at the sample's null rate.
+    """
+    def __init__(self, null_rate: float):
+        self.null_rate = null_rate
+
+    def draw(self, n: int, rng: np.random.Generator, u: Optional[np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+
+    def sample(self, n: int, rng: np.random.Generator, u: Optional[np.ndarray] = None) -> np.ndarray:
+        values = self.draw(n, rng, u)
+        if self.null_rate:
+            values = np.where(rng.random(n) < self.null_rate, '', values)
+        return values
+
+class CategoricalColumn(ColumnModel):
+    """
+    Frequency table of the sample's (repeating) values.
+    """
+    def __init__(self, null_rate: float, counts: Dict[str, int]):
+        super().__init__(null_rate)
+        self.values = np.array(list(counts), dtype=str)
+        self.cdf = np.cumsum(list(counts.values())) / sum(counts.values())
+
+    def draw(self, n, rng, u):
+        return self.values[np.minimum(np.searchsorted(self.cdf, _uniform(n, rng, u), side='right'), len(self.values) - 1)]
+
+class HistogramColumn(ColumnModel):
+    """
+    Numeric (or datetime, as epoch seconds) histogram, sampled through its inverse CDF.
+    - Integers are rounded; floats keep the sample's decimal places.
+    - Datetimes are formatted back with the sample's format.
+    """
+    def __init__(self, null_rate: float, numbers: np.ndarray, kind: str, decimals: int = 0, fmt: Optional[str] = None):
+        super().__init__(null_rate)
+        self.kind = kind  # 'integer', 'float' or 'datetime'
+        self.decimals = decimals
+        self.fmt = fmt
+        self.low, self.high = float(numbers.min()), float(numbers.max())
+        bins = max(1, min(MAX_HISTOGRAM_BINS, len(np.unique(numbers))))
+        counts, self.edges = np.histogram(numbers, bins=bins)
+        self.cdf = np.concatenate([[0.0], np.cumsum(counts) / counts.sum()])
+
+    def numbers(self, u: np.ndarray) -> np.ndarray:
+        # Piecewise-linear inverse of the histogram CDF
+        return np.interp(u, self.cdf, self.edges)
+
+    def draw(self, n, rng, u):
+        numbers = np.clip(self.numbers(_uniform(n, rng, u)), self.low, self.high)
+        if self.kind == 'integer':
+            return np.rint(numbers).astype(np.int64).astype(str)
+        if self.kind == 'float':
+            return np.char.mod(f'%.{self.decimals}f', numbers)
+        return self.format_datetimes(numbers)
+
+    def format_datetimes(self, seconds: np.ndarray) -> np.ndarray:
+        stamps = seconds.astype('int64').astype('datetime64[s]')
+        if self.fmt == '%Y-%m-%d':
+            return np.datetime_as_string(stamps, unit='D')
+        if self.fmt == '%Y-%m-%dT%H:%M:%S':
+            return np.datetime_as_string(stamps, unit='s')
+        if self.fmt == '%Y-%m-%d %H:%M:%S':
+            return np.char.replace(np.datetime_as_string(stamps, unit='s'), 'T', ' ')
+        return np.array([stamp.item().strftime(self.fmt) for stamp in stamps], dtype=str)
+
+class PatternColumn(ColumnModel):
+    """
+    Char-class templates (e.g., 'AA-9999') weighted by frequency; each class character is filled
+    with a random letter or digit, so no sample value is replayed.
+    - Characters shared by all values of a well-supported template (prefixes like 'CU-') are kept.
+    """
+    def __init__(self, null_rate: float, counts: Dict[str, int], fixed: Dict[str, Dict[int, str]]):
+        super().__init__(null_rate)
+        self.templates = list(counts)
+        self.fixed = fixed
+        self.cdf = np.cumsum(list(counts.values())) / sum(counts.values())
+
+    def draw(self, n, rng, u):
+        choice = np.minimum(np.searchsorted(self.cdf, _uniform(n, rng, u), side='right'), len(self.templates) - 1)
+        values = np.empty(n, dtype=f'<U{max(map(len, self.templates))}')
+        for t, template in enumerate(self.templates):
+            rows = np.flatnonzero(choice == t)
+            if not len(rows):
+                continue
+            fixed = self.fixed.get(template, {})
+            codes = np.empty((len(rows), len(template)), dtype=np.uint32)
+            for position, char in enumerate(template):
+                if char in CHAR_CLASSES and position not in fixed:
+                    start, size = CHAR_CLASSES[char]
+                    codes[:, position] = start + rng.integers(0, size, len(rows))
+                else:
+                    codes[:, position] = ord(fixed.get(position, char))
+            values[rows] = codes.view(f'<U{len(template)}').ravel()
+        return values
+
+def _parse_numbers(values: List[str]) -> Optional[np.ndarray]:
+    try:
+        numbers = np.array([float(v) for v in values])
+    except ValueError:
+        return None
+    return numbers if np.isfinite(numbers).all() else None
+
+def _parse_datetimes(values: List[str]) -> Optional[tuple]:
+    for fmt in DATETIME_FORMATS:
+        try:
+            stamps = [datetime.strptime(v, fmt) for v in values]
+        except ValueError:
+            continue
+        return np.array([(stamp - EPOCH).total_seconds() for stamp in stamps]), fmt
+    return None
+
+def fit_column(values: List[str]) -> Optional[ColumnModel]:
+    """
+    Fits the first model that describes a column's sample values, or None for free text (LLM).
+    - Order: categorical, numeric, datetime, string pattern (code-like values only, see _code_like).
+    """
+    present = [v.strip() for v in values if v.strip()]
+    if not present:
+        return None
+    null_rate = 1 - len(present) / len(values)
+    counts = Counter(present)
+    if len(counts) <= MAX_CATEGORIES and min(counts.values()) >= MIN_CATEGORY_COUNT:
+        return CategoricalColumn(null_rate, dict(counts.most_common()))
+    numbers = _parse_numbers(present)
+    if numbers is not None:
+        if all(n.is_integer() and '.' not in v for n, v in zip(numbers, present)):
+            return HistogramColumn(null_rate, numbers, 'integer')
+        decimals = min(6, max(len(v.partition('.')[2]) for v in present))
+        return HistogramColumn(null_rate, numbers, 'float', decimals=decimals)
+    parsed = _parse_datetimes(present)
+    if parsed is not None:
+        return HistogramColumn(null_rate, parsed[0], 'datetime', fmt=parsed[1])
+    by_template: Dict[str, List[str]] = {}
+    for value in present:
+        by_template.setdefault(_template(value), []).append(value)
+    kept = sorted(by_template.items(), key=lambda item: -len(item[1]))[:MAX_TEMPLATES]
+    if any(' ' in t for t, _ in kept) or sum(len(v) for _, v in kept) < MIN_TEMPLATE_COVERAGE * len(present):
+        return None
+    if not _code_like({t: len(v) for t, v in kept}):
+        return None
+    fixed = {}
+    for template, matches in kept:
+        if len(matches) >= MIN_FIXED_SUPPORT and len(set(matches)) > 1:
+            fixed[template] = {
+                position: matches[0][position] for position, char in enumerate(template)
+                if char in CHAR_CLASSES and all(m[position] == matches[0][position] for m in matches)
+            }
+    return PatternColumn(null_rate, {t: len(v) for t, v in kept}, fixed)
+
+def _cell_number(model: HistogramColumn, cell: str) -> Optional[float]:
+    try:
+        if model.kind == 'datetime':
+            return (datetime.strptime(cell, model.fmt) - EPOCH).total_seconds()
+        return float(cell)
+    except ValueError:
+        return None
+
+def _nearest_correlation(matrix: np.ndarray) -> np.ndarray:
+    # Clip negative eigenvalues so the matrix is a valid covariance, then rescale to unit diagonal
+    eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+    fixed = eigenvectors @ np.diag(np.clip(eigenvalues, 1e-6, None)) @ eigenvectors.T
+    scale = np.sqrt(np.diag(fixed))
+    return fixed / np.outer(scale, scale)
+
+class SampleModel:
+    """
+    Statistical generator fitted from an uploaded sample (third column class next to Faker and the LLM).
+    - supports(col): True if the column was fitted (free-text columns are left to the LLM).
+    - generate(columns, n, rng) returns a dict of column -> list of str, like ColumnarFakerEngine.
+    - With copula=True, numeric and datetime columns keep their pairwise rank correlation
+      (Gaussian copula; uniforms are taken from the ranks of correlated normal draws).
+    """
+    def __init__(self, models: Dict[str, ColumnModel], correlated: List[str], correlation: Optional[np.ndarray]):
+        self.models = models
+        self.correlated = correlated
+        self.correlation = correlation
+
+    def supports(self, column: str) -> bool:
+        return column in self.models
+
+    def generate(self, columns: List[str], n: int, rng: np.random.Generator) -> Dict[str, List[str]]:
+        uniforms: Dict[str, np.ndarray] = {}
+        coupled = [col for col in self.correlated if col in columns]
+        if len(coupled) > 1 and n > 1:
+            idx = [self.correlated.index(col) for col in coupled]
+            normals = rng.multivariate_normal(np.zeros(len(idx)), self.correlation[np.ix_(idx, idx)], size=n)
+            ranks = normals.argsort(axis=0).argsort(axis=0)
+            for j, col in enumerate(coupled):
+                uniforms[col] = (ranks[:, j] + rng.random(n)) / n
+        return {col: self.models[col].sample(n, rng, uniforms.get(col)).tolist() for col in columns}
+
+def fit_sample(columns: List[str], rows: List[List[str]], copula: bool = True) -> Optional[SampleModel]:
+    """
+    Fits a SampleModel from header columns and sample rows; None if nothing could be fitted.
+    """
+    if not rows:
+        return None
+    models = {}
+    for i, col in enumerate(columns):
+        model = fit_column([row[i] for row in rows])
+        if model is not None:
+            models[col] = model
+    if not models:
+        return None
+    correlated = [col for col, model in models.items() if isinstance(model, HistogramColumn)] if copula else []
+    correlation = None
+    if len(correlated) > 1:
+        # Spearman correlation over rows where all correlated columns parse, mapped to the normal scale
+        positions = [columns.index(col) for col in correlated]
+        complete = []
+        for row in rows:
+            numbers = [_cell_number(models[col], row[p].strip()) for col, p in zip(correlated, positions)]
+            if None not in numbers:
+                complete.append(numbers)
+        if len(complete) >= 10:
+            ranks = np.asarray(complete).argsort(axis=0).argsort(axis=0)
+            spearman = np.nan_to_num(np.corrcoef(ranks, rowvar=False))
+            np.fill_diagonal(spearman, 1.0)
+            correlation = _nearest_correlation(2 * np.sin(np.pi * spearman / 6))
+        else:
+            correlated = []
+    return SampleModel(models, correlated if correlation is not None else [], correlation)
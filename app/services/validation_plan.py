@@ -0,0 +1,114 @@
+# Service for per-schema validation and anonymization plans
+# Compiled once per column list, then applied column-wise over whole batches
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from faker import Faker
+from app.services.column_classifier import classify_columns
+
+# Precompiled patterns
+EMAIL_RE = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+ANON_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+PHONE_RE = re.compile(r'\+?[\d\s().-]{7,}(\s*(x|ext\.?)\s*\d+)?', re.IGNORECASE)
+SSN_RE = re.compile(r'\d{3}-\d{2}-\d{4}')
+PHONE_DIGIT_RE = re.compile(r'\d(?=(?:\D*\d){4})')  # Every digit except the last four
+
+def is_valid_age(value: str) -> bool:
+    try:
+        return 0 < int(value) < 120
+    except (TypeError, ValueError):
+        return False
+
+def is_valid_email(value: str) -> bool:
+    """
+    Cheap syntactic check first; only unusual addresses fall back to full (offline) validation.
+    """
+    if EMAIL_RE.fullmatch(value):
+        return True
+    if '@' not in value:
+        return False
+    from email_validator import validate_email, EmailNotValidError  # Loaded on first use (slow import)
+    try:
+        validate_email(value, check_deliverability=False)
+        return True
+    except EmailNotValidError:
+        return False
+
+def is_valid_phone(value: str) -> bool:
+    return PHONE_RE.fullmatch(value) is not None and sum(c.isdigit() for c in value) >= 7
+
+def is_valid_ssn(value: str) -> bool:
+    return SSN_RE.fullmatch(value) is not None
+
+def mask_phone(value: str) -> str:
+    return PHONE_DIGIT_RE.sub('*', value)
+
+# Column type (as classified by classify_columns) -> (validity check, regenerator)
+VALIDATION_RULES: Dict[str, Tuple[Callable[[str], bool], Callable[[Faker], str]]] = {
+    'age': (is_valid_age, lambda faker: str(faker.random_int(18, 90))),
+    'email': (is_valid_email, lambda faker: faker.email()),
+    'phone': (is_valid_phone, lambda faker: faker.phone_number()),
+    'ssn': (is_valid_ssn, lambda faker: faker.ssn()),
+}
+
+class ValidationPlan:
+    """
+    Validation and anonymization steps for one column list.
+    - Column types come from the column classifier, so 'mobile', 'fax', 'userPhone' or 'userAge'
+      are planned like 'phone' and 'age' (and the type hints are honoured the same way).
+    - validators: (column, check, regenerate) only for columns that need checks.
+    - Numeric columns (age) are skipped by the anonymizer.
+    - Phone columns get masked (last four digits kept); any cell that looks like an email
+      or SSN is anonymized.
+    """
+    def __init__(self, columns: List[str], type_hints: Optional[Dict[str, str]] = None):
+        self.columns = list(columns)
+        self.validators: List[Tuple[str, Callable[[str], bool], Callable[[Faker], str]]] = []
+        types = classify_columns(self.columns, type_hints)
+        for col in self.columns:
+            if types[col] in VALIDATION_RULES:
+                check, regenerate = VALIDATION_RULES[types[col]]
+                self.validators.append((col, check, regenerate))
+        self.phone_columns = [col for col in self.columns if types[col] == 'phone']
+        self.scan_columns = [col for col in self.columns if types[col] not in ('age', 'phone')]
+
+    def validate_batch(self, batch: List[Dict[str, str]], faker: Faker) -> List[Dict[str, str]]:
+        """
+        Checks each planned column across the batch; invalid values are regenerated with Faker.
+        """
+        for col, check, regenerate in self.validators:
+            for row in batch:
+                if not check(row.get(col, '')):
+                    row[col] = regenerate(faker)
+        return batch
+
+    def anonymize_batch(self, batch: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Replaces PII column-wise (emails, SSNs, phone numbers).
+        """
+        for col in self.phone_columns:
+            for row in batch:
+                value = row.get(col)
+                if value:
+                    row[col] = mask_phone(str(value))
+        for col in self.scan_columns:
+            for row in batch:
+                value = row.get(col)
+                if not value:
+                    continue
+                value = str(value)
+                if '@' in value and ANON_EMAIL_RE.match(value):
+                    row[col] = 'anonymous@email.com'
+                elif '-' in value and SSN_RE.search(value):
+                    row[col] = SSN_RE.sub('***-**-****', value)
+        return batch
+
+@lru_cache(maxsize=256)
+def _compile(columns: Tuple[str, ...], hints: Tuple[Tuple[str, str], ...]) -> ValidationPlan:
+    return ValidationPlan(list(columns), dict(hints) or None)
+
+def compile_plan(columns: List[str], type_hints: Optional[Dict[str, str]] = None) -> ValidationPlan:
+    """
+    Returns the (memoized) plan for a column list and its type hints.
+    """
+    return _compile(tuple(columns), tuple(sorted((type_hints or {}).items())))
@@ -0,0 +1,163 @@
+# Service for caching LLM-generated complex-column rows per schema
+# Repeat requests sample from the pool instead of paying for new LLM calls
+import hashlib
+import random
+from typing import Dict, List, Optional
+from app.utils.cache import LRUCache, SQLiteCache
+from app.utils.config import Config
+from app.utils.logger import logger
+
+def pool_key_for(schema_key: str, complex_cols: List[str]) -> str:
+    """
+    Pool key of a schema's LLM-generated columns (uploads with the same header can still differ in
+    which columns the LLM writes).
+    """
+    digest = hashlib.sha256(",".join(complex_cols).encode()).hexdigest()[:16]
+    return f"{schema_key}:{digest}"
+
+class ValuePool:
+    """
+    Complex-column rows previously generated for one schema.
+    - Keeps at most max_rows rows (oldest dropped first) and tracks their byte size.
+    """
+    def __init__(self, rows: Optional[List[Dict[str, str]]] = None, max_rows: int = 20000):
+        self.max_rows = max_rows
+        self.rows: List[Dict[str, str]] = []
+        self.nbytes = 0
+        self.dirty = False  # Holds rows not yet written to the disk tier
+        self.extend(rows or [])
+        self.dirty = False
+
+    @staticmethod
+    def row_size(row: Dict[str, str]) -> int:
+        return sum(len(k) + len(str(v)) + 8 for k, v in row.items())
+
+    def extend(self, rows: List[Dict[str, str]]):
+        rows = [row for row in rows if any(row.values())]  # Never pool padded (empty) rows
+        if not rows:
+            return
+        self.rows.extend(rows)
+        self.nbytes += sum(self.row_size(row) for row in rows)
+        overflow = len(self.rows) - self.max_rows
+        if overflow > 0:
+            self.nbytes -= sum(self.row_size(row) for row in self.rows[:overflow])
+            del self.rows[:overflow]
+        self.dirty = True
+
+    def sample(self, n: int, rng: random.Random, recombine: bool = False) -> List[Dict[str, str]]:
+        """
+        Draws n rows with replacement.
+        - recombine=True draws each column from an independent row for more variety
+          (at the cost of cross-column coherence).
+        """
+        if not recombine:
+            return [dict(row) for row in rng.choices(self.rows, k=n)]
+        columns = list(self.rows[0])
+        picks = {col: rng.choices(self.rows, k=n) for col in columns}
+        return [{col: picks[col][i].get(col, '') for col in columns} for i in range(n)]
+
+class ValuePoolCache:
+    """
+    Two-tier cache of ValuePools keyed by schema hash.
+    - Memory tier: byte-bounded LRU.
+    - Disk tier (optional): SQLite file, written when a request finishes (persist).
+    - Counts chunk-level hits (served from pool) and misses (sent to the LLM).
+    """
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 0,
+        min_rows: int = 1000,
+        max_rows: int = 20000,
+        fresh_ratio: float = 0.2,
+        recombine: bool = False
+    ):
+        self.memory = LRUCache(max_bytes, sizer=lambda pool: pool.nbytes)
+        self.disk = SQLiteCache(disk_path, disk_max_bytes) if disk_path else None
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.fresh_ratio = fresh_ratio
+        self.recombine = recombine
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ValuePool]:
+        pool = self.memory.get(key)
+        if pool is None and self.disk is not None:
+            rows = self.disk.get(key)
+            if rows is not None:
+                pool = ValuePool(rows, self.max_rows)
+                self.memory.set(key, pool)
+        return pool
+
+    def should_reuse(self, key: str, rng: random.Random) -> bool:
+        """
+        True if the next chunk should be sampled from the pool.
+        - Needs at least min_rows pooled rows.
+        - A fresh_ratio share of chunks still goes to the LLM to keep the pool diverse.
+        """
+        pool = self.get(key)
+        reuse = pool is not None and len(pool.rows) >= self.min_rows and rng.random() >= self.fresh_ratio
+        if reuse:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return reuse
+
+    def sample(self, key: str, n: int, rng: random.Random) -> Optional[List[Dict[str, str]]]:
+        """
+        Draws n pooled rows, or returns None if the pool is gone (evicted since should_reuse()).
+        """
+        pool = self.get(key)
+        if pool is None or not pool.rows:
+            return None
+        return pool.sample(n, rng, self.recombine)
+
+    def add(self, key: str, rows: List[Dict[str, str]]):
+        pool = self.get(key) or ValuePool(max_rows=self.max_rows)
+        pool.extend(rows)
+        self.memory.set(key, pool)  # Re-set so the LRU picks up the new byte size
+
+    def persist(self, key: str):
+        """
+        Writes the pool to the disk tier if it changed since it was loaded.
+        - Safe to run in a worker thread: it writes a snapshot of the rows.
+        """
+        pool = self.memory.get(key)
+        if self.disk is None or pool is None or not pool.dirty:
+            return
+        pool.dirty = False
+        rows = list(pool.rows)
+        try:
+            self.disk.set(key, rows)
+        except Exception as e:
+            pool.dirty = True
+            logger.error(f"Value pool persist error: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk else None,
+        }
+
+_value_pools: Optional[ValuePoolCache] = None
+
+def get_value_pools() -> ValuePoolCache:
+    """
+    Returns the process-wide value pool cache (built from Config on first use).
+    """
+    global _value_pools
+    if _value_pools is None:
+        _value_pools = ValuePoolCache(
+            max_bytes=Config.VALUE_POOL_MAX_BYTES,
+            disk_path=Config.VALUE_POOL_DB_PATH,
+            disk_max_bytes=Config.VALUE_POOL_DISK_MAX_BYTES,
+            min_rows=Config.VALUE_POOL_MIN_ROWS,
+            max_rows=Config.VALUE_POOL_MAX_ROWS,
+            fresh_ratio=Config.VALUE_POOL_FRESH_RATIO,
+            recombine=Config.VALUE_POOL_RECOMBINE,
+        )
+    return _value_pools
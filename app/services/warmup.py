@@ -0,0 +1,105 @@
+# Service for startup warm-up
+# Loads heavy modules and builds provider clients in the background once the server accepts connections
+import asyncio
+import importlib
+import importlib.util
+import time
+from typing import Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.utils.config import Config
+from app.utils.logger import logger
+
+# Columns whose Faker value pools are built ahead of the first request
+WARM_COLUMNS = ['name', 'email', 'city', 'company', 'job', 'user_name', 'street_address']
+
+def heavy_modules() -> List[str]:
+    """
+    Modules the app imports lazily (on first use) that the warm-up loads ahead of the first request.
+    """
+    modules = ['bleach', 'email_validator']
+    if importlib.util.find_spec('pyarrow') is not None:
+        modules += ['pyarrow', 'pyarrow.parquet']
+    if Config.MODEL_PROVIDER == "gemini":
+        modules.append('google.generativeai')
+    elif Config.MODEL_PROVIDER == "openai":
+        modules.append('openai')
+    return modules
+
+def _import_all(modules: List[str]):
+    for module in modules:
+        importlib.import_module(module)
+
+class Warmup:
+    """
+    Startup warm-up state, reported by GET /ready.
+    - status: 'pending', 'running', 'ready' or 'failed'; steps: seconds per completed step.
+    - Nothing here is required for correctness: a request that arrives first builds what it
+      needs on first use, it just pays the cost itself.
+    - Provider clients are built once by their module getters (get_model, get_embedder), which
+      every request uses.
+    """
+    def __init__(self):
+        self.status = "pending"
+        self.steps: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.started = time.perf_counter()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def start(self, app):
+        """
+        Runs the warm-up as a background task (the server starts accepting connections meanwhile).
+        """
+        self._task = asyncio.create_task(self.run(app))
+
+    async def run(self, app):
+        from app.services.embedding_service import get_embedder
+        from app.services.executor import warm_process_pool
+        from app.services.faker_engine import get_engine
+        from app.services.llm_generator import get_fake, get_model
+
+        def build_providers():
+            get_model()
+            get_embedder()
+
+        def build_faker():
+            get_fake()
+            get_engine().generate(WARM_COLUMNS, 1)
+
+        self.status = "running"
+        try:
+            await self._step("imports", run_in_threadpool(_import_all, heavy_modules()))
+            await self._step("providers", run_in_threadpool(build_providers))
+            await self._step("faker_pools", run_in_threadpool(build_faker))
+            if Config.CPU_EXECUTOR == "process":
+                await self._step("process_pool", warm_process_pool())
+            self.status = "ready"
+            logger.info(f"Warm-up finished in {time.perf_counter() - self.started:.2f}s ({self.steps})")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logger.error(f"Warm-up failed: {str(e)}")
+
+    async def _step(self, name: str, work):
+        start = time.perf_counter()
+        await work
+        self.steps[name] = round(time.perf_counter() - start, 4)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def report(self) -> dict:
+        return {
+            "status": self.status,
+            "steps": self.steps,
+            "error": self.error,
+            "uptime": round(time.perf_counter() - self.started, 3),
+        }
@@ -0,0 +1,169 @@
+# Cache helpers shared by services
+# Byte-bounded in-memory LRU, an optional SQLite tier for persistence, and async single-flight
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+def json_size(value: Any) -> int:
+    """
+    Default size estimate: length of the JSON encoding in bytes.
+    """
+    return len(json.dumps(value))
+
+class LRUCache:
+    """
+    In-memory LRU cache bounded by total byte size.
+    - Entries are sized with `sizer` on every set (re-set an entry after mutating it).
+    - Optional TTL in seconds; expired entries count as misses.
+    - Tracks hits, misses and evictions.
+    """
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None, sizer: Callable[[Any], int] = json_size):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizer = sizer
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[str, tuple[Any, int, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or (self.ttl is not None and time.monotonic() - entry[2] > self.ttl):
+            if entry is not None:
+                self.delete(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, value: Any):
+        self.delete(key)
+        size = self.sizer(value)
+        if size > self.max_bytes:
+            return  # Would evict everything else; never cache it
+        self._data[key] = (value, size, time.monotonic())
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+
+    def delete(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class SQLiteCache:
+    """
+    Persistent JSON-value cache in a local SQLite file.
+    - Bounded by total byte size; least recently accessed entries are evicted first.
+    - Optional TTL in seconds.
+    - Safe to share between threads (single connection behind a lock).
+    """
+    def __init__(self, path: str, max_bytes: int, ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return default
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        encoded = json.dumps(value)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, size, now, now)
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._conn.execute("SELECT key, size FROM cache ORDER BY accessed LIMIT 1").fetchone()
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, nbytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return {
+            "entries": entries,
+            "bytes": nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class SingleFlight:
+    """
+    Collapses concurrent async calls with the same key into one in-flight call.
+    - Every caller awaits the same task; the key is released once it completes.
+    - A cancelled caller does not cancel the shared call for the others.
+    """
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
@@ -5,7 +5,7 @@ import os
 class Config:
     """
     Config class to hold environment variables.
-    - Defaults MODEL_PROVIDER to 'gemini'.
+    - Defaults MODEL_PROVIDER to 'gemini' ('stub' runs offline with deterministic stand-ins, no API keys).
     """
     OPENAI_API_KEY = None
     GEMINI_API_KEY = None
@@ -14,6 +14,82 @@ class Config:
     PINECONE_INDEX_NAME = None
     MODEL_PROVIDER = "gemini"  # Preferred as per requirements
     FINE_TUNED_MODEL = None
+    LLM_CHUNK_ROWS = 500  # Rows requested per LLM call (starting point of adaptive sizing)
+    LLM_ADAPTIVE_CHUNKS = True  # Size LLM calls from observed output tokens, fill rate and latency
+    LLM_MIN_CHUNK_ROWS = 25  # Adaptive sizing bounds (rows per call)
+    LLM_MAX_CHUNK_ROWS = 5000
+    LLM_MAX_OUTPUT_TOKENS = 8192  # Model output limit per call (gemini-1.5-flash)
+    LLM_TARGET_CALL_SECONDS = 30.0  # Calls are kept short enough to finish in about this long
+    LLM_CONTEXT_MAX_CHARS = 2000  # Similar-dataset context sent with each call (deduplicated, then truncated)
+    LLM_CONCURRENCY = 4  # Max LLM calls in flight per request
+    LLM_MAX_RETRIES = 3  # Retries per LLM chunk before failing the stream
+    LLM_RETRY_BACKOFF = 1.0  # Base backoff in seconds (doubles per retry)
+    LLM_MAX_REFILLS = 2  # Re-requests for rows missing from a short LLM response
+    LLM_STREAM = False  # Stream LLM responses and parse rows incrementally
+    LLM_TOKENS_PER_CELL = 8  # Estimated LLM output tokens per complex-column value (until measured)
+    LLM_INFLIGHT_TOKENS = 100000  # Estimated LLM tokens in flight across all requests of a worker (0 = unlimited)
+    LLM_QUEUE_MAX_TOKENS = 2000000  # LLM tokens waiting for the in-flight budget before new requests are shed (503)
+    VALUE_POOL_ENABLED = True  # Reuse LLM rows generated for the same schema
+    VALUE_POOL_MAX_BYTES = 64 * 1024 * 1024  # In-memory tier budget
+    VALUE_POOL_DB_PATH = None  # SQLite file for the on-disk tier (disabled if unset)
+    VALUE_POOL_DISK_MAX_BYTES = 512 * 1024 * 1024  # On-disk tier budget
+    VALUE_POOL_MIN_ROWS = 1000  # Pool size required before sampling instead of calling the LLM
+    VALUE_POOL_MAX_ROWS = 20000  # Rows kept per schema
+    VALUE_POOL_FRESH_RATIO = 0.2  # Share of chunks still sent to the LLM once the pool is warm
+    VALUE_POOL_RECOMBINE = False  # Sample each column independently for more variety
+    EMBEDDING_CACHE_ENABLED = True  # Cache embeddings by (provider, model, task_type, text hash)
+    EMBEDDING_CACHE_MAX_BYTES = 16 * 1024 * 1024  # In-memory tier budget
+    EMBEDDING_CACHE_TTL = 24 * 3600  # Seconds before a cached embedding expires
+    EMBEDDING_CACHE_DB_PATH = None  # SQLite file for the persistent tier (disabled if unset)
+    EMBEDDING_CACHE_DISK_MAX_BYTES = 256 * 1024 * 1024  # Persistent tier budget
+    VECTOR_BACKEND = "pinecone"  # 'pinecone', 'local' (in-process NumPy index) or 'memory' (local, never saved)
+    LOCAL_INDEX_PATH = "data/vector_index"  # Path prefix for the local index (.npy + .meta.json)
+    PINECONE_POOL_THREADS = 4  # Connection pool size for the Pinecone client
+    PINECONE_UPSERT_BATCH_SIZE = 100  # Vectors per batched upsert
+    PINECONE_FLUSH_INTERVAL = 1.0  # Seconds between write-behind flushes
+    STREAM_CHUNK_BYTES = 64 * 1024  # Minimum response chunk size before flushing
+    STREAM_MAX_FLUSH_DELAY = 0.25  # Max seconds buffered output waits before flushing
+    CPU_EXECUTOR = "process"  # 'process' (process pool) or 'inline' (on the event loop)
+    CPU_WORKERS = 0  # Process pool size (0 = one per core)
+    CPU_WORKER_SEED = 0  # Base seed for per-worker Faker instances (worker N uses base + N)
+    EXECUTOR_MAX_PENDING = 2  # Batches in flight or buffered per request
+    EXECUTOR_INLINE_ROWS = 1000  # Batches smaller than this run inline (not worth the IPC)
+    STREAM_COMPRESSION = "auto"  # 'auto', 'gzip', 'zstd' or 'none' (negotiated via Accept-Encoding)
+    MAX_STREAM_ROWS = 1000000  # Largest num_rows served as a single streamed response
+    MAX_JOB_ROWS = 50000000  # Largest num_rows accepted at all (via /api/jobs)
+    JOB_DIR = "data/jobs"  # Spill directory for job chunks and manifests
+    JOB_WORKERS = 2  # Jobs generated concurrently
+    JOB_QUEUE_SIZE = 16  # Jobs waiting for a worker before new ones are rejected
+    JOB_CHUNK_ROWS = 100000  # Rows per spill file (unit of resume and reuse)
+    JOB_TTL_SECONDS = 86400  # Finished jobs are deleted after this long without a download (0 keeps them)
+    RESPONSE_CACHE_ENABLED = True  # Share and cache responses of identical seeded requests
+    RESPONSE_CACHE_DIR = "data/response_cache"  # Cached response bodies (gzip for csv/json)
+    RESPONSE_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Disk budget (least recently used bodies are evicted)
+    COALESCE_MAX_REPLAY_BYTES = 64 * 1024 * 1024  # Body buffered for late joiners of a shared generation
+    COALESCE_WINDOW_BYTES = 4 * 1024 * 1024  # How far a shared generation may run ahead of its slowest client
+    RATE_LIMIT_STORAGE_URI = "memory://"  # Request-count limit storage ('redis://host:6379' shares it across workers and nodes)
+    TRUSTED_PROXIES = ""  # Proxies whose X-Forwarded-For names the client (IPs/CIDRs, '*' for any peer, e.g. on Render)
+    ADMISSION_ENABLED = True  # Charge each client's token bucket by the request's estimated LLM tokens
+    ADMISSION_DB_PATH = None  # SQLite file holding the buckets, shared by all workers on a host (per-process if unset)
+    ADMISSION_RATE = 2000.0  # Estimated tokens per second refilled into each client's bucket
+    ADMISSION_BURST = 500000  # Bucket capacity (larger requests are charged a full bucket)
+    ADMISSION_BASE_COST = 100  # Charged per request on top of its LLM estimate
+    MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # Larger sample files are rejected (before the body is read, if sized)
+    UPLOAD_SAMPLE_BYTES = 256 * 1024  # Bytes read from the start of an upload for schema extraction
+    UPLOAD_SAMPLE_ROWS = 1000  # Sample rows profiled per upload
+    STAT_ENGINE_ENABLED = True  # Generate non-Faker, non-free-text columns from models fitted on the upload
+    STAT_COPULA = True  # Keep pairwise correlation of numeric/datetime columns (Gaussian copula)
+    CLASSIFIER_FUZZY = False  # Match unknown column names to the nearest known synonym (trigram embeddings)
+    CLASSIFIER_FUZZY_THRESHOLD = 0.7  # Minimum cosine similarity for a fuzzy match
+    LOG_LEVEL = "INFO"  # Root log level (DEBUG adds per-stage timings)
+    PAYLOAD_LOG_LEVEL = "INFO"  # Level for prompt/sample/schema log lines (DEBUG keeps payloads out of INFO logs)
+    METRICS_ENABLED = True  # Serve Prometheus metrics on /metrics
+    STARTUP_WARMUP = True  # Load heavy modules and clients in the background after startup (false: before accepting requests)
+    STUB_LLM_LATENCY = 0.05  # MODEL_PROVIDER=stub: seconds before each stub LLM response
+    STUB_LLM_ROW_LATENCY = 0.0  # Extra stub LLM seconds per generated row
+    STUB_LLM_ERROR_RATE = 0.0  # Share of stub LLM calls that fail
+    STUB_EMBEDDING_LATENCY = 0.01  # Seconds per stub embedding
+    STUB_SEED = 0  # Seed for stub LLM output and failures
 
 def load_config():
     """
@@ -29,6 +105,82 @@ def load_config():
     Config.PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
     Config.MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "gemini").lower()
     Config.FINE_TUNED_MODEL = os.getenv("FINE_TUNED_MODEL")
+    Config.LLM_CHUNK_ROWS = int(os.getenv("LLM_CHUNK_ROWS", 500))
+    Config.LLM_ADAPTIVE_CHUNKS = os.getenv("LLM_ADAPTIVE_CHUNKS", "true").lower() == "true"
+    Config.LLM_MIN_CHUNK_ROWS = int(os.getenv("LLM_MIN_CHUNK_ROWS", 25))
+    Config.LLM_MAX_CHUNK_ROWS = int(os.getenv("LLM_MAX_CHUNK_ROWS", 5000))
+    Config.LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", 8192))
+    Config.LLM_TARGET_CALL_SECONDS = float(os.getenv("LLM_TARGET_CALL_SECONDS", 30.0))
+    Config.LLM_CONTEXT_MAX_CHARS = int(os.getenv("LLM_CONTEXT_MAX_CHARS", 2000))
+    Config.LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+    Config.LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+    Config.LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 1.0))
+    Config.LLM_MAX_REFILLS = int(os.getenv("LLM_MAX_REFILLS", 2))
+    Config.LLM_STREAM = os.getenv("LLM_STREAM", "false").lower() == "true"
+    Config.LLM_TOKENS_PER_CELL = int(os.getenv("LLM_TOKENS_PER_CELL", 8))
+    Config.LLM_INFLIGHT_TOKENS = int(os.getenv("LLM_INFLIGHT_TOKENS", 100000))
+    Config.LLM_QUEUE_MAX_TOKENS = int(os.getenv("LLM_QUEUE_MAX_TOKENS", 2000000))
+    Config.VALUE_POOL_ENABLED = os.getenv("VALUE_POOL_ENABLED", "true").lower() == "true"
+    Config.VALUE_POOL_MAX_BYTES = int(os.getenv("VALUE_POOL_MAX_BYTES", 64 * 1024 * 1024))
+    Config.VALUE_POOL_DB_PATH = os.getenv("VALUE_POOL_DB_PATH")
+    Config.VALUE_POOL_DISK_MAX_BYTES = int(os.getenv("VALUE_POOL_DISK_MAX_BYTES", 512 * 1024 * 1024))
+    Config.VALUE_POOL_MIN_ROWS = int(os.getenv("VALUE_POOL_MIN_ROWS", 1000))
+    Config.VALUE_POOL_MAX_ROWS = int(os.getenv("VALUE_POOL_MAX_ROWS", 20000))
+    Config.VALUE_POOL_FRESH_RATIO = float(os.getenv("VALUE_POOL_FRESH_RATIO", 0.2))
+    Config.VALUE_POOL_RECOMBINE = os.getenv("VALUE_POOL_RECOMBINE", "false").lower() == "true"
+    Config.EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    Config.EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+    Config.EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", 24 * 3600))
+    Config.EMBEDDING_CACHE_DB_PATH = os.getenv("EMBEDDING_CACHE_DB_PATH")
+    Config.EMBEDDING_CACHE_DISK_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024))
+    Config.VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+    Config.LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "data/vector_index")
+    Config.PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", 4))
+    Config.PINECONE_UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", 100))
+    Config.PINECONE_FLUSH_INTERVAL = float(os.getenv("PINECONE_FLUSH_INTERVAL", 1.0))
+    Config.STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", 64 * 1024))
+    Config.STREAM_MAX_FLUSH_DELAY = float(os.getenv("STREAM_MAX_FLUSH_DELAY", 0.25))
+    Config.CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", "process").lower()
+    Config.CPU_WORKERS = int(os.getenv("CPU_WORKERS", 0))
+    Config.CPU_WORKER_SEED = int(os.getenv("CPU_WORKER_SEED", 0))
+    Config.EXECUTOR_MAX_PENDING = int(os.getenv("EXECUTOR_MAX_PENDING", 2))
+    Config.EXECUTOR_INLINE_ROWS = int(os.getenv("EXECUTOR_INLINE_ROWS", 1000))
+    Config.STREAM_COMPRESSION = os.getenv("STREAM_COMPRESSION", "auto").lower()
+    Config.MAX_STREAM_ROWS = int(os.getenv("MAX_STREAM_ROWS", 1000000))
+    Config.MAX_JOB_ROWS = int(os.getenv("MAX_JOB_ROWS", 50000000))
+    Config.JOB_DIR = os.getenv("JOB_DIR", "data/jobs")
+    Config.JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+    Config.JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 16))
+    Config.JOB_CHUNK_ROWS = int(os.getenv("JOB_CHUNK_ROWS", 100000))
+    Config.JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 86400))
+    Config.RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    Config.RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "data/response_cache")
+    Config.RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+    Config.COALESCE_MAX_REPLAY_BYTES = int(os.getenv("COALESCE_MAX_REPLAY_BYTES", 64 * 1024 * 1024))
+    Config.COALESCE_WINDOW_BYTES = int(os.getenv("COALESCE_WINDOW_BYTES", 4 * 1024 * 1024))
+    Config.RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+    Config.TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+    Config.ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    Config.ADMISSION_DB_PATH = os.getenv("ADMISSION_DB_PATH")
+    Config.ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", 2000.0))
+    Config.ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", 500000))
+    Config.ADMISSION_BASE_COST = int(os.getenv("ADMISSION_BASE_COST", 100))
+    Config.MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+    Config.UPLOAD_SAMPLE_BYTES = int(os.getenv("UPLOAD_SAMPLE_BYTES", 256 * 1024))
+    Config.UPLOAD_SAMPLE_ROWS = int(os.getenv("UPLOAD_SAMPLE_ROWS", 1000))
+    Config.STAT_ENGINE_ENABLED = os.getenv("STAT_ENGINE_ENABLED", "true").lower() == "true"
+    Config.STAT_COPULA = os.getenv("STAT_COPULA", "true").lower() == "true"
+    Config.CLASSIFIER_FUZZY = os.getenv("CLASSIFIER_FUZZY", "false").lower() == "true"
+    Config.CLASSIFIER_FUZZY_THRESHOLD = float(os.getenv("CLASSIFIER_FUZZY_THRESHOLD", 0.7))
+    Config.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    Config.PAYLOAD_LOG_LEVEL = os.getenv("PAYLOAD_LOG_LEVEL", "INFO").upper()
+    Config.METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    Config.STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+    Config.STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", 0.05))
+    Config.STUB_LLM_ROW_LATENCY = float(os.getenv("STUB_LLM_ROW_LATENCY", 0.0))
+    Config.STUB_LLM_ERROR_RATE = float(os.getenv("STUB_LLM_ERROR_RATE", 0.0))
+    Config.STUB_EMBEDDING_LATENCY = float(os.getenv("STUB_EMBEDDING_LATENCY", 0.01))
+    Config.STUB_SEED = int(os.getenv("STUB_SEED", 0))
     
     # Validation
     if Config.MODEL_PROVIDER == "gemini" and not Config.GEMINI_API_KEY:
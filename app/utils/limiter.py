@@ -1,5 +1,135 @@
 # app/utils/limiter.py (New File)
+# Request-count limits (slowapi) and cost-based token buckets for admission control
+import ipaddress
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from fastapi import Request
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from app.utils.config import Config
 
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+@lru_cache(maxsize=8)
+def _trusted_networks(spec: str) -> Optional[List]:
+    # TRUSTED_PROXIES: comma-separated IPs/CIDRs; '*' trusts any peer (None), '' trusts none ([])
+    if spec.strip() == "*":
+        return None
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+def _is_trusted(address: str, networks: Optional[List]) -> bool:
+    if networks is None:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+def client_address(request: Request) -> str:
+    """
+    Client IP used to key request-count limits and admission buckets.
+    - Behind a reverse proxy (e.g., Render's load balancer) every request arrives from the proxy, so
+      when the peer is in TRUSTED_PROXIES the client is the right-most X-Forwarded-For address that
+      is not itself a trusted proxy (addresses further left can be forged by the client).
+    - Without TRUSTED_PROXIES the peer address is used as is.
+    """
+    peer = get_remote_address(request)
+    if not Config.TRUSTED_PROXIES:
+        return peer
+    networks = _trusted_networks(Config.TRUSTED_PROXIES)
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or not _is_trusted(peer, networks):
+        return peer
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, networks if networks is not None else []):
+            return hop
+    return hops[0] if hops else peer
+
+# Counters live in RATE_LIMIT_STORAGE_URI ('memory://' is per process; 'redis://...' is shared)
+limiter = Limiter(key_func=client_address, storage_uri=Config.RATE_LIMIT_STORAGE_URI)
+
+class TokenBucket:
+    """
+    Per-key token buckets in process memory.
+    - Each key starts full (capacity) and refills at `rate` tokens per second.
+    - acquire(key, cost) takes `cost` tokens, or none if the bucket holds fewer, and returns
+      the seconds until it would (0.0 when admitted).
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+
+    def _take(self, tokens: float, updated: float, now: float, cost: float) -> Tuple[float, float]:
+        # Returns (tokens left, seconds to wait); tokens are only taken when the wait is zero
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens >= cost:
+            return tokens - cost, 0.0
+        return tokens, (cost - tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def acquire(self, key: str, cost: float) -> float:
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens, wait = self._take(tokens, updated, now, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 10000:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now: float):
+        # Buckets idle long enough to be full again are equivalent to absent ones
+        idle = self.capacity / self.rate if self.rate > 0 else float('inf')
+        self._buckets = {key: entry for key, entry in self._buckets.items() if now - entry[1] < idle}
+
+class SQLiteTokenBucket(TokenBucket):
+    """
+    Token buckets in a SQLite file, shared by every worker process on the host.
+    - Each acquire is one IMMEDIATE transaction, so concurrent workers never double-spend a bucket.
+    - Uses wall-clock time, which all processes agree on.
+    """
+    def __init__(self, path: str, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.path = path
+        self._acquires = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def acquire(self, key: str, cost: float) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, wait = self._take(*(row or (self.capacity, now)), now, cost)
+                self._conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+                self._acquires += 1
+                if self._acquires % 1000 == 0 and self.rate > 0:
+                    self._conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.capacity / self.rate,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def create_token_bucket() -> Optional[TokenBucket]:
+    """
+    Builds the admission buckets: shared through ADMISSION_DB_PATH if set, otherwise per process.
+    """
+    if not Config.ADMISSION_ENABLED:
+        return None
+    if Config.ADMISSION_DB_PATH:
+        return SQLiteTokenBucket(Config.ADMISSION_DB_PATH, Config.ADMISSION_RATE, Config.ADMISSION_BURST)
+    return TokenBucket(Config.ADMISSION_RATE, Config.ADMISSION_BURST)
@@ -1,16 +1,30 @@
 # Logger setup
 import logging
+from app.utils.config import Config
+from app.utils.metrics import RequestIdFilter
 
 logger = logging.getLogger(__name__)
 
 def setup_logger():
     """
     Sets up basic logging to stdout.
-    - Level: INFO
+    - Level: LOG_LEVEL (INFO by default)
+    - Every line carries the request ID ('-' outside a request).
     """
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
     logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[logging.StreamHandler()]
+        level=getattr(logging, Config.LOG_LEVEL, logging.INFO),
+        format="%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s",
+        handlers=[handler]
     )
-    logger.info("Logger setup complete.")
\ No newline at end of file
+    logger.info("Logger setup complete.")
+
+def log_payload(message: str, *args):
+    """
+    Logs request payloads (prompts, file samples, schemas) at PAYLOAD_LOG_LEVEL.
+    - Arguments are formatted lazily, so payloads cost nothing when that level is disabled.
+    """
+    level = getattr(logging, Config.PAYLOAD_LOG_LEVEL, logging.INFO)
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args)
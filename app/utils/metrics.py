@@ -0,0 +1,188 @@
+# Metrics and request tracing utilities
+# Prometheus-style counters/histograms (text exposition format) and a per-request ID carried in a context variable
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, List, Sequence, Tuple
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default="-")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROWS_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_metrics_logger = logging.getLogger(__name__)
+
+def _label_text(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()  # Also updated from threadpool workers
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_label_text(self.labelnames, key)} {value:g}" for key, value in self._values.items()]
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with optional labels (Prometheus semantics: le buckets, _sum, _count).
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return state[-1] if state else 0
+
+    def total(self, **labels) -> float:
+        state = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return state[-2] if state else 0.0
+
+    def label_values(self) -> List[Tuple[str, ...]]:
+        return list(self._values)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state):
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {state[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {state[-2]:g}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {state[-1]}")
+        return lines
+
+class Gauge:
+    """
+    Gauge read from a callback at scrape time (e.g., a fill rate or queue depth).
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {float(self.read()):g}"]
+        except Exception as e:
+            _metrics_logger.warning(f"Gauge {self.name} failed: {str(e)}")
+            return []
+
+class MetricsRegistry:
+    """
+    Holds all metrics; render() produces the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("datagen_stage_seconds", "Time spent per pipeline stage", ["stage"])
+TIME_TO_FIRST_BYTE = REGISTRY.histogram("datagen_time_to_first_byte_seconds", "Request start to first response body chunk", ["endpoint"])
+REQUEST_SECONDS = REGISTRY.histogram("datagen_request_seconds", "Request start to last response body chunk", ["endpoint"])
+LLM_TOKENS = REGISTRY.counter("datagen_llm_tokens_total", "LLM tokens used", ["kind"])
+LLM_ROWS_PER_CALL = REGISTRY.histogram("datagen_llm_rows_per_call", "Rows delivered per LLM call", buckets=ROWS_BUCKETS)
+BATCH_ROWS = REGISTRY.histogram("datagen_batch_rows", "Rows per generated output batch", buckets=ROWS_BUCKETS)
+ROWS_TOTAL = REGISTRY.counter("datagen_rows_total", "Rows streamed to clients", ["endpoint"])
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a block into datagen_stage_seconds{stage=name}; also logs the duration at DEBUG with the request ID.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        _metrics_logger.debug(f"Stage {name} took {elapsed * 1000:.1f} ms")
+
+async def track_stream(body: AsyncIterator[bytes], start: float, endpoint: str) -> AsyncIterator[bytes]:
+    """
+    Passes a response body through, recording time to first byte and total duration from `start`.
+    """
+    first = True
+    async for chunk in body:
+        if first and chunk:
+            TIME_TO_FIRST_BYTE.observe(time.perf_counter() - start, endpoint=endpoint)
+            first = False
+        yield chunk
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+class RequestIdFilter(logging.Filter):
+    """
+    Adds the current request ID to every log record (as %(request_id)s).
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
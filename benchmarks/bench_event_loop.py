@@ -0,0 +1,67 @@
+"""
+Benchmark: event-loop responsiveness while large generations run, inline vs process pool
+Run from the repo root: python -m benchmarks.bench_event_loop --rows 200000 --concurrency 4
+Measures the latency of small "probe" requests (10 rows) issued while `concurrency`
+large requests stream on the same event loop.
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+from app.services import executor
+from app.services.llm_generator import hybrid_generate_synthetic_data_stream
+from app.utils.config import Config
+
+COLUMNS = ['name', 'age', 'city', 'email', 'phone']
+
+async def drain(num_rows: int):
+    async for _ in hybrid_generate_synthetic_data_stream(num_rows, COLUMNS, 'general', '', 'csv'):
+        pass
+
+async def probe(latencies: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await drain(10)
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+
+async def ticker(lags: list, stop: asyncio.Event, interval: float = 0.005):
+    # Event-loop lag: how late a short sleep wakes up
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+async def scenario(rows: int, concurrency: int) -> tuple:
+    latencies: list = []
+    lags: list = []
+    stop = asyncio.Event()
+    await drain(10)  # Warm up value pools
+    await drain(Config.EXECUTOR_INLINE_ROWS)  # Warm up the process pool, if used
+    tasks = [asyncio.create_task(probe(latencies, stop)), asyncio.create_task(ticker(lags, stop))]
+    start = time.perf_counter()
+    await asyncio.gather(*(drain(rows) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*tasks)
+    return elapsed, latencies, lags
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"rows={args.rows} x {args.concurrency} concurrent requests")
+    print(f"{'mode':<8} {'total s':>8} {'probe p50 ms':>13} {'probe p99 ms':>13} {'probes':>7} {'loop lag p99 ms':>16}")
+    for mode in ('inline', 'process'):
+        Config.CPU_EXECUTOR = mode
+        elapsed, latencies, lags = asyncio.run(scenario(args.rows, args.concurrency))
+        print(
+            f"{mode:<8} {elapsed:>8.2f} {np.percentile(latencies, 50):>13.1f} {np.percentile(latencies, 99):>13.1f}"
+            f" {len(latencies):>7} {np.percentile(lags, 99):>16.1f}"
+        )
+    executor.shutdown_process_pool()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmark: offline load test through the ASGI app (stub LLM, stub embedder, in-memory vector index)
+Run from the repo root: python -m benchmarks.bench_load --requests 40 --concurrency 8 --output results.json
+Compare against an earlier run: python -m benchmarks.bench_load --compare baseline.json
+Measures rows/sec per pipeline stage, time to first byte, request latency p50/p99 under
+concurrency and peak traced memory per num_rows; results are written as JSON.
+Admission control is off unless ADMISSION_ENABLED=true; --tenants spreads requests over client addresses.
+"""
+import os
+
+# Offline providers must be selected before the app (and Config) is imported
+os.environ.setdefault("MODEL_PROVIDER", "stub")
+os.environ.setdefault("VECTOR_BACKEND", "memory")
+os.environ.setdefault("JOB_DIR", os.path.join("data", "bench_jobs"))
+os.environ.setdefault("ADMISSION_ENABLED", "false")
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import httpx
+import numpy as np
+from app.main import app
+from app.utils.config import Config
+from app.utils.limiter import limiter
+from app.services.chunk_controller import chunk_controller
+from app.utils.metrics import STAGE_SECONDS
+
+PROMPT = "customer_id, name, email, age, city, signup_date, product_review, support_notes"
+
+async def asgi_request(request: httpx.Request, client: str = "127.0.0.1") -> dict:
+    """
+    Sends one request straight to the ASGI app and times the response body as it streams
+    (httpx's ASGITransport would buffer the whole body).
+    """
+    body = request.read()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": request.method,
+        "scheme": "http", "path": request.url.path, "raw_path": request.url.raw_path.split(b"?")[0],
+        "query_string": request.url.query, "root_path": "",
+        "headers": [(key.lower(), value) for key, value in request.headers.raw],
+        "client": (client, 50000), "server": ("testserver", 80),
+    }
+    received = False
+    finished = asyncio.Event()
+    result = {"status": 0, "bytes": 0, "ttfb": None}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            if message.get("body") and result["ttfb"] is None:
+                result["ttfb"] = time.perf_counter() - start
+            result["bytes"] += len(message.get("body", b""))
+            if not message.get("more_body"):
+                finished.set()
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    finished.set()
+    result["latency"] = time.perf_counter() - start
+    return result
+
+def generate_request(num_rows: int, prompt: str = PROMPT, format: str = "csv") -> httpx.Request:
+    return httpx.Request(
+        "POST", "http://testserver/api/generate-dataset",
+        data={"prompt": prompt, "num_rows": str(num_rows), "format": format}
+    )
+
+def percentiles(values: list) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"p50": None, "p99": None, "max": None}
+    return {
+        "p50": round(float(np.percentile(values, 50)), 6),
+        "p99": round(float(np.percentile(values, 99)), 6),
+        "max": round(float(max(values)), 6),
+    }
+
+def stage_snapshot() -> dict:
+    return {labels[0]: (STAGE_SECONDS.count(stage=labels[0]), STAGE_SECONDS.total(stage=labels[0])) for labels in STAGE_SECONDS.label_values()}
+
+async def concurrency_scenario(requests: int, concurrency: int, num_rows: int, unique_schemas: bool, tenants: int = 1) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> dict:
+        prompt = f"{PROMPT}, field_{i}" if unique_schemas else PROMPT  # Unique schemas defeat the caches
+        async with semaphore:
+            return await asgi_request(generate_request(num_rows, prompt), client=f"10.0.0.{i % tenants + 1}")
+
+    before = stage_snapshot()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    after = stage_snapshot()
+    ok = [r for r in results if r["status"] == 200]
+    rows = num_rows * len(ok)
+    stages = {}
+    for name, (count, total) in sorted(after.items()):
+        calls = count - before.get(name, (0, 0.0))[0]
+        seconds = total - before.get(name, (0, 0.0))[1]
+        if calls:
+            stages[name] = {
+                "calls": calls,
+                "seconds": round(seconds, 6),
+                "mean_ms": round(seconds / calls * 1000, 3),
+                "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+            }
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "num_rows": num_rows,
+        "errors": len(results) - len(ok),
+        "statuses": {str(status): sum(r["status"] == status for r in results) for status in sorted({r["status"] for r in results})},
+        "elapsed_s": round(elapsed, 4),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "ttfb_s": percentiles([r["ttfb"] for r in ok]),
+        "latency_s": percentiles([r["latency"] for r in ok]),
+        "stages": stages,
+    }
+
+async def memory_scenario(row_counts: list) -> list:
+    # Peak traced Python allocations of the server process (process-pool workers are not traced)
+    results = []
+    tracemalloc.start()
+    try:
+        for num_rows in row_counts:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            response = await asgi_request(generate_request(num_rows))
+            results.append({"num_rows": num_rows, "status": response["status"], "peak_bytes": tracemalloc.get_traced_memory()[1] - base})
+    finally:
+        tracemalloc.stop()
+    return results
+
+async def run(args) -> dict:
+    async with app.router.lifespan_context(app):
+        await asgi_request(generate_request(Config.EXECUTOR_INLINE_ROWS))  # Warm up caches and the process pool
+        concurrency = await concurrency_scenario(args.requests, args.concurrency, args.rows, args.unique_schemas, args.tenants)
+        memory = await memory_scenario(args.memory_rows) if args.memory_rows else []
+    return {"concurrency": concurrency, "memory": memory}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "num_rows" in item:
+                    flat.update(flatten({k: v for k, v in item.items() if k != "num_rows"}, f"{name}.{item['num_rows']}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns (metric, baseline, current, change) for metrics that got worse by more than `tolerance`.
+    - rows_per_sec is higher-is-better; latencies, durations and bytes are lower-is-better.
+    """
+    regressions = []
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    for name, before in old.items():
+        after = new.get(name)
+        if after is None or not before or ".statuses." in name or name.endswith((".calls", ".requests", ".concurrency", ".num_rows", ".status")):
+            continue
+        change = (after - before) / before
+        worse = -change if name.endswith("rows_per_sec") else change
+        if worse > tolerance:
+            regressions.append((name, before, after, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=2000, help='num_rows per concurrent request')
+    parser.add_argument('--memory-rows', type=int, nargs='*', default=[1000, 10000, 50000])
+    parser.add_argument('--unique-schemas', action='store_true', help='one schema per request (cold caches)')
+    parser.add_argument('--tenants', type=int, default=1, help='client addresses the requests are spread over')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run; exits 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    args = parser.parse_args()
+
+    limiter.enabled = False  # Rate limits would reject the load itself
+    results = asyncio.run(run(args))
+    report = {
+        "benchmark": "bench_load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "cpu_executor": Config.CPU_EXECUTOR,
+            "llm_chunk_rows": Config.LLM_CHUNK_ROWS,
+            "llm_adaptive_chunks": Config.LLM_ADAPTIVE_CHUNKS,
+            "llm_concurrency": Config.LLM_CONCURRENCY,
+            "stub_llm_latency": Config.STUB_LLM_LATENCY,
+            "stub_llm_error_rate": Config.STUB_LLM_ERROR_RATE,
+            "value_pool": Config.VALUE_POOL_ENABLED,
+            "admission": Config.ADMISSION_ENABLED,
+            "llm_inflight_tokens": Config.LLM_INFLIGHT_TOKENS,
+        },
+        "args": vars(args),
+        "results": results,
+        "llm_chunk_controller": chunk_controller.report(),  # Final state (not compared)
+    }
+
+    c = results["concurrency"]
+    print(f"{c['requests']} requests x {c['num_rows']} rows, concurrency {c['concurrency']}: "
+          f"{c['rows_per_sec']:.0f} rows/s, {c['errors']} errors (statuses {c['statuses']})")
+    print(f"  ttfb p50/p99 ms: {c['ttfb_s']['p50'] * 1000:.1f} / {c['ttfb_s']['p99'] * 1000:.1f}")
+    print(f"  latency p50/p99 ms: {c['latency_s']['p50'] * 1000:.1f} / {c['latency_s']['p99'] * 1000:.1f}")
+    print(f"  {'stage':<22} {'calls':>6} {'mean ms':>9} {'rows/s':>12}")
+    for name, s in c["stages"].items():
+        rate = f"{s['rows_per_sec']:.0f}" if s["rows_per_sec"] else "-"
+        print(f"  {name:<22} {s['calls']:>6} {s['mean_ms']:>9.2f} {rate:>12}")
+    print(f"  llm chunk controller: {chunk_controller.report()}")
+    for m in results["memory"]:
+        print(f"  memory peak num_rows={m['num_rows']:<8} {m['peak_bytes'] / 2 ** 20:.1f} MiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:g} -> {after:g} ({change:+.1%})")
+        print(f"{len(regressions)} regression(s) vs {args.compare} (commit {baseline.get('commit') or '?'})")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
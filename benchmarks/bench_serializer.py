@@ -0,0 +1,63 @@
+"""
+Benchmark: batch serializer vs the previous per-row string yield
+Run from the repo root: python -m benchmarks.bench_serializer --rows 200000 --format csv
+(parquet/arrow need pyarrow and are compared against per-row CSV)
+"""
+import argparse
+import asyncio
+import json
+import time
+from app.services.faker_engine import ColumnarFakerEngine
+from app.services.serializer import get_serializer, gzip_encoder, stream_serialized
+
+COLUMNS = ['name', 'age', 'city', 'email', 'phone']
+
+async def batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+async def per_row(rows, format, batch_size):
+    """Previous path: one str per row, one yield (ASGI send) per row."""
+    yield ','.join(COLUMNS) + '\n' if format == 'csv' else ''
+    async for batch in batches(rows, batch_size):
+        for row in batch:
+            if format == 'csv':
+                yield ','.join(str(row.get(col, '')) for col in COLUMNS) + '\n'
+            else:
+                yield json.dumps(row) + '\n'
+
+async def consume(stream):
+    sends, nbytes = 0, 0
+    async for part in stream:
+        await asyncio.sleep(0)  # Stand-in for the per-message cost of an ASGI send
+        sends += 1
+        nbytes += len(part.encode() if isinstance(part, str) else part)
+    return sends, nbytes
+
+def run(label, stream, raw_bytes=None):
+    start = time.perf_counter()
+    sends, nbytes = asyncio.run(consume(stream))
+    elapsed = time.perf_counter() - start
+    raw = raw_bytes or nbytes
+    print(f"{label:<24} {raw / elapsed / 1e6:8.1f} MB/s  sends={sends:<8} bytes={nbytes:,}")
+    return nbytes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--format', choices=['csv', 'json', 'parquet', 'arrow'], default='csv')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--chunk-bytes', type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    data = ColumnarFakerEngine(seed=0).generate(COLUMNS, args.rows)
+    rows = [dict(zip(COLUMNS, values)) for values in zip(*data.values())]
+    print(f"rows={args.rows} format={args.format} (MB/s measured on the baseline's uncompressed bytes)")
+    baseline = args.format if args.format in ('csv', 'json') else 'csv'  # Binary formats compare against CSV
+    raw = run(f'per-row yield ({baseline})', per_row(rows, baseline, args.batch_size))
+    run('batch serializer', stream_serialized(batches(rows, args.batch_size), get_serializer(args.format, COLUMNS), args.chunk_bytes), raw)
+    if get_serializer(args.format, COLUMNS).compressible:
+        run('batch serializer+gzip', stream_serialized(batches(rows, args.batch_size), get_serializer(args.format, COLUMNS), args.chunk_bytes, gzip_encoder()), raw)
+
+if __name__ == '__main__':
+    main()
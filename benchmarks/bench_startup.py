@@ -0,0 +1,106 @@
+"""
+Benchmark: cold-start cost of the app, module by module
+Run from the repo root: python -m benchmarks.bench_startup --runs 5 --output startup.json
+Each run is a fresh interpreter: `python -X importtime -c "import app.main"` gives the import
+cost per module, and a second interpreter times import -> lifespan startup -> warm-up ready.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import numpy as np
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+READY_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def main():
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        while app.state.warmup.status in ("pending", "running"):
+            await asyncio.sleep(0.01)
+        print(json.dumps({
+            "import_s": imported - start,
+            "startup_s": started - imported,
+            "ready_s": time.perf_counter() - start,
+            "warmup": app.state.warmup.report(),
+        }))
+
+if __name__ == "__main__":
+    asyncio.run(main())
+"""
+
+def environment(provider: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("MODEL_PROVIDER", provider)
+    env.setdefault("VECTOR_BACKEND", "memory")
+    env.setdefault("GEMINI_API_KEY", "bench")  # Clients are built but never called
+    env.setdefault("OPENAI_API_KEY", "bench")
+    env.setdefault("JOB_DIR", os.path.join("data", "bench_jobs"))
+    return env
+
+def import_times(env: dict) -> dict:
+    """
+    Cumulative import microseconds of app modules and of each top-level third-party package.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, name = int(match.group(2)), match.group(4)
+        top = name.split('.')[0]
+        if name.startswith('app.') or name == 'app':
+            times[name] = cumulative
+        elif '.' not in name and top not in sys.stdlib_module_names:
+            times[name] = max(times.get(name, 0), cumulative)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--provider', default='gemini', help="MODEL_PROVIDER for the measured app ('gemini', 'openai' or 'stub')")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    args = parser.parse_args()
+
+    env = environment(args.provider)
+    runs = [import_times(env) for _ in range(args.runs)]
+    modules = {name: float(np.median([run.get(name, 0) for run in runs])) / 1000 for name in runs[0]}
+    ready = [
+        json.loads(subprocess.run([sys.executable, "-c", READY_SCRIPT], env=env, capture_output=True, text=True, check=True).stdout.splitlines()[-1])
+        for _ in range(args.runs)
+    ]
+    summary = {key: round(float(np.median([r[key] for r in ready])), 4) for key in ("import_s", "startup_s", "ready_s")}
+
+    print(f"provider={env['MODEL_PROVIDER']} runs={args.runs} (medians)")
+    print(f"import app.main {summary['import_s'] * 1000:.0f} ms, lifespan startup {summary['startup_s'] * 1000:.0f} ms, "
+          f"warm-up ready after {summary['ready_s'] * 1000:.0f} ms")
+    print(f"warm-up steps: {ready[-1]['warmup']['steps']}")
+    print(f"{'module':<40} {'cumulative ms':>14}")
+    for name, ms in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40} {ms:>14.1f}")
+
+    if args.output:
+        report = {
+            "benchmark": "bench_startup",
+            "provider": env['MODEL_PROVIDER'],
+            "runs": args.runs,
+            "results": {**summary, "warmup_steps": ready[-1]['warmup']['steps'], "modules_ms": modules},
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == '__main__':
+    main()
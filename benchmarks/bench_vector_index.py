@@ -0,0 +1,43 @@
+"""
+Benchmark: LocalVectorIndex query latency vs index size
+Run from the repo root: python -m benchmarks.bench_vector_index --max-size 1000000
+Note: 1M x 768 float32 vectors need ~3 GB of RAM.
+"""
+import argparse
+import time
+import numpy as np
+from app.services.local_vector_index import LocalVectorIndex
+
+def build_index(size: int, dimension: int, rng: np.random.Generator) -> LocalVectorIndex:
+    index = LocalVectorIndex(dimension=dimension)
+    for start in range(0, size, 50000):
+        block = rng.standard_normal((min(50000, size - start), dimension), dtype=np.float32)
+        index.upsert([(f"v{start + i}", row, {"description": f"vector {start + i}"}) for i, row in enumerate(block)])
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-size', type=int, default=100000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    sizes = [s for s in (1000, 10000, 100000, 1000000) if s <= args.max_size]
+    print(f"{'size':>9} {'single p50 ms':>14} {'single p99 ms':>14} {'batched ms/query':>17}")
+    for size in sizes:
+        index = build_index(size, args.dimension, rng)
+        queries = rng.standard_normal((args.queries, args.dimension), dtype=np.float32)
+        latencies = []
+        for q in queries:
+            start = time.perf_counter()
+            index.query(vector=q, top_k=args.top_k, include_metadata=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        index.query_batch(queries, top_k=args.top_k)
+        batched = (time.perf_counter() - start) * 1000 / args.queries
+        print(f"{size:>9} {np.percentile(latencies, 50):>14.3f} {np.percentile(latencies, 99):>14.3f} {batched:>17.3f}")
+
+if __name__ == '__main__':
+    main()
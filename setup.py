@@ -20,6 +20,10 @@ setup(
         'email-validator',
         'bleach',
     ],
+    extras_require={  # Optional accelerators, picked up automatically when installed
+        'fast': ['orjson', 'zstandard'],
+        'columnar': ['pyarrow'],  # parquet and arrow output formats
+    },
     entry_points={  # Console script entry points
         'console_scripts': [
             'run-app = app.main:run',  # Allows running 'run-app' from command line
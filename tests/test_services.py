@@ -1,9 +1,1111 @@
+import asyncio
+import csv
+import gc
+import gzip
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+
+from app.services.admission import LLMBudget, estimate_llm_tokens, is_rate_limited
+from app.services.column_classifier import COLUMN_TYPES, HINT_TYPES, _classify, classify_column, classify_columns
+from app.services.executor import BatchExecutor, build_batch
+from app.services.faker_engine import ColumnarFakerEngine
+from app.services.job_manager import JobManager, job_id_for, parse_range, read_range
+from app.services.stat_engine import CategoricalColumn, HistogramColumn, PatternColumn, fit_column, fit_sample
+from app.services.schema_extractor import describe_profile, extract_file_schema, extract_schema, prompt_type_hints, read_sample
+from app.services import embedding_service, llm_generator
+from app.services.llm_generator import hybrid_generate_synthetic_data_stream
+from app.services.chunk_controller import ChunkController, compact_context
+from app.services.llm_pipeline import adaptive_chunks, plan_chunks, ordered_pipeline
+from app.services.local_vector_index import LocalVectorIndex
+from app.services.pinecone_service import PineconeWriteBuffer, query_pinecone, upsert_to_pinecone
+from app.services.providers import StubEmbedder, StubTextModel
+from app.services.response_cache import Broadcast, ResponseCache, ResponseCoalescer, read_gzip, response_key, write_through
+from app.services.warmup import Warmup
+from app.services import serializer
+from app.services.serializer import encode_stream, get_serializer, gzip_encoder, negotiate_encoding, stream_serialized
+from app.services.validation_plan import compile_plan
+from app.services.value_pool import ValuePoolCache
+from app.utils.cache import LRUCache, SQLiteCache
+from app.utils.limiter import SQLiteTokenBucket, TokenBucket, client_address
+from app.utils import logger as app_logger
+from app.utils.metrics import LLM_TOKENS, STAGE_SECONDS, TIME_TO_FIRST_BYTE, MetricsRegistry, RequestIdFilter, request_id_var, stage, track_stream
 
 class TestServices(unittest.TestCase):
     def test_schema_extractor(self):
         # Add tests here
         pass
 
+class TestSchemaExtractor(unittest.TestCase):
+    def upload(self, data: bytes):
+        from fastapi import UploadFile
+        return UploadFile(io.BytesIO(data), size=len(data), filename='sample.csv')
+
+    def test_reads_only_a_bounded_sample(self):
+        data = b'id,name\n' + b''.join(b'%d,user %d\n' % (i, i) for i in range(200000))
+        upload = self.upload(data)
+        sample = asyncio.run(read_sample(upload, 4096))
+        self.assertLessEqual(len(sample), 4096)
+        self.assertTrue(sample.endswith('\n'))
+        self.assertLessEqual(upload.file.tell(), 4097)
+
+    def test_sniffs_dialect_and_profiles_sample(self):
+        lines = ['age;status;score;note'] + [f'{20 + i % 40};{"active" if i % 3 else "closed"};{i / 4};' for i in range(100)]
+        schema, description, profile, rows = extract_file_schema('\n'.join(lines) + '\n')
+        self.assertEqual(schema, 'age, status, score, note')
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(profile['age']['type'], 'integer')
+        self.assertEqual((profile['age']['min'], profile['age']['max']), (20, 59))
+        self.assertEqual(profile['score']['type'], 'float')
+        self.assertEqual(set(profile['status']['categories']), {'active', 'closed'})
+        self.assertEqual(profile['note']['null_rate'], 1.0)
+        self.assertIn('status: one of active, closed', describe_profile(profile))
+
+    def test_extract_schema_keeps_file_and_prompt_paths(self):
+        self.assertEqual(extract_schema('"a",b\n1,2\n')[0], 'a, b')
+        self.assertEqual(extract_schema('Name, Age, City', is_file=False)[0], 'name, age, city')
+        with self.assertRaises(ValueError):
+            extract_schema('', is_file=True)
+
+class TestColumnClassifier(unittest.TestCase):
+    def test_synonyms_and_patterns(self):
+        expected = {
+            'first_name': 'first_name', 'zip_code': 'postcode', 'created_at': 'datetime', 'salary': 'salary',
+            'customerEmail': 'email', 'Phone Number': 'phone', 'order_id': 'id', 'is_active': 'boolean',
+            'billing_address': 'street_address', 'job_posting_id': 'id', 'tracking_number': 'id',
+            'product_name': None, 'description': None,
+        }
+        self.assertEqual({col: classify_column(col) for col in expected}, expected)
+
+    def test_type_hints_and_fuzzy_matching(self):
+        self.assertEqual(classify_column('score', 'decimal(10,2)'), 'float')
+        self.assertIsNone(classify_column('notes', 'string'))
+        self.assertIsNone(classify_column('zipcod'))
+        self.assertEqual(classify_column('zipcod', fuzzy=True), 'postcode')
+        self.assertIsNone(classify_column('description', fuzzy=True))
+
+    def test_classification_is_memoized_per_schema(self):
+        _classify.cache_clear()
+        classify_columns(['a', 'email'], {'a': 'int'})
+        self.assertEqual(classify_columns(['a', 'email'], {'a': 'int'}), {'a': 'integer', 'email': 'email'})
+        self.assertEqual(_classify.cache_info().hits, 1)
+
+    def test_every_type_has_a_generator(self):
+        engine = ColumnarFakerEngine(seed=2, pool_size=20)
+        for column_type in {t.generator for t in COLUMN_TYPES.values()} | set(HINT_TYPES.values()):
+            values = engine.generate(['col'], 5, {'col': column_type})['col']
+            self.assertEqual(len(values), 5, column_type)
+            self.assertTrue(all(isinstance(v, str) and v for v in values), column_type)
+
+    def test_typed_prompt_keeps_hints(self):
+        prompt = 'id: integer, price: decimal, notes: string'
+        self.assertEqual(extract_schema(prompt, is_file=False)[0], 'id, price, notes')
+        self.assertEqual(prompt_type_hints(prompt), {'id': 'integer', 'price': 'decimal', 'notes': 'string'})
+
+class TestColumnarFakerEngine(unittest.TestCase):
+    def test_generates_whole_columns(self):
+        engine = ColumnarFakerEngine(seed=1, pool_size=50)
+        data = engine.generate(['Name', 'age', 'email', 'phone'], 200)
+        self.assertEqual(set(data), {'Name', 'age', 'email', 'phone'})
+        self.assertTrue(all(len(values) == 200 for values in data.values()))
+        self.assertTrue(all(18 <= int(age) <= 90 for age in data['age']))
+        self.assertTrue(all('@' in email for email in data['email']))
+        self.assertTrue(all(len(phone) == 12 for phone in data['phone']))
+
+    def test_seed_is_reproducible(self):
+        first = ColumnarFakerEngine(seed=7, pool_size=50).generate(['name', 'city'], 100)
+        second = ColumnarFakerEngine(seed=7, pool_size=50).generate(['name', 'city'], 100)
+        self.assertEqual(first, second)
+
+    def test_stream_assembles_rows(self):
+        async def collect():
+            return [batch async for batch in hybrid_generate_synthetic_data_stream(25, ['name', 'age', 'city'], 'general', '', 'csv', seed=3)]
+        batches = asyncio.run(collect())
+        self.assertEqual(sum(len(batch) for batch in batches), 25)
+        self.assertEqual(set(batches[0][0]), {'name', 'age', 'city'})
+
+class FakeModel:
+    """Stand-in for the Gemini model: returns CSV rows after a short delay."""
+    def __init__(self, fail_first: int = 0, fill: float = 1.0):
+        self.fail_first = fail_first
+        self.fill = fill  # Share of requested rows actually returned
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        if self.calls <= self.fail_first:
+            raise RuntimeError("429 quota")
+        size = int(re.search(r'Generate (\d+) rows', prompt).group(1))
+        await asyncio.sleep(0.001)
+        text = "\n".join(f'"desc, {i}",{i}' for i in range(max(1, int(size * self.fill))))
+        if not stream:
+            return mock.Mock(text=text)
+
+        async def pieces():
+            for start in range(0, len(text), 7):  # Split mid-line and mid-quote
+                yield mock.Mock(text=text[start:start + 7])
+        return pieces()
+
+class TestLLMPipeline(unittest.TestCase):
+    def test_plan_chunks_respects_batches(self):
+        self.assertEqual(plan_chunks(25, 10, 4), [4, 4, 2, 4, 4, 2, 4, 1])
+
+    def test_ordered_with_bounded_concurrency(self):
+        in_flight, peak = 0, 0
+
+        async def fetch(size):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001 * (10 - size))  # Later chunks finish first
+            in_flight -= 1
+            return [{'n': str(size)}]
+
+        async def collect():
+            return [chunk async for chunk in ordered_pipeline(list(range(10)), fetch, concurrency=3)]
+        results = asyncio.run(collect())
+        self.assertEqual([chunk[0]['n'] for chunk in results], [str(i) for i in range(10)])
+        self.assertLessEqual(peak, 3)
+
+    def collect_chunk(self, model, size, stream=False):
+        async def collect():
+            chunk = llm_generator.generate_complex_chunk(size, ['description', 'score'], 'general', '', stream=stream)
+            return [rows async for rows in chunk]
+        with mock.patch.object(llm_generator, 'model', model, create=True), \
+                mock.patch.object(llm_generator.Config, 'LLM_RETRY_BACKOFF', 0), \
+                mock.patch.object(llm_generator.Config, 'LLM_MAX_REFILLS', 10):
+            return asyncio.run(collect())
+
+    def test_retry_recovers(self):
+        model = FakeModel(fail_first=2)
+        parts = self.collect_chunk(model, 3)
+        self.assertEqual(model.calls, 3)
+        self.assertEqual(sum(len(rows) for rows in parts), 3)
+
+    def test_refills_missing_rows_instead_of_padding(self):
+        llm_generator.llm_stats.reset()
+        parts = self.collect_chunk(FakeModel(fill=0.5), 40)
+        rows = [row for part in parts for row in part]
+        self.assertEqual(len(rows), 40)
+        self.assertTrue(all(row['description'] for row in rows))
+        self.assertEqual(llm_generator.llm_stats.rows_padded, 0)
+        self.assertLess(llm_generator.llm_stats.fill_rate, 1.0)
+
+    def test_streamed_rows_arrive_incrementally(self):
+        parts = self.collect_chunk(FakeModel(), 30, stream=True)
+        self.assertGreater(len(parts), 1)
+        rows = [row for part in parts for row in part]
+        self.assertEqual(rows[12], {'description': 'desc, 12', 'score': '12'})
+
+    def test_incremental_parser_drops_malformed(self):
+        parser = llm_generator.IncrementalCSVParser(2)
+        self.assertEqual(parser.feed('```csv\na,1\nb,"2'), [['a', '1']])
+        self.assertEqual(parser.feed('"\nc,3,extra\nd,4'), [['b', '2']])
+        self.assertEqual(parser.close(), [['d', '4']])
+        self.assertEqual(parser.dropped, 1)
+
+    def test_incremental_parser_stray_quotes(self):
+        parser = llm_generator.IncrementalCSVParser(2)
+        self.assertEqual(parser.feed('He said "hi,1\nb,2\n'), [['He said "hi', '1'], ['b', '2']])
+        self.assertEqual(parser.feed('c,"multi\n'), [])  # Open quoted field waits for its close
+        self.assertEqual(parser.feed('line"\n'), [['c', 'multi\nline']])
+        # A quote opening a value that never closes holds back at most MAX_QUOTED_LINES lines
+        parser.feed('"never,4\n')
+        rows = []
+        for i in range(parser.MAX_QUOTED_LINES):
+            rows += parser.feed(f'd{i},{i}\n')
+        self.assertEqual(len(rows), parser.MAX_QUOTED_LINES)
+        self.assertEqual(parser.dropped, 1)
+
+    def test_stream_with_complex_columns(self):
+        async def collect():
+            stream = hybrid_generate_synthetic_data_stream(1200, ['name', 'description', 'score'], 'general', '', 'csv', seed=1)
+            return [batch async for batch in stream]
+        for streaming in (False, True):
+            with mock.patch.object(llm_generator, 'model', FakeModel(), create=True), \
+                    mock.patch.object(llm_generator.Config, 'LLM_CHUNK_ROWS', 500), \
+                    mock.patch.object(llm_generator.Config, 'LLM_ADAPTIVE_CHUNKS', False), \
+                    mock.patch.object(llm_generator.Config, 'LLM_STREAM', streaming):
+                batches = asyncio.run(collect())
+            rows = [row for batch in batches for row in batch]
+            self.assertEqual(len(rows), 1200)
+            self.assertEqual(rows[501]['score'], '1')
+            self.assertTrue(all(row['name'] for row in rows))
+            self.assertEqual(len(batches) > 1, streaming)
+
+class TestCaches(unittest.TestCase):
+    def test_lru_evicts_by_bytes(self):
+        cache = LRUCache(max_bytes=30)
+        cache.set('a', 'x' * 10)
+        cache.set('b', 'y' * 10)
+        cache.get('a')
+        cache.set('c', 'z' * 10)  # Evicts least recently used 'b'
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'x' * 10)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertLessEqual(cache.nbytes, 30)
+
+    def test_sqlite_tier_persists_and_evicts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.db')
+            cache = SQLiteCache(path, max_bytes=100)
+            cache.set('a', [{'v': 'x' * 20}])
+            cache.close()
+            cache = SQLiteCache(path, max_bytes=100)
+            self.assertEqual(cache.get('a'), [{'v': 'x' * 20}])
+            cache.set('b', [{'v': 'y' * 60}])  # Pushes total over budget, evicts 'a'
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.stats()['evictions'], 1)
+            cache.close()
+
+    def test_value_pool_serves_repeat_schema(self):
+        pools = ValuePoolCache(max_bytes=1 << 20, min_rows=100, fresh_ratio=0.0)
+        model = FakeModel()
+
+        async def collect():
+            stream = hybrid_generate_synthetic_data_stream(300, ['description', 'score'], 'general', '', 'csv', pool_key='dataset_x')
+            return [row async for batch in stream for row in batch]
+        with mock.patch.object(llm_generator, 'model', model, create=True), \
+                mock.patch.object(llm_generator, 'get_value_pools', return_value=pools), \
+                mock.patch.object(llm_generator.Config, 'LLM_CHUNK_ROWS', 100), \
+                mock.patch.object(llm_generator.Config, 'LLM_ADAPTIVE_CHUNKS', False):
+            asyncio.run(collect())
+            calls_after_first = model.calls
+            rows = asyncio.run(collect())
+        self.assertEqual(model.calls, calls_after_first)  # Second request never hit the LLM
+        self.assertEqual(len(rows), 300)
+        self.assertTrue(all(row['description'] for row in rows))
+        self.assertEqual(pools.stats()['hits'], 3)
+
+    def test_value_pool_recombine(self):
+        pools = ValuePoolCache(max_bytes=1 << 20, recombine=True)
+        pools.add('k', [{'a': str(i), 'b': str(i)} for i in range(50)])
+        rows = pools.sample('k', 200, random.Random(0))
+        self.assertTrue(any(row['a'] != row['b'] for row in rows))
+
+    def test_value_pool_evicted_before_sample(self):
+        pools = ValuePoolCache(max_bytes=1 << 20, min_rows=10, fresh_ratio=0.0)
+        pools.add('k', [{'a': str(i)} for i in range(20)])
+        self.assertTrue(pools.should_reuse('k', random.Random(0)))
+        pools.memory.delete('k')
+        self.assertIsNone(pools.sample('k', 5, random.Random(0)))
+
+    def test_value_pool_keyed_by_llm_columns(self):
+        pools = ValuePoolCache(max_bytes=1 << 20, min_rows=100, fresh_ratio=0.0)
+        model = StubTextModel(latency=0)
+
+        async def collect(type_hints):
+            stream = hybrid_generate_synthetic_data_stream(200, ['description', 'score'], 'general', '', 'csv', pool_key='dataset_x', type_hints=type_hints)
+            return [row async for batch in stream for row in batch]
+        with mock.patch.object(llm_generator, 'model', model, create=True), \
+                mock.patch.object(llm_generator, 'get_value_pools', return_value=pools):
+            asyncio.run(collect({'score': 'integer'}))  # Only 'description' comes from the LLM
+            calls = model.calls
+            rows = asyncio.run(collect({}))  # Same schema key, but the LLM now writes 'score' too
+        self.assertGreater(model.calls, calls)
+        self.assertTrue(all(row['score'].startswith('score ') for row in rows))
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        embedding_service._memory_cache = None
+        embedding_service._disk_cache = None
+        self.calls = 0
+
+    async def fake_embed(self, text, task_type):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return [float(len(text)), 0.5]
+
+    def run_embeddings(self, *task_types):
+        async def run():
+            return await asyncio.gather(*(embedding_service.create_embedding('id, name - schema', t) for t in task_types))
+        with mock.patch.object(embedding_service, '_embedder', mock.Mock(embed=self.fake_embed)):
+            return asyncio.run(run())
+
+    def test_concurrent_identical_calls_collapse(self):
+        results = self.run_embeddings(*['RETRIEVAL_DOCUMENT'] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.run_embeddings('RETRIEVAL_DOCUMENT')
+        self.assertEqual(self.calls, 1)  # Served from cache
+        self.run_embeddings('RETRIEVAL_QUERY')
+        self.assertEqual(self.calls, 2)  # Gemini embeddings differ per task_type
+
+    def test_openai_shares_one_embedding_for_both_roles(self):
+        with mock.patch.object(embedding_service.Config, 'MODEL_PROVIDER', 'openai'):
+            self.assertEqual(
+                embedding_service.embedding_cache_key('x', 'RETRIEVAL_DOCUMENT'),
+                embedding_service.embedding_cache_key('x', 'RETRIEVAL_QUERY')
+            )
+        self.assertNotEqual(
+            embedding_service.embedding_cache_key('x', 'RETRIEVAL_DOCUMENT'),
+            embedding_service.embedding_cache_key('x', 'RETRIEVAL_QUERY')
+        )
+
+class TestPineconeWriteBuffer(unittest.TestCase):
+    def test_coalesces_and_skips_known_ids(self):
+        index = mock.Mock()
+
+        async def run():
+            writer = PineconeWriteBuffer(index, batch_size=2, flush_interval=0.01)
+            writer.start()
+            self.assertTrue(writer.add('a', [0.1], {}))
+            self.assertFalse(writer.add('a', [0.1], {}))  # Already pending
+            writer.add('b', [0.2], {})
+            writer.add('c', [0.3], {})
+            await asyncio.sleep(0.05)  # Background flush
+            self.assertFalse(writer.add('b', [0.2], {}))  # Already upserted
+            await writer.close()
+            return writer
+        writer = asyncio.run(run())
+        self.assertEqual(writer.upserted, 3)
+        self.assertEqual(writer.skipped, 2)
+        self.assertEqual(sum(len(call.kwargs['vectors']) for call in index.upsert.call_args_list), 3)
+        self.assertLessEqual(index.upsert.call_count, 2)
+
+    def test_failed_batch_is_retried_on_close(self):
+        index = mock.Mock()
+        index.upsert.side_effect = [RuntimeError("unavailable"), None]
+
+        async def run():
+            writer = PineconeWriteBuffer(index, flush_interval=60)
+            writer.add('a', [0.1], {})
+            await writer.flush()
+            self.assertIn('a', writer.pending)
+            await writer.close()
+            return writer
+        writer = asyncio.run(run())
+        self.assertEqual(writer.upserted, 1)
+        self.assertTrue(writer.is_known('a'))
+
+class TestLocalVectorIndex(unittest.TestCase):
+    def test_query_returns_nearest_with_metadata(self):
+        index = LocalVectorIndex(dimension=3)
+
+        async def run():
+            await upsert_to_pinecone(index, 'x', [1.0, 0.0, 0.0], {'description': 'x axis'})
+            await upsert_to_pinecone(index, 'y', [0.0, 2.0, 0.0], {'description': 'y axis'})
+            await upsert_to_pinecone(index, 'xy', [1.0, 1.0, 0.0], {'description': 'diagonal'})
+            return await query_pinecone(index, [0.0, 1.0, 0.1], top_k=2)
+        results = asyncio.run(run())
+        self.assertEqual([m['id'] for m in results['matches']], ['y', 'xy'])
+        self.assertEqual(results['matches'][0]['metadata']['description'], 'y axis')
+        self.assertAlmostEqual(results['matches'][0]['score'], 0.995, places=3)
+
+    def test_persists_and_reloads_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index')
+            index = LocalVectorIndex(path, dimension=2)
+            index.upsert(vectors=[('a', [1.0, 0.0], {'n': 1}), ('b', [0.0, 1.0], {'n': 2})])
+            index.save()
+            reloaded = LocalVectorIndex(path, dimension=2)
+            self.assertEqual(len(reloaded), 2)
+            self.assertEqual(reloaded.query(vector=[0.1, 1.0], top_k=1)['matches'][0]['id'], 'b')
+            reloaded.upsert(vectors=[('a', [0.0, -1.0], {'n': 3})])  # Overwrite after load
+            self.assertEqual(reloaded.query(vector=[0.0, -1.0], top_k=1)['matches'][0]['metadata'], {'n': 3})
+
+async def as_batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def collect_body(rows, format, columns, chunk_size=1024, encoder=None, batch_size=100, type_hints=None):
+    async def collect():
+        serializer = get_serializer(format, columns, type_hints)
+        stream = stream_serialized(as_batches(rows, batch_size), serializer, chunk_size, encoder)
+        return [part async for part in stream]
+    return asyncio.run(collect())
+
+class TestSerializer(unittest.TestCase):
+    rows = [{'name': 'Doe, Jane', 'quote': 'she said "hi"'}, {'name': 'Solo'}] * 500
+
+    def test_csv_quotes_and_fills_missing(self):
+        body = b''.join(collect_body(self.rows, 'csv', ['name', 'quote'])).decode()
+        parsed = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(parsed[0], ['name', 'quote'])
+        self.assertEqual(parsed[1], ['Doe, Jane', 'she said "hi"'])
+        self.assertEqual(parsed[2], ['Solo', ''])
+        self.assertEqual(len(parsed), 1001)
+
+    def test_ndjson_and_chunking(self):
+        parts = collect_body(self.rows, 'json', ['name', 'quote'], chunk_size=8 * 1024)
+        self.assertLess(len(parts), 10)  # Few large sends instead of one per row
+        lines = b''.join(parts).splitlines()
+        self.assertEqual(json.loads(lines[0]), self.rows[0])
+        self.assertEqual(len(lines), 1000)
+
+    def test_gzip_stream_round_trips(self):
+        plain = b''.join(collect_body(self.rows, 'csv', ['name', 'quote']))
+        compressed = b''.join(collect_body(self.rows, 'csv', ['name', 'quote'], encoder=gzip_encoder()))
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertLess(len(compressed), len(plain))
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate', 'gzip').name, 'gzip')
+        self.assertIsNone(negotiate_encoding('gzip', 'none'))
+        self.assertIsNone(negotiate_encoding('identity'))
+
+@unittest.skipIf(not serializer.HAS_PYARROW, "pyarrow not installed")
+class TestColumnarSerializer(unittest.TestCase):
+    rows = [{'name': f'user {i}', 'age': str(20 + i % 50), 'score': f'{i / 3:.2f}', 'notes': ''} for i in range(1000)]
+    columns = ['name', 'age', 'score', 'notes']
+
+    def test_parquet_row_groups_and_types(self):
+        import pyarrow.parquet as pq
+        parts = collect_body(self.rows, 'parquet', self.columns, encoder=gzip_encoder(), batch_size=250, type_hints={'score': 'float'})
+        parquet_file = pq.ParquetFile(io.BytesIO(b''.join(parts)))  # Encoder is skipped for binary formats
+        self.assertEqual(parquet_file.metadata.num_row_groups, 4)
+        table = parquet_file.read()
+        self.assertEqual(table.num_rows, 1000)
+        self.assertEqual(str(table.schema.field('age').type), 'int64')
+        self.assertEqual(str(table.schema.field('score').type), 'double')
+        self.assertEqual(table.column('name')[3].as_py(), 'user 3')
+
+    def test_arrow_stream(self):
+        import pyarrow as pa
+        body = b''.join(collect_body(self.rows, 'arrow', self.columns, batch_size=300))
+        reader = pa.ipc.open_stream(body)
+        batches = list(reader)
+        self.assertEqual([b.num_rows for b in batches], [300, 300, 300, 100])
+        self.assertEqual(batches[0].column(1)[0].as_py(), 20)
+
+    def test_llm_columns_stay_strings(self):
+        import pyarrow as pa
+        rows = [{'age': '30', 'how_many': '12'}, {'age': '41', 'how_many': '7'}, {'age': '52', 'how_many': 'about 3 dozen'}]
+        body = b''.join(collect_body(rows, 'arrow', ['age', 'how_many'], batch_size=2))
+        table = pa.ipc.open_stream(body).read_all()
+        self.assertEqual(str(table.schema.field('age').type), 'int64')
+        self.assertEqual(table.column('how_many').to_pylist(), ['12', '7', 'about 3 dozen'])
+
+    def test_unparsable_typed_value_becomes_null(self):
+        import pyarrow as pa
+        rows = [{'age': '30'}, {'age': 'unknown'}]
+        table = pa.ipc.open_stream(b''.join(collect_body(rows, 'arrow', ['age'], batch_size=1))).read_all()
+        self.assertEqual(table.column('age').to_pylist(), [30, None])
+
+    def test_codes_keep_leading_zeros(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        rows = [{'zip': '03968', 'phone': '0123456789', 'id': '007', 'age': '41'}] * 3
+        columns = ['zip', 'phone', 'id', 'age']
+        arrow = pa.ipc.open_stream(b''.join(collect_body(rows, 'arrow', columns))).read_all()
+        parquet = pq.read_table(io.BytesIO(b''.join(collect_body(rows, 'parquet', columns))))
+        for table in (arrow, parquet):
+            self.assertEqual(table.to_pylist()[0], {'zip': '03968', 'phone': '0123456789', 'id': '007', 'age': 41})
+
+class TestValidationPlan(unittest.TestCase):
+    def test_plan_only_checks_relevant_columns(self):
+        plan = compile_plan(['user_age', 'message', 'Email', 'phone_number', 'ssn', 'city'])
+        self.assertEqual([col for col, _, _ in plan.validators], ['user_age', 'Email', 'phone_number', 'ssn'])
+        self.assertIs(plan, compile_plan(['user_age', 'message', 'Email', 'phone_number', 'ssn', 'city']))
+
+    def test_plan_uses_column_classifier(self):
+        plan = compile_plan(['mobile', 'Telephone', 'fax', 'userPhone', 'userAge', 'contact', 'usage'], {'contact': 'phone'})
+        self.assertEqual(plan.phone_columns, ['mobile', 'Telephone', 'fax', 'userPhone', 'contact'])
+        self.assertEqual([col for col, _, _ in plan.validators], ['mobile', 'Telephone', 'fax', 'userPhone', 'userAge', 'contact'])
+        batch = [{'mobile': '555-123-4567', 'Telephone': '555 987 6543', 'fax': '555-000-1111', 'userPhone': '(555) 222-3333',
+                  'userAge': '41', 'contact': '555-444-5555', 'usage': 'daily'}]
+        plan.anonymize_batch(batch)
+        self.assertEqual(batch[0]['userPhone'], '(***) ***-3333')
+        self.assertEqual(batch[0]['contact'], '***-***-5555')
+        self.assertEqual(batch[0]['userAge'], '41')
+
+    def test_validate_batch_regenerates_invalid_values(self):
+        plan = compile_plan(['age', 'email', 'phone', 'ssn', 'message'])
+        batch = [
+            {'age': '200', 'email': 'not-an-email', 'phone': 'call me', 'ssn': '12', 'message': 'hello'},
+            {'age': '34', 'email': 'a.b@example.com', 'phone': '555-123-4567', 'ssn': '123-45-6789', 'message': 'x'},
+        ]
+        plan.validate_batch(batch, llm_generator.get_fake())
+        self.assertTrue(0 < int(batch[0]['age']) < 120)
+        self.assertIn('@', batch[0]['email'])
+        self.assertNotEqual(batch[0]['phone'], 'call me')
+        self.assertRegex(batch[0]['ssn'], r'^\d{3}-\d{2}-\d{4}$')
+        self.assertEqual(batch[0]['message'], 'hello')  # 'age' inside 'message' is not an age column
+        self.assertEqual(batch[1], {'age': '34', 'email': 'a.b@example.com', 'phone': '555-123-4567', 'ssn': '123-45-6789', 'message': 'x'})
+
+    def test_anonymize_batch(self):
+        plan = compile_plan(['email', 'phone', 'notes', 'age'])
+        batch = [{'email': 'a.b@example.com', 'phone': '555-123-4567', 'notes': 'SSN 123-45-6789', 'age': '40'}]
+        plan.anonymize_batch(batch)
+        self.assertEqual(batch[0], {'email': 'anonymous@email.com', 'phone': '***-***-4567', 'notes': 'SSN ***-**-****', 'age': '40'})
+
+    def test_row_helpers_delegate_to_plan(self):
+        row = llm_generator.validate_row({'age': 'abc'}, ['age'])
+        self.assertTrue(row['age'].isdigit())
+        row = llm_generator.validate_row({'contact': 'nobody'}, ['contact'], type_hints={'contact': 'email'})
+        self.assertIn('@', row['contact'])
+
+    def test_build_batch_validates_hinted_columns(self):
+        rows = [{'contact': 'not an email'}, {'contact': 'a.b@example.com'}]
+        batch = build_batch([], ['contact'], 2, rows, 5, 0, type_hints={'contact': 'email'})
+        self.assertIn('@', batch[0]['contact'])
+        self.assertEqual(batch[1]['contact'], 'a.b@example.com')
+        self.assertEqual(build_batch([], ['contact'], 1, [{'contact': 'x'}], 5, 0), [{'contact': 'x'}])  # No hint, no check
+        self.assertEqual(llm_generator.anonymize_data({'contact': 'x@y.io'}), {'contact': 'anonymous@email.com'})
+
+def sample_rows(n=400):
+    rng = random.Random(0)
+    rows = []
+    for i in range(n):
+        age = rng.randint(20, 70)
+        rows.append([
+            str(age), f"{age * 1000 + rng.gauss(0, 2000):.2f}", rng.choice(['gold', 'silver']),
+            f"2024-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}", f"CU-{rng.randint(0, 99999):05d}",
+            f"free text note number {i}", f"comment {i} about it"
+        ])
+    return ['age', 'income', 'tier', 'signup', 'code', 'notes', 'comment'], rows
+
+class TestSampleModel(unittest.TestCase):
+    def test_fits_column_kinds(self):
+        columns, rows = sample_rows()
+        model = fit_sample(columns, rows)
+        kinds = {col: type(m) for col, m in model.models.items()}
+        self.assertEqual(kinds, {
+            'age': HistogramColumn, 'income': HistogramColumn, 'tier': CategoricalColumn,
+            'signup': HistogramColumn, 'code': PatternColumn
+        })
+        self.assertFalse(model.supports('notes'))  # Free text stays with the LLM
+        self.assertIsNone(fit_column(['Ann Lee', 'Bob Stone', 'Cy Young']))  # Unique values are never replayed
+
+    def test_single_word_text_is_not_a_pattern(self):
+        names = ['Alice', 'Bob', 'Charlotte', 'Dmitri', 'Eve', 'Fatima', 'Gustavo', 'Hiroshi', 'Ingrid', 'Jo',
+                 'Kwame', 'Leonardo', 'Mei', 'Nadia', 'Oscar', 'Priya', 'Quentin', 'Rosalind', 'Sven', 'Tariq']
+        self.assertIsNone(fit_column(names))  # Would come out as random letters ('Xqzrp')
+        self.assertIsInstance(fit_column([f'{a}{b}{c}Q' for a in 'ABC' for b in 'DEF' for c in 'GHJ']), PatternColumn)
+        self.assertIsInstance(fit_column([f'SKU{i:04d}' for i in range(30)]), PatternColumn)
+
+    def test_samples_follow_the_sample(self):
+        import numpy as np
+        columns, rows = sample_rows()
+        data = fit_sample(columns, rows).generate(['age', 'income', 'tier', 'signup', 'code'], 5000, np.random.default_rng(0))
+        ages = np.array(data['age'], dtype=int)
+        self.assertTrue(20 <= ages.min() and ages.max() <= 70)
+        self.assertGreater(np.corrcoef(ages, np.array(data['income'], dtype=float))[0, 1], 0.9)  # Copula
+        self.assertEqual(set(data['tier']), {'gold', 'silver'})
+        self.assertTrue(all('2024-01-10' <= d <= '2024-09-19' for d in data['signup']))
+        self.assertTrue(all(re.fullmatch(r'CU-\d{5}', code) for code in data['code']))
+        self.assertEqual(len(data['income'][0].partition('.')[2]), 2)
+
+    def test_stream_uses_llm_only_for_free_text(self):
+        columns, rows = sample_rows()
+        model = fit_sample(columns, rows)
+        fake_model = FakeModel()
+
+        async def collect():
+            stream = hybrid_generate_synthetic_data_stream(1200, columns, 'general', '', 'csv', seed=4, sample_model=model)
+            return [row for batch in [b async for b in stream] for row in batch]
+        with mock.patch.object(llm_generator, 'model', fake_model, create=True), \
+                mock.patch.object(llm_generator.Config, 'CPU_EXECUTOR', 'inline'), \
+                mock.patch.object(llm_generator.Config, 'VALUE_POOL_ENABLED', False):
+            first = asyncio.run(collect())
+            second = asyncio.run(collect())
+        self.assertEqual(len(first), 1200)
+        self.assertEqual(first[0]['notes'], 'desc, 0')
+        self.assertTrue(first[0]['tier'] in ('gold', 'silver'))
+        self.assertEqual([row['income'] for row in first], [row['income'] for row in second])  # Seeded
+
+class TestExecutor(unittest.TestCase):
+    def generate(self, mode):
+        async def collect():
+            stream = hybrid_generate_synthetic_data_stream(25000, ['name', 'age', 'email'], 'general', '', 'csv', seed=11)
+            return [batch async for batch in stream]
+        with mock.patch.object(llm_generator.Config, 'CPU_EXECUTOR', mode):
+            return asyncio.run(collect())
+
+    def test_seeded_output_matches_inline_and_process(self):
+        inline = self.generate('inline')
+        self.assertEqual([len(batch) for batch in inline], [10000, 10000, 5000])
+        self.assertEqual(inline, self.generate('process'))
+
+    def test_backpressure_bounds_pending_batches(self):
+        async def run():
+            executor = BatchExecutor('inline', max_pending=2)
+            executor.submit(build_batch, ['age'], ['age'], 3, [], 1, 0)
+            self.assertFalse(executor.full())
+            executor.submit(build_batch, ['age'], ['age'], 3, [], 1, 1)
+            self.assertTrue(executor.full())
+            first = await executor.next()
+            self.assertEqual(len(executor), 1)
+            return first
+        self.assertEqual(len(asyncio.run(run())), 3)
+
+class TestJobManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def run_job(self, manager_kwargs=None, **job_kwargs):
+        async def run():
+            manager = JobManager(self.tmp.name, workers=1, chunk_rows=10, **(manager_kwargs or {}))
+            manager.start()
+            job = manager.submit(['name', 'age'], 25, 'csv', seed=3, **job_kwargs)
+            while job.status in ('queued', 'running'):
+                await asyncio.sleep(0.01)
+            await manager.close()
+            paths = [job.chunk_path(i) for i in range(job.chunk_count)]
+            body = b''.join([part async for part in read_range(paths, job.chunk_sizes(), 0, sum(job.chunk_sizes()) - 1)])
+            return job, body
+        with mock.patch.object(llm_generator.Config, 'CPU_EXECUTOR', 'inline'):
+            return asyncio.run(run())
+
+    def test_job_spills_chunks_that_concatenate(self):
+        job, body = self.run_job()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.progress()['chunks_done'], 3)
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0], ['name', 'age'])
+        self.assertEqual(len(rows), 26)
+
+    def test_resubmit_reuses_finished_chunks(self):
+        job, body = self.run_job()
+        os.remove(job.chunk_path(1))
+        with open(job.chunk_path(0), 'rb') as f:
+            first = f.read()
+        with mock.patch('app.services.job_manager.hybrid_generate_synthetic_data_stream', wraps=hybrid_generate_synthetic_data_stream) as generate:
+            again, body_again = self.run_job()
+        self.assertEqual(again.id, job.id)
+        self.assertEqual(generate.call_count, 1)  # Only the missing chunk
+        with open(again.chunk_path(0), 'rb') as f:
+            self.assertEqual(f.read(), first)
+        self.assertEqual(body_again, body)  # Seeded chunks regenerate identically
+
+    def test_queue_is_bounded(self):
+        async def run():
+            manager = JobManager(self.tmp.name, queue_size=1, chunk_rows=10)  # Workers not started
+            manager.submit(['age'], 5, 'csv')
+            with self.assertRaises(asyncio.QueueFull):
+                manager.submit(['age'], 6, 'csv')
+            self.assertEqual(manager.queued(), 1)
+        asyncio.run(run())
+
+    def test_resubmit_after_queue_full(self):
+        async def run():
+            manager = JobManager(self.tmp.name, queue_size=1, chunk_rows=10)  # Workers not started
+            manager.submit(['age'], 5, 'csv')
+            with self.assertRaises(asyncio.QueueFull):
+                manager.submit(['age'], 6, 'csv')
+            self.assertIsNone(manager.get(job_id_for(['age'], 6, 'csv', None, 10)))
+            manager._queue.get_nowait()  # A worker takes the first job
+            job = manager.submit(['age'], 6, 'csv')
+            self.assertEqual(job.status, 'queued')
+            self.assertEqual(manager.queued(), 1)
+            self.assertIs(manager._queue.get_nowait(), job)
+        asyncio.run(run())
+
+    def test_expire_finished_jobs(self):
+        job, _ = self.run_job(manager_kwargs={'ttl': 60})
+        manager = JobManager(self.tmp.name, chunk_rows=10, ttl=60)
+        self.assertEqual(manager.expire(), [])  # Still fresh
+        self.assertEqual(manager.get(job.id).status, 'done')
+        expired = manager.expire(now=time.time() + 120)
+        self.assertEqual(expired, [f"{job.directory}.expired"])
+        self.assertIsNone(manager.get(job.id))
+        self.assertFalse(os.path.exists(job.directory))
+
+    def test_parse_range(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertEqual(parse_range('bytes=10-19', 100), (10, 19))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-5', 100), (95, 99))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render_exposition_format(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Test counter", ["kind"])
+        histogram = registry.histogram("test_seconds", "Test histogram", buckets=(0.1, 1.0))
+        registry.gauge("test_gauge", "Test gauge", lambda: 0.5)
+        counter.inc(3, kind="a")
+        histogram.observe(0.5)
+        text = registry.render()
+        self.assertIn('# TYPE test_total counter\ntest_total{kind="a"} 3\n', text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 0\n', text)
+        self.assertIn('test_seconds_bucket{le="1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 1\ntest_seconds_sum 0.5\ntest_seconds_count 1\n', text)
+        self.assertIn('test_gauge 0.5\n', text)
+
+    def test_stage_and_time_to_first_byte(self):
+        before = STAGE_SECONDS.count(stage="test_stage")
+        with stage("test_stage"):
+            pass
+        self.assertEqual(STAGE_SECONDS.count(stage="test_stage"), before + 1)
+
+        async def body():
+            yield b''
+            yield b'a'
+            yield b'b'
+
+        async def collect():
+            return [chunk async for chunk in track_stream(body(), 0.0, "test")]
+        self.assertEqual(asyncio.run(collect()), [b'', b'a', b'b'])
+        self.assertEqual(TIME_TO_FIRST_BYTE.count(endpoint="test"), 1)
+
+    def test_llm_call_records_tokens(self):
+        model = FakeModel()
+        original = model.generate_content_async
+
+        async def with_usage(prompt, stream=False):
+            response = await original(prompt, stream)
+            response.usage_metadata = mock.Mock(prompt_token_count=40, candidates_token_count=200)
+            return response
+        model.generate_content_async = with_usage
+        before = LLM_TOKENS.value(kind="output")
+
+        async def collect():
+            return [rows async for rows in llm_generator.generate_complex_chunk(5, ['description', 'score'], 'general', '')]
+        with mock.patch.object(llm_generator, 'model', model, create=True):
+            asyncio.run(collect())
+        self.assertEqual(LLM_TOKENS.value(kind="output"), before + 200)
+
+    def test_request_id_and_payload_level(self):
+        record = mock.Mock()
+        token = request_id_var.set("abc123")
+        try:
+            RequestIdFilter().filter(record)
+        finally:
+            request_id_var.reset(token)
+        self.assertEqual(record.request_id, "abc123")
+        with mock.patch.object(app_logger.Config, 'PAYLOAD_LOG_LEVEL', 'DEBUG'), \
+                mock.patch.object(app_logger.logger, 'log') as log:
+            app_logger.log_payload("Received prompt: %s", "secret")
+        log.assert_not_called()  # DEBUG is below the logger's effective level
+
+class TestStubProviders(unittest.TestCase):
+    def test_stub_model_answers_generator_prompts(self):
+        model = StubTextModel(latency=0, seed=3)
+        response = asyncio.run(model.generate_content_async(llm_generator.build_prompt(4, ['review', 'notes'], 'general', '')))
+        rows = llm_generator.IncrementalCSVParser(2).feed(response.text + "\n")
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[0][0].startswith('review '))
+        self.assertGreater(response.usage_metadata.candidates_token_count, 0)
+
+    def test_stub_model_pipeline_with_errors(self):
+        async def collect():
+            stream = hybrid_generate_synthetic_data_stream(600, ['name', 'review'], 'general', '', 'csv', seed=2)
+            return [batch async for batch in stream]
+        model = StubTextModel(latency=0, error_rate=0.3, seed=1)
+        with mock.patch.object(llm_generator, 'model', model), \
+                mock.patch.object(llm_generator.Config, 'LLM_RETRY_BACKOFF', 0), \
+                mock.patch.object(llm_generator.Config, 'LLM_MAX_RETRIES', 10), \
+                mock.patch.object(llm_generator.Config, 'VALUE_POOL_ENABLED', False):
+            rows = [row for batch in asyncio.run(collect()) for row in batch]
+        self.assertEqual(len(rows), 600)
+        self.assertTrue(all(row['review'].startswith('review ') for row in rows))
+
+    def test_stub_embedder_is_deterministic(self):
+        embedder = StubEmbedder(latency=0)
+        first = asyncio.run(embedder.embed('id, name - schema', 'RETRIEVAL_DOCUMENT'))
+        self.assertEqual(len(first), 768)
+        self.assertEqual(first, asyncio.run(embedder.embed('id, name - schema', 'RETRIEVAL_QUERY')))
+
+class TestWarmup(unittest.TestCase):
+    def test_builds_shared_providers(self):
+        app = mock.Mock()
+        warmup = Warmup()
+        with mock.patch.object(llm_generator.Config, 'MODEL_PROVIDER', 'stub'), \
+                mock.patch.object(llm_generator.Config, 'CPU_EXECUTOR', 'inline'), \
+                mock.patch.object(llm_generator, 'model', None), \
+                mock.patch.object(llm_generator, 'fake', None), \
+                mock.patch.object(embedding_service, '_embedder', None):
+            asyncio.run(warmup.run(app))
+            self.assertIsInstance(llm_generator.model, StubTextModel)  # Built once, reused by get_model()
+            self.assertIsInstance(embedding_service._embedder, StubEmbedder)
+            self.assertIsNotNone(llm_generator.fake)
+        self.assertTrue(warmup.ready)
+        self.assertEqual(set(warmup.report()['steps']), {'imports', 'providers', 'faker_pools'})
+
+async def chunk_source(chunks, delay=0.0):
+    for chunk in chunks:
+        await asyncio.sleep(delay)
+        yield chunk
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, cache, key, chunks, compress=True):
+        async def run():
+            return [chunk async for chunk in write_through(chunk_source(chunks), cache.writer(key, compress))]
+        return asyncio.run(run())
+
+    def test_round_trip_and_lru_eviction(self):
+        cache = ResponseCache(self.tmp.name, 2500)
+        body = [os.urandom(500) for _ in range(2)]
+        self.assertEqual(self.write(cache, 'a', body, compress=False), body)
+        self.write(cache, 'b', body, compress=False)
+        self.assertIsNotNone(asyncio.run(cache.get('a')))  # 'b' is now least recently used
+        tail = os.urandom(800)
+        self.write(cache, 'c', [tail], compress=True)
+        self.assertIsNone(asyncio.run(cache.get('b')))
+        path, encoding = asyncio.run(cache.get('a'))
+        self.assertEqual((encoding, open(path, 'rb').read()), ('identity', b''.join(body)))
+        path, encoding = asyncio.run(cache.get('c'))
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(open(path, 'rb').read()), tail)
+
+        async def decompressed():
+            return b''.join([chunk async for chunk in read_gzip(path)])
+        self.assertEqual(asyncio.run(decompressed()), tail)
+        # Entries survive a restart
+        self.assertEqual(ResponseCache(self.tmp.name, 2500).stats()['entries'], 2)
+
+    def test_incomplete_body_is_not_cached(self):
+        cache = ResponseCache(self.tmp.name, 10000)
+
+        async def failing():
+            yield b'partial'
+            raise RuntimeError('generation failed')
+
+        async def run():
+            async for _ in write_through(failing(), cache.writer('k', True)):
+                pass
+        with self.assertRaises(RuntimeError):
+            asyncio.run(run())
+        self.assertIsNone(asyncio.run(cache.get('k')))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_cache_io_runs_off_the_event_loop(self):
+        cache = ResponseCache(self.tmp.name, 10000)
+        main = threading.get_ident()
+        threads = []
+        real_open = open
+
+        def tracking_open(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return real_open(*args, **kwargs)
+        with mock.patch('builtins.open', tracking_open):
+            self.write(cache, 'k', [b'abc', b'def'])
+        self.assertTrue(threads and main not in threads)
+        self.assertIsNotNone(asyncio.run(cache.get('k')))
+
+    def test_response_key(self):
+        key = response_key(['id', 'name'], 10, 'csv', 1)
+        self.assertEqual(key, response_key(['id', 'name'], 10, 'csv', 1, [], {}))
+        self.assertNotEqual(key, response_key(['id', 'name'], 10, 'csv', 2))
+
+async def read_all(subscription):
+    return [chunk async for chunk in subscription]
+
+class TestResponseCoalescer(unittest.TestCase):
+    def test_subscribers_share_one_generation(self):
+        chunks = [b'a' * 10, b'b' * 10, b'c' * 10]
+        calls = []
+
+        def source():
+            calls.append(1)
+            return chunk_source(chunks, delay=0.01)
+
+        async def run():
+            coalescer = ResponseCoalescer(1000)
+            first = coalescer.start('k', source)
+            await asyncio.sleep(0.025)  # Late joiner still gets the whole body
+            second = coalescer.join('k')
+            async def read(subscription):
+                return [chunk async for chunk in subscription]
+            bodies = await asyncio.gather(read(first), read(second))
+            await asyncio.sleep(0)
+            return bodies, len(coalescer)
+        bodies, inflight = asyncio.run(run())
+        self.assertEqual(bodies, [chunks, chunks])
+        self.assertEqual((len(calls), inflight), (1, 0))
+
+    def test_replay_limit_and_cancellation(self):
+        async def run():
+            broadcast = Broadcast(chunk_source([b'x' * 10] * 100, delay=0.001), max_replay_bytes=25)
+            subscription = broadcast.subscribe()
+            received = [await subscription.__anext__() for _ in range(5)]
+            joinable, buffered = broadcast.joinable, broadcast.buffered
+            await subscription.aclose()  # Last subscriber leaving cancels the generation
+            await asyncio.sleep(0.01)
+            return received, joinable, buffered, broadcast.done
+        received, joinable, buffered, done = asyncio.run(run())
+        self.assertEqual(len(received), 5)
+        self.assertFalse(joinable)
+        self.assertLessEqual(buffered, 30)
+        self.assertTrue(done)
+
+    def test_producer_waits_for_slowest_subscriber(self):
+        async def run():
+            broadcast = Broadcast(chunk_source([b'x' * 10] * 100), max_replay_bytes=10000, window_bytes=30)
+            fast, slow = broadcast.subscribe(), broadcast.subscribe()
+            for _ in range(3):
+                await fast.__anext__()
+            await asyncio.sleep(0.01)  # The slow subscriber has read nothing yet
+            produced = broadcast.produced
+            bodies = await asyncio.gather(read_all(fast), read_all(slow))
+            return produced, [len(body) for body in bodies]
+        produced, lengths = asyncio.run(run())
+        self.assertLessEqual(produced, 40)  # A window ahead of the slow subscriber, not the whole source
+        self.assertEqual(lengths, [97, 100])
+
+    def test_lagging_subscriber_is_dropped(self):
+        async def run():
+            broadcast = Broadcast(chunk_source([b'x' * 10] * 20), max_replay_bytes=25, window_bytes=1000)
+            fast, slow = broadcast.subscribe(), broadcast.subscribe()
+            body = [chunk async for chunk in fast]
+            with self.assertRaises(ConnectionAbortedError):
+                await slow.__anext__()
+            return body, broadcast.positions
+        body, positions = asyncio.run(run())
+        self.assertEqual(len(body), 20)
+        self.assertEqual(positions, {})
+
+    def test_unread_subscription_is_released(self):
+        async def run():
+            coalescer = ResponseCoalescer(1000)
+            subscription = coalescer.start('k', lambda: chunk_source([b'x'] * 1000, delay=0.001))
+            broadcast = subscription.broadcast
+            del subscription  # e.g., the client left before the response started
+            gc.collect()
+            await asyncio.sleep(0.01)
+            return broadcast.positions, broadcast._task.done(), len(coalescer)
+        self.assertEqual(asyncio.run(run()), ({}, True, 0))
+
+    def test_encode_stream(self):
+        async def run():
+            return b''.join([chunk async for chunk in encode_stream(chunk_source([b'abc', b'def']), gzip_encoder())])
+        self.assertEqual(gzip.decompress(asyncio.run(run())), b'abcdef')
+
+class TestAdmission(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=100, capacity=1000)
+        with mock.patch('app.utils.limiter.time.time', return_value=1000.0):
+            self.assertEqual(bucket.acquire('a', 800), 0.0)
+            self.assertAlmostEqual(bucket.acquire('a', 300), 1.0)  # 200 left, 100 short at 100/s
+            self.assertEqual(bucket.acquire('b', 300), 0.0)  # Buckets are per key
+        with mock.patch('app.utils.limiter.time.time', return_value=1001.0):
+            self.assertEqual(bucket.acquire('a', 300), 0.0)
+
+    def test_sqlite_buckets_are_shared(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'admission.db')
+            first, second = SQLiteTokenBucket(path, 1, 1000), SQLiteTokenBucket(path, 1, 1000)
+            self.assertEqual(first.acquire('client', 600), 0.0)
+            self.assertGreater(second.acquire('client', 600), 0.0)
+            self.assertEqual(second.acquire('other', 600), 0.0)
+            first.close()
+            second.close()
+
+    def test_client_address_behind_trusted_proxy(self):
+        from starlette.requests import Request
+
+        def request(peer, forwarded=None):
+            headers = [(b'x-forwarded-for', forwarded.encode())] if forwarded else []
+            return Request({'type': 'http', 'client': (peer, 1234), 'headers': headers})
+        self.assertEqual(client_address(request('10.0.0.5', '203.0.113.9')), '10.0.0.5')  # No proxy trusted
+        with mock.patch.object(llm_generator.Config, 'TRUSTED_PROXIES', '10.0.0.0/8'):
+            self.assertEqual(client_address(request('10.0.0.5', '198.51.100.1, 203.0.113.9')), '203.0.113.9')
+            self.assertEqual(client_address(request('10.0.0.5', '203.0.113.9, 10.0.0.7')), '203.0.113.9')
+            self.assertEqual(client_address(request('192.0.2.1', '203.0.113.9')), '192.0.2.1')  # Untrusted peer
+        with mock.patch.object(llm_generator.Config, 'TRUSTED_PROXIES', '*'):
+            self.assertEqual(client_address(request('10.0.0.5', 'forged, 203.0.113.9')), '203.0.113.9')
+            self.assertEqual(client_address(request('10.0.0.5')), '10.0.0.5')
+
+    def test_estimate_counts_llm_columns_only(self):
+        with mock.patch.object(llm_generator.Config, 'LLM_TOKENS_PER_CELL', 10), \
+                mock.patch.object(llm_generator.chunk_controller, 'output_tokens_per_cell', None):
+            self.assertEqual(estimate_llm_tokens(100, ['name', 'email']), 0)
+            self.assertEqual(estimate_llm_tokens(100, ['name', 'product_review', 'support_notes']), 2000)
+
+    def test_budget_queues_in_order(self):
+        budget = LLMBudget(max_tokens=100, max_queued=50)
+        order = []
+
+        async def call(name, tokens, hold):
+            async with budget.reserve(tokens):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        async def run():
+            tasks = [asyncio.create_task(call('a', 80, 0.02))]
+            await asyncio.sleep(0)
+            tasks += [asyncio.create_task(call('b', 60, 0)), asyncio.create_task(call('c', 10, 0))]
+            await asyncio.sleep(0.005)
+            saturated = budget.saturated  # 70 tokens waiting > 50
+            await asyncio.gather(*tasks)
+            return saturated
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(order, ['a', 'b', 'c'])  # 'c' would fit next to 'a' but does not jump the queue
+        self.assertEqual((budget.in_flight, budget.queued), (0, 0))
+
+    def test_rate_limit_errors(self):
+        self.assertTrue(is_rate_limited(RuntimeError("429 quota (stub)")))
+        self.assertFalse(is_rate_limited(ValueError("bad csv")))
+
+class TestChunkController(unittest.TestCase):
+    def test_grows_on_full_calls_within_output_limit(self):
+        controller = ChunkController()
+        with mock.patch.object(llm_generator.Config, 'LLM_MAX_OUTPUT_TOKENS', 8000), \
+                mock.patch.object(llm_generator.Config, 'LLM_CHUNK_ROWS', 100):
+            rows = controller.rows_per_call(2)
+            self.assertEqual(rows, 100)
+            for _ in range(20):
+                # 10 output tokens per value: the cap is 8000 * 0.8 / 10 = 640 values, i.e. 320 rows
+                controller.observe(rows, rows, 2, 1.0, prompt_tokens=200, output_tokens=rows * 20)
+                rows = controller.rows_per_call(2)
+            self.assertEqual(rows, 320)
+            self.assertEqual(controller.rows_per_call(4), 160)  # Same values per call, more columns
+            self.assertAlmostEqual(controller.output_tokens_per_cell, 10.0)
+
+    def test_shrinks_on_truncated_calls(self):
+        controller = ChunkController()
+        with mock.patch.object(llm_generator.Config, 'LLM_CHUNK_ROWS', 400), \
+                mock.patch.object(llm_generator.Config, 'LLM_MIN_CHUNK_ROWS', 25):
+            controller.observe(400, 150, 1, 1.0)
+            self.assertEqual(controller.rows_per_call(1), 200)
+            for _ in range(10):
+                controller.observe(controller.rows_per_call(1), 0, 1, 1.0)
+            self.assertEqual(controller.rows_per_call(1), 25)
+
+    def test_short_refill_does_not_shrink(self):
+        controller = ChunkController()
+        with mock.patch.object(llm_generator.Config, 'LLM_CHUNK_ROWS', 400):
+            controller.observe(400, 400, 1, 1.0)
+            target = controller.rows_per_call(1)
+            controller.observe(30, 10, 1, 1.0)  # Refill of a few missing rows, answered short
+            self.assertEqual(controller.rows_per_call(1), target)
+            controller.observe(target, target // 3, 1, 1.0)  # A full-size call that comes back short does
+            self.assertEqual(controller.rows_per_call(1), target // 2)
+
+    def test_latency_cap(self):
+        controller = ChunkController()
+        with mock.patch.object(llm_generator.Config, 'LLM_TARGET_CALL_SECONDS', 5.0):
+            controller.observe(500, 500, 1, 20.0)  # 0.04s per value
+            self.assertEqual(controller.rows_per_call(1), 125)
+
+    def test_adaptive_chunks_follow_controller(self):
+        sizes = iter([300, 100, 500])
+        self.assertEqual(list(adaptive_chunks(1000, 600, lambda: next(sizes, 200))), [300, 100, 200, 200, 200])
+
+    def test_pipeline_adapts_to_short_responses(self):
+        controller = ChunkController()
+
+        async def collect():
+            stream = hybrid_generate_synthetic_data_stream(2000, ['description', 'score'], 'general', 'a\na\n\nb', 'csv')
+            return [row async for batch in stream for row in batch]
+        model = FakeModel(fill=0.5)
+        with mock.patch.object(llm_generator, 'model', model, create=True), \
+                mock.patch.object(llm_generator, 'chunk_controller', controller), \
+                mock.patch.object(llm_generator.Config, 'LLM_CHUNK_ROWS', 500), \
+                mock.patch.object(llm_generator.Config, 'VALUE_POOL_ENABLED', False):
+            rows = asyncio.run(collect())
+        self.assertEqual(len(rows), 2000)
+        self.assertLess(controller.rows_per_call(2), 500)
+
+    def test_compact_context(self):
+        self.assertEqual(compact_context("users db\n\nusers db\n orders \n" + "x" * 50, 20), "users db\norders")
+        self.assertEqual(compact_context("y" * 50, 10), "y" * 10)
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()